@@ -28,7 +28,8 @@ from app.models.inward import *
 from app.models.orders import *
 from app.models.pending_order import *
 from app.models.product import *
-from app.models.product_color_stock import *
+from app.models.product_size_stock import *
+from app.models.stock_snapshot import *
 from app.models.sales import *
 from app.models.user import *
 target_metadata = Base.metadata
@@ -0,0 +1,80 @@
+"""add product_size_stocks ledger, drop product_color_stocks
+
+Revision ID: 77ecca37a68f
+Revises: 022ad2ea7ab1
+Create Date: 2026-10-17 09:12:41.218305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '77ecca37a68f'
+down_revision: Union[str, None] = '022ad2ea7ab1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('product_size_stocks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('color', sa.String(), nullable=False),
+    sa.Column('colour_code', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('size', sa.String(), nullable=False),
+    sa.Column('qty', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('product_id', 'color', 'colour_code', 'size', name='uq_product_size_stock_variant')
+    )
+    op.create_index(op.f('ix_product_size_stocks_id'), 'product_size_stocks', ['id'], unique=False)
+    # Seed the ledger from the existing log history
+    if op.get_bind().dialect.name == 'postgresql':
+        expand, qty = 'json_each_text', 's.value::integer'
+    else:
+        expand, qty = 'json_each', 'CAST(s.value AS INTEGER)'
+    op.execute(f"""
+        INSERT INTO product_size_stocks (product_id, color, colour_code, size, qty)
+        SELECT product_id, color, colour_code, size, SUM(qty)
+        FROM (
+            SELECT l.product_id, l.color, COALESCE(l.colour_code, 0) AS colour_code, s.key AS size,
+                   CASE WHEN l.category = 'SUPPLY' THEN 1 ELSE -1 END * {qty} AS qty
+            FROM inward_logs l, {expand}(l.sizes) s
+            UNION ALL
+            SELECT l.product_id, l.color, COALESCE(l.colour_code, 0), s.key, -({qty})
+            FROM sales_logs l, {expand}(l.sizes) s
+        ) movements
+        GROUP BY product_id, color, colour_code, size
+    """)
+    # The ledger replaces the per-color totals, which nothing writes any more
+    op.drop_index(op.f('ix_product_color_stocks_id'), table_name='product_color_stocks')
+    op.drop_table('product_color_stocks')
+
+def downgrade() -> None:
+    op.create_table('product_color_stocks',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('color', sa.String(), nullable=False),
+    sa.Column('total_stock', sa.Integer(), nullable=False),
+    sa.Column('colour_code', sa.Integer(), nullable=True),
+    sa.Column('sizes', sa.JSON(), nullable=True),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_product_color_stocks_id'), 'product_color_stocks', ['id'], unique=False)
+    # Rebuild the per-color totals from the ledger
+    if op.get_bind().dialect.name == 'postgresql':
+        sizes = 'json_object_agg(size, qty)'
+    else:
+        sizes = 'json_group_object(size, qty)'
+    op.execute(f"""
+        INSERT INTO product_color_stocks (product_id, color, colour_code, total_stock, sizes)
+        SELECT product_id, color, colour_code, SUM(qty), {sizes}
+        FROM product_size_stocks
+        GROUP BY product_id, color, colour_code
+    """)
+    op.drop_index(op.f('ix_product_size_stocks_id'), table_name='product_size_stocks')
+    op.drop_table('product_size_stocks')
@@ -0,0 +1,82 @@
+"""add order_fulfilment and sales_logs.financial_year
+
+Revision ID: a9d2e5f7c341
+Revises: f3c8b6a0d215
+Create Date: 2026-10-17 16:21:37.402915
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9d2e5f7c341'
+down_revision: Union[str, None] = 'f3c8b6a0d215'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _financial_year_sql(dialect: str, column: str) -> str:
+    """SQL for the YYYY-YY financial year (starting in April) of a date column."""
+    if dialect == 'postgresql':
+        year = f"(EXTRACT(YEAR FROM {column})::integer - CASE WHEN EXTRACT(MONTH FROM {column}) < 4 THEN 1 ELSE 0 END)"
+        return f"CONCAT({year}, '-', LPAD((({year} + 1) % 100)::text, 2, '0'))"
+    year = f"(CAST(strftime('%Y', {column}) AS INTEGER) - (CAST(strftime('%m', {column}) AS INTEGER) < 4))"
+    return f"printf('%d-%02d', {year}, ({year} + 1) % 100)"
+
+
+def upgrade() -> None:
+    dialect = op.get_bind().dialect.name
+    op.add_column('sales_logs', sa.Column('financial_year', sa.String(), nullable=True))
+    op.create_table('order_fulfilment',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('financial_year', sa.String(), nullable=False),
+    sa.Column('order_number', sa.Integer(), nullable=False),
+    sa.Column('size', sa.String(), nullable=False),
+    sa.Column('ordered', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('delivered', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('product_id', 'financial_year', 'order_number', 'size', name='uq_order_fulfilment_order_size')
+    )
+    op.create_index(op.f('ix_order_fulfilment_id'), 'order_fulfilment', ['id'], unique=False)
+
+    # Order numbers restart every financial year: a sale delivers the latest order with its
+    # number dated on or before it, else the latest one, else one of its own financial year
+    same_order = (
+        "SELECT o.financial_year FROM orders o"
+        " WHERE o.product_id = sales_logs.product_id AND o.order_number = sales_logs.order_number"
+    )
+    op.execute(
+        "UPDATE sales_logs SET financial_year = COALESCE("
+        f"  ({same_order} AND o.date <= sales_logs.date ORDER BY o.date DESC, o.id DESC LIMIT 1),"
+        f"  ({same_order} ORDER BY o.date DESC, o.id DESC LIMIT 1),"
+        f"  {_financial_year_sql(dialect, 'sales_logs.date')}"
+        ") WHERE order_number IS NOT NULL"
+    )
+
+    # Backfill from existing orders and the sales logs that deliver them
+    if dialect == 'postgresql':
+        expand, qty = 'json_each_text', 'e.value::integer'
+    else:
+        expand, qty = 'json_each', 'CAST(e.value AS INTEGER)'
+    op.execute(
+        "INSERT INTO order_fulfilment (product_id, financial_year, order_number, size, ordered, delivered) "
+        "SELECT product_id, financial_year, order_number, size, SUM(ordered), SUM(delivered) FROM ("
+        f"  SELECT o.product_id, COALESCE(o.financial_year, {_financial_year_sql(dialect, 'o.date')}) AS financial_year,"
+        f"         o.order_number, e.key AS size, {qty} AS ordered, 0 AS delivered "
+        f"  FROM orders o, {expand}(o.sizes) e"
+        "  UNION ALL"
+        f"  SELECT s.product_id, s.financial_year, s.order_number, e.key AS size, 0 AS ordered, {qty} AS delivered "
+        f"  FROM sales_logs s, {expand}(s.sizes) e WHERE s.order_number IS NOT NULL"
+        ") entries GROUP BY product_id, financial_year, order_number, size"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_order_fulfilment_id'), table_name='order_fulfilment')
+    op.drop_table('order_fulfilment')
+    op.drop_column('sales_logs', 'financial_year')
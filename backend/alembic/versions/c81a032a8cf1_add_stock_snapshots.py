@@ -0,0 +1,41 @@
+"""add stock_snapshots
+
+Revision ID: c81a032a8cf1
+Revises: 77ecca37a68f
+Create Date: 2026-10-17 10:02:17.554190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c81a032a8cf1'
+down_revision: Union[str, None] = '77ecca37a68f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('stock_snapshots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('snapshot_date', sa.Date(), nullable=False),
+    sa.Column('color', sa.String(), nullable=False),
+    sa.Column('colour_code', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('size', sa.String(), nullable=False),
+    sa.Column('qty', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('product_id', 'snapshot_date', 'color', 'colour_code', 'size', name='uq_stock_snapshot_variant_day')
+    )
+    op.create_index(op.f('ix_stock_snapshots_id'), 'stock_snapshots', ['id'], unique=False)
+    op.create_index('ix_stock_snapshots_snapshot_date', 'stock_snapshots', ['snapshot_date'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stock_snapshots_snapshot_date', table_name='stock_snapshots')
+    op.drop_index(op.f('ix_stock_snapshots_id'), table_name='stock_snapshots')
+    op.drop_table('stock_snapshots')
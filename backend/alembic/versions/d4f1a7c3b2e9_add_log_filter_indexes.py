@@ -0,0 +1,52 @@
+"""add log filter indexes
+
+Revision ID: d4f1a7c3b2e9
+Revises: c81a032a8cf1
+Create Date: 2026-10-17 14:21:40.118302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f1a7c3b2e9'
+down_revision: Union[str, None] = 'c81a032a8cf1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, column) for the ilike('%name%') filters of the API
+TRIGRAM_INDEXES = [
+    ('ix_inward_logs_stakeholder_name_trgm', 'inward_logs', 'stakeholder_name'),
+    ('ix_sales_logs_store_name_trgm', 'sales_logs', 'store_name'),
+    ('ix_sales_logs_agency_name_trgm', 'sales_logs', 'agency_name'),
+]
+
+
+def upgrade() -> None:
+    op.create_index('ix_inward_logs_product_id_date', 'inward_logs', ['product_id', 'date'], unique=False)
+    op.create_index('ix_sales_logs_product_id_date', 'sales_logs', ['product_id', 'date'], unique=False)
+    op.create_index('ix_sales_logs_order_number_product_id', 'sales_logs', ['order_number', 'product_id'], unique=False)
+    op.create_index('ix_orders_product_id_date', 'orders', ['product_id', 'date'], unique=False)
+    op.create_index('ix_pending_orders_product_id_date', 'pending_orders', ['product_id', 'date'], unique=False)
+    # Trigram indexes only exist on PostgreSQL; creating the extension needs a role allowed to do so
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for name, table, column in TRIGRAM_INDEXES:
+            op.create_index(
+                name, table, [column], unique=False,
+                postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'},
+            )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        for name, table, _ in reversed(TRIGRAM_INDEXES):
+            op.drop_index(name, table_name=table)
+    op.drop_index('ix_pending_orders_product_id_date', table_name='pending_orders')
+    op.drop_index('ix_orders_product_id_date', table_name='orders')
+    op.drop_index('ix_sales_logs_order_number_product_id', table_name='sales_logs')
+    op.drop_index('ix_sales_logs_product_id_date', table_name='sales_logs')
+    op.drop_index('ix_inward_logs_product_id_date', table_name='inward_logs')
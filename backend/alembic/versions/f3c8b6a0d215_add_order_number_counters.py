@@ -0,0 +1,36 @@
+"""add order_number_counters
+
+Revision ID: f3c8b6a0d215
+Revises: e7a9c2d41f08
+Create Date: 2026-10-17 15:08:52.640117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c8b6a0d215'
+down_revision: Union[str, None] = 'e7a9c2d41f08'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('order_number_counters',
+    sa.Column('financial_year', sa.String(), nullable=False),
+    sa.Column('next_value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('financial_year')
+    )
+    # Continue every financial year after its highest existing order number
+    op.execute(
+        "INSERT INTO order_number_counters (financial_year, next_value) "
+        "SELECT financial_year, MAX(order_number) + 1 FROM orders "
+        "WHERE financial_year IS NOT NULL GROUP BY financial_year"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('order_number_counters')
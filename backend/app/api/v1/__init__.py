@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from . import auth, users, products, inward, sales, orders, stock, audit_logs, customers, agencies
+from . import auth, users, products, inward, sales, orders, stock, audit_logs, customers, agencies, jobs
 from .pending_orders import router as pending_orders_router
 
 api_router = APIRouter()
@@ -16,3 +16,4 @@ api_router.include_router(audit_logs.router, prefix="/audit-logs", tags=["audit-
 api_router.include_router(customers.router, prefix="/customers", tags=["customers"])
 api_router.include_router(agencies.router, prefix="/agencies", tags=["agencies"])
 api_router.include_router(pending_orders_router, prefix="", tags=["pending-orders"])
+api_router.include_router(jobs.router, prefix="/jobs", tags=["jobs"])
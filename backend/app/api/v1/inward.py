@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request, Header
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import date
 from ...database import get_db
 from ...core.crud import inward as inward_crud
-from ...schemas.inward import InwardLogCreate, InwardLogUpdate, InwardLog
+from ...schemas.inward import InwardLogCreate, InwardLogUpdate, InwardLog, InwardLogPage
+from ...utils.pagination import encode_date_id_cursor, decode_date_id_cursor
+from ...utils.streaming import wants_ndjson, ndjson_response
+from ...utils.responses import ORJSONResponse
 from ...core.crud.audit_log import create_audit_log
 from ...schemas.audit_log import AuditLogCreate
 from ...api.deps import get_current_user
 from ...schemas.user import User
 from ...core.logging_context import current_user_var
+from ...core.unit_of_work import transactional
+from ...config import settings
+from ...core.services.idempotency import idempotent
 from fastapi.responses import StreamingResponse
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
@@ -19,15 +25,57 @@ from pydantic import BaseModel
 
 router = APIRouter()
 
+async def _get_inward_logs_page(db: AsyncSession, product_id: Optional[int], limit: Optional[int], cursor: Optional[str], **filters) -> InwardLogPage:
+    after = None
+    if cursor:
+        try:
+            after = decode_date_id_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    logs, has_more = await inward_crud.get_inward_logs_page(db, product_id, limit or 100, after=after, **filters)
+    next_cursor = encode_date_id_cursor(logs[-1].date, logs[-1].id) if has_more else None
+    return InwardLogPage(items=logs, next_cursor=next_cursor, has_more=has_more)
+
+async def _get_inward_log_rows(db: AsyncSession, product_id: Optional[int], **filters) -> ORJSONResponse:
+    """
+    Unpaginated listing, kept as a bare list for existing clients but capped at
+    LOG_LISTING_MAX_ROWS rows. When more logs match, the first LOG_LISTING_MAX_ROWS are
+    returned with an X-Next-Cursor header to continue from with cursor (or stream NDJSON).
+    """
+    max_rows = settings.LOG_LISTING_MAX_ROWS
+    rows = await inward_crud.get_inward_log_rows(db, product_id, max_rows=max_rows + 1, **filters)
+    if len(rows) <= max_rows:
+        return ORJSONResponse(rows)
+    rows = rows[:max_rows]
+    return ORJSONResponse(rows, headers={"X-Next-Cursor": encode_date_id_cursor(rows[-1]["date"], rows[-1]["id"])})
+
+@router.get("/", response_model=Union[List[InwardLog], InwardLogPage])
+async def get_all_inward_logs(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; returns a paginated envelope. Without limit/cursor a bare list of at most LOG_LISTING_MAX_ROWS logs is returned, with an X-Next-Cursor header when more exist"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, or the X-Next-Cursor header of the bare list"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Inward logs of every product; send Accept: application/x-ndjson to stream them row by row"""
+    if wants_ndjson(request):
+        return ndjson_response(inward_crud.stream_inward_logs(db))
+    if limit is not None or cursor is not None:
+        return await _get_inward_logs_page(db, None, limit, cursor)
+    return await _get_inward_log_rows(db, None)
+
 # Legacy routes for frontend compatibility
-@router.get("/{product_id}", response_model=List[InwardLog])
+@router.get("/{product_id}", response_model=Union[List[InwardLog], InwardLogPage])
 async def get_inward_logs_legacy(
+    request: Request,
     product_id: int,
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     stakeholder: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
     stakeholder_name: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; returns a paginated envelope. Without limit/cursor a bare list of at most LOG_LISTING_MAX_ROWS logs is returned, with an X-Next-Cursor header when more exist"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, or the X-Next-Cursor header of the bare list"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -36,9 +84,14 @@ async def get_inward_logs_legacy(
     if date and stakeholder_name:
         return await inward_crud.get_last_inward_log_by_date_and_stakeholder(db, product_id=product_id, date=date, stakeholder_name=stakeholder_name)
     
-    return await inward_crud.get_inward_logs_by_product(db, product_id=product_id, start_date=start_date, end_date=end_date, stakeholder=stakeholder)
+    if wants_ndjson(request):
+        return ndjson_response(inward_crud.stream_inward_logs(db, product_id, start_date=start_date, end_date=end_date, stakeholder=stakeholder))
+    if limit is not None or cursor is not None:
+        return await _get_inward_logs_page(db, product_id, limit, cursor, start_date=start_date, end_date=end_date, stakeholder=stakeholder)
+    return await _get_inward_log_rows(db, product_id, start_date=start_date, end_date=end_date, stakeholder=stakeholder)
 
 @router.post("/", response_model=InwardLog)
+@transactional
 async def create_inward_log_legacy(
     inward_log: InwardLogCreate, 
     db: AsyncSession = Depends(get_db),
@@ -67,8 +120,11 @@ async def create_inward_log_legacy(
     return db_log
 
 @router.post("/bulk-create", response_model=List[InwardLog])
+@transactional
+@idempotent("inward_logs")
 async def create_inward_logs_bulk_legacy(
     inward_logs: List[InwardLogCreate], 
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="Retries with the same key return the first response"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -95,6 +151,7 @@ async def create_inward_logs_bulk_legacy(
     return result
 
 @router.delete("/bulk-delete")
+@transactional
 async def delete_inward_logs_bulk_legacy(
     product_id: int,
     date: Optional[str] = Query(None),
@@ -125,6 +182,7 @@ async def delete_inward_logs_bulk_legacy(
     return {"message": f"Deleted {deleted_count} inward log entries"}
 
 @router.put("/{log_id}", response_model=InwardLog)
+@transactional
 async def update_inward_log_legacy(
     log_id: int, 
     inward_log: InwardLogUpdate, 
@@ -159,6 +217,7 @@ async def update_inward_log_legacy(
     return db_log
 
 @router.delete("/{log_id}", response_model=InwardLog)
+@transactional
 async def delete_inward_log_legacy(
     log_id: int, 
     db: AsyncSession = Depends(get_db),
@@ -191,6 +250,7 @@ async def delete_inward_log_legacy(
 
 # New structured routes
 @router.post("/{product_id}/inward", response_model=InwardLog)
+@transactional
 async def create_inward_log(
     product_id: int,
     inward_log: InwardLogCreate,
@@ -222,26 +282,27 @@ async def create_inward_log(
     
     return db_inward_log
 
-@router.get("/{product_id}/inward", response_model=List[InwardLog])
+@router.get("/{product_id}/inward", response_model=Union[List[InwardLog], InwardLogPage])
 async def get_inward_logs(
+    request: Request,
     product_id: int,
     start_date: Optional[str] = Query(None, description="Start date for filtering (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date for filtering (YYYY-MM-DD)"),
     stakeholder_name: Optional[str] = Query(None, description="Filter by stakeholder name"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; returns a paginated envelope. Without limit/cursor a bare list of at most LOG_LISTING_MAX_ROWS logs is returned, with an X-Next-Cursor header when more exist"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, or the X-Next-Cursor header of the bare list"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get all inward logs for a product with optional filtering"""
-    inward_logs = await inward_crud.get_inward_logs_by_product(
-        db, 
-        product_id, 
-        start_date=start_date,
-        end_date=end_date,
-        stakeholder=stakeholder_name
-    )
-    return inward_logs
+    if wants_ndjson(request):
+        return ndjson_response(inward_crud.stream_inward_logs(db, product_id, start_date=start_date, end_date=end_date, stakeholder=stakeholder_name))
+    if limit is not None or cursor is not None:
+        return await _get_inward_logs_page(db, product_id, limit, cursor, start_date=start_date, end_date=end_date, stakeholder=stakeholder_name)
+    return await _get_inward_log_rows(db, product_id, start_date=start_date, end_date=end_date, stakeholder=stakeholder_name)
 
 @router.put("/{product_id}/inward/{inward_log_id}", response_model=InwardLog)
+@transactional
 async def update_inward_log(
     product_id: int,
     inward_log_id: int,
@@ -273,7 +334,39 @@ async def update_inward_log(
     
     return updated_inward_log
 
+@router.delete("/{product_id}/inward/bulk")
+@transactional
+async def delete_inward_logs_bulk(
+    product_id: int,
+    date: Optional[str] = Query(None, description="Date for filtering (YYYY-MM-DD)"),
+    stakeholder_name: Optional[str] = Query(None, description="Filter by stakeholder name"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Delete multiple inward logs in bulk"""
+    # Set user context for audit logging
+    current_user_var.set(current_user)
+    
+    deleted_count = await inward_crud.delete_inward_logs_bulk(db, product_id, date, stakeholder_name)
+    
+    # Log the audit event
+    await create_audit_log(
+        db,
+        AuditLogCreate(
+            user_id=current_user.id,
+            username=current_user.email,
+            action="BULK_DELETE",
+            entity="InwardLog",
+            entity_id=product_id,
+            field_changed="bulk_inward_logs",
+            old_value=f"Deleted {deleted_count} inward logs for date {date}"
+        )
+    )
+    
+    return {"message": f"Deleted {deleted_count} inward logs", "deleted_count": deleted_count}
+
 @router.delete("/{product_id}/inward/{inward_log_id}")
+@transactional
 async def delete_inward_log(
     product_id: int,
     inward_log_id: int,
@@ -305,6 +398,7 @@ async def delete_inward_log(
     return {"message": "Inward log deleted successfully"}
 
 @router.post("/{product_id}/inward/bulk", response_model=List[InwardLog])
+@transactional
 async def create_inward_logs_bulk(
     product_id: int,
     inward_logs: List[InwardLogCreate],
@@ -333,36 +427,6 @@ async def create_inward_logs_bulk(
     
     return result
 
-@router.delete("/{product_id}/inward/bulk")
-async def delete_inward_logs_bulk(
-    product_id: int,
-    date: Optional[str] = Query(None, description="Date for filtering (YYYY-MM-DD)"),
-    stakeholder_name: Optional[str] = Query(None, description="Filter by stakeholder name"),
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
-    """Delete multiple inward logs in bulk"""
-    # Set user context for audit logging
-    current_user_var.set(current_user)
-    
-    deleted_count = await inward_crud.delete_inward_logs_bulk(db, product_id, date, stakeholder_name)
-    
-    # Log the audit event
-    await create_audit_log(
-        db,
-        AuditLogCreate(
-            user_id=current_user.id,
-            username=current_user.email,
-            action="BULK_DELETE",
-            entity="InwardLog",
-            entity_id=product_id,
-            field_changed="bulk_inward_logs",
-            old_value=f"Deleted {deleted_count} inward logs for date {date}"
-        )
-    )
-    
-    return {"message": f"Deleted {deleted_count} inward logs", "deleted_count": deleted_count}
-
 class InwardExportHeaders(BaseModel):
     party_name: str = ""
     destination: str = ""
@@ -371,6 +435,7 @@ class InwardExportHeaders(BaseModel):
     date: str = ""
 
 @router.post("/export-excel")
+@transactional
 async def export_inward_excel(
     headers: InwardExportHeaders = Body(...),
     db: AsyncSession = Depends(get_db),
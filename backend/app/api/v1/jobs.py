@@ -0,0 +1,28 @@
+from fastapi import APIRouter, Depends, HTTPException
+from ...api.deps import get_current_user
+from ...schemas.user import User
+from ...schemas.jobs import BulkImportJobCreate, BulkImportJobStatus
+from ...core.services.bulk_import import bulk_import_jobs
+
+router = APIRouter()
+
+@router.post("/bulk-import", response_model=BulkImportJobStatus, status_code=202)
+async def create_bulk_import_job(
+    job: BulkImportJobCreate,
+    current_user: User = Depends(get_current_user)
+):
+    """Queue inward, sales or order rows for import in the background; poll GET /jobs/{id} for progress"""
+    if not job.rows:
+        raise HTTPException(status_code=400, detail="No rows to import")
+    return bulk_import_jobs.submit(job.kind, job.rows, current_user, batch_size=job.batch_size).to_status()
+
+@router.get("/{job_id}", response_model=BulkImportJobStatus)
+async def get_bulk_import_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    """Progress of a bulk import job: rows done, rows failed, errors and throughput"""
+    job = bulk_import_jobs.get(job_id)
+    if job is None or (job.user_id != current_user.id and current_user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_status()
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request, Header
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import date
@@ -10,6 +10,9 @@ from ...schemas.audit_log import AuditLogCreate
 from ...api.deps import get_current_user
 from ...schemas.user import User
 from ...core.logging_context import current_user_var
+from ...core.unit_of_work import transactional
+from ...core.services.idempotency import idempotent
+from ...utils.streaming import wants_ndjson, ndjson_response
 import json
 from fastapi.responses import StreamingResponse
 import io
@@ -22,9 +25,7 @@ from ...schemas.pending_order import PendingOrderCreate, PendingOrderUpdate
 from ...core.crud import pending_order as pending_order_crud
 from sqlalchemy import select
 from app.models.pending_order import PendingOrder
-from app.models.sales import SalesLog
 import logging
-from ...core.crud.orders import is_fully_delivered
 
 router = APIRouter()
 logger = logging.getLogger("orders-mirroring")
@@ -37,6 +38,7 @@ class OrderExportHeaders(BaseModel):
     date: str = ""
 
 @router.post("/orders/export-excel")
+@transactional
 async def export_orders_excel(
     headers: OrderExportHeaders = Body(...),
     db: AsyncSession = Depends(get_db),
@@ -176,6 +178,7 @@ async def export_orders_excel(
     )
 
 @router.post("/products/{product_id}/orders", response_model=OrderResponse)
+@transactional
 async def create_order(
     product_id: int,
     order: OrderCreate,
@@ -234,24 +237,22 @@ async def get_orders(
         agency_name=agency_name,
         store_name=store_name
     )
-    # Add fully_delivered to each order
-    result = []
-    for order in orders:
-        order_dict = order.__dict__.copy()
-        order_dict['fully_delivered'] = await is_fully_delivered(db, order)
-        result.append(OrderResponse(**order_dict))
-    return result
+    # Add delivery status to each order
+    return await orders_crud.build_order_responses(db, orders)
 
 @router.get("/orders/", response_model=List[OrderResponse])
 async def get_all_orders(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Get all orders"""
+    """Get all orders; send Accept: application/x-ndjson to stream every order instead of one skip/limit page"""
+    if wants_ndjson(request):
+        return ndjson_response(orders_crud.stream_all_orders(db))
     orders = await orders_crud.get_all_orders(db, skip=skip, limit=limit)
-    return orders
+    return await orders_crud.build_order_responses(db, orders)
 
 @router.get("/orders/{order_id}", response_model=OrderResponse)
 async def get_order(
@@ -263,9 +264,10 @@ async def get_order(
     order = await orders_crud.get_order(db, order_id)
     if order is None:
         raise HTTPException(status_code=404, detail="Order not found")
-    return order
+    return (await orders_crud.build_order_responses(db, [order]))[0]
 
 @router.put("/orders/{order_id}", response_model=OrderResponse)
+@transactional
 async def update_order(
     order_id: int,
     order: OrderUpdate,
@@ -282,12 +284,8 @@ async def update_order(
         raise HTTPException(status_code=404, detail="Order not found")
 
     # Sum delivered quantities from SalesLog for this order_number and product_id
-    delivered_logs = await db.execute(select(SalesLog).filter(SalesLog.order_number == orig_order.order_number, SalesLog.product_id == orig_order.product_id))
-    delivered_logs = delivered_logs.scalars().all()
-    delivered_total = {}
-    for log in delivered_logs:
-        for size, qty in (log.sizes or {}).items():
-            delivered_total[size] = delivered_total.get(size, 0) + qty
+    delivered_totals = await orders_crud.get_delivered_totals(db, [orig_order])
+    delivered_total = delivered_totals.get((orig_order.order_number, orig_order.financial_year, orig_order.product_id), {})
     # Calculate updated order total per size
     updated_sizes = order.sizes or {}
     # Check if fully delivered
@@ -303,7 +301,11 @@ async def update_order(
     if updated_order is None:
         raise HTTPException(status_code=404, detail="Order not found after update")
     # Mirror update to pending_orders (adjust pending quantities)
-    result = await db.execute(select(PendingOrder).filter(PendingOrder.order_number == updated_order.order_number, PendingOrder.product_id == updated_order.product_id))
+    result = await db.execute(select(PendingOrder).filter(
+        PendingOrder.order_number == updated_order.order_number,
+        PendingOrder.financial_year == updated_order.financial_year,
+        PendingOrder.product_id == updated_order.product_id,
+    ))
     db_pending_order = result.scalar_one_or_none()
     if db_pending_order:
         # Enforce: order.sizes[size] == pending_order.sizes[size] + delivered_total[size]
@@ -346,12 +348,11 @@ async def update_order(
             new_value=str(order_id)
         )
     )
-    # After updating, add fully_delivered to response
-    updated_order_dict = updated_order.__dict__.copy()
-    updated_order_dict['fully_delivered'] = await is_fully_delivered(db, updated_order)
-    return OrderResponse(**updated_order_dict)
+    # After updating, add delivery status to response
+    return (await orders_crud.build_order_responses(db, [updated_order]))[0]
 
 @router.delete("/orders/{order_id}")
+@transactional
 async def delete_order(
     order_id: int,
     db: AsyncSession = Depends(get_db),
@@ -394,9 +395,12 @@ async def delete_order(
     return {"message": "Order deleted successfully"}
 
 @router.post("/products/{product_id}/orders/bulk", response_model=OrderBulkResponse)
+@transactional
+@idempotent("bulk_data")
 async def create_orders_bulk(
     product_id: int,
     bulk_data: OrderBulkCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="Retries with the same key return the first response"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -406,18 +410,7 @@ async def create_orders_bulk(
     
     result_orders = await orders_crud.create_orders_bulk(db, bulk_data.orders)
     # Mirror to pending_orders for each created order, using the actual created order fields
-    for db_order in result_orders:
-        pending_order = PendingOrderCreate(
-            product_id=db_order.product_id,
-            color=db_order.color,
-            colour_code=db_order.colour_code,
-            sizes=db_order.sizes,
-            date=db_order.date,
-            agency_name=db_order.agency_name,
-            store_name=db_order.store_name,
-            operation=db_order.operation or "Order"
-        )
-        await pending_order_crud.create_pending_order(db, pending_order, db_order.order_number, db_order.financial_year)
+    await pending_order_crud.create_pending_orders_for(db, result_orders)
     # Log the audit event
     await create_audit_log(
         db,
@@ -432,9 +425,14 @@ async def create_orders_bulk(
         )
     )
     
-    return OrderBulkResponse(rows_processed=len(result_orders), errors=None)
+    return OrderBulkResponse(
+        rows_processed=len(result_orders),
+        errors=None,
+        order_numbers=[order.order_number for order in result_orders],
+    )
 
 @router.delete("/products/{product_id}/orders/bulk")
+@transactional
 async def delete_orders_bulk(
     product_id: int,
     date: date,
@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from datetime import date
 from ...database import get_db
 from ...core.crud import pending_order as pending_order_crud
-from ...schemas.pending_order import PendingOrderCreate, PendingOrderUpdate, PendingOrderResponse
+from ...schemas.pending_order import PendingOrderCreate, PendingOrderUpdate, PendingOrderResponse, PendingOrderAllocationRequest, PendingOrderAllocationResult
+from ...core.crud.product import get_product
+from ...core.services import order_allocation
 from ...api.deps import get_current_user
 from ...schemas.user import User
 from ...core.logging_context import current_user_var
+from ...core.unit_of_work import transactional
+from ...utils.streaming import wants_ndjson, ndjson_response
 from ...schemas.sales import SalesLogCreate
 from ...core.crud import sales as sales_crud
 from fastapi.responses import StreamingResponse
@@ -21,17 +25,35 @@ from ...schemas.audit_log import AuditLogCreate
 
 router = APIRouter()
 
+@router.get("/pending-orders", response_model=List[PendingOrderResponse])
+async def get_all_pending_orders(
+    request: Request,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Pending orders of every product, one skip/limit page; send Accept: application/x-ndjson to stream all of them row by row"""
+    if wants_ndjson(request):
+        return ndjson_response(pending_order_crud.stream_pending_orders(db))
+    return await pending_order_crud.get_all_pending_orders(db, skip=skip, limit=limit)
+
 @router.get("/products/{product_id}/pending-orders", response_model=List[PendingOrderResponse])
 async def get_pending_orders(
+    request: Request,
     product_id: int,
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
+    # The NDJSON stream carries every pending order of the product; skip/limit only page the JSON list
+    if wants_ndjson(request):
+        return ndjson_response(pending_order_crud.stream_pending_orders(db, product_id))
     return await pending_order_crud.get_pending_orders(db, product_id, skip=skip, limit=limit)
 
 @router.post("/pending-orders/{pending_order_id}/deliver")
+@transactional
 async def deliver_pending_order(
     pending_order_id: int,
     delivered_sizes: dict = Body(...),
@@ -49,6 +71,40 @@ async def deliver_pending_order(
     result = await pending_order_crud.deliver_pending_order(db, pending_order, delivered_sizes, delivery_date)
     return result
 
+@router.post("/products/{product_id}/pending-orders/allocate", response_model=PendingOrderAllocationResult)
+@transactional
+async def allocate_pending_orders(
+    product_id: int,
+    allocation: PendingOrderAllocationRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Allocate the product's current stock to its pending orders, oldest first (fifo) or shortest
+    payment terms first (days_of_payment). Without commit the deliveries are only proposed;
+    with commit they are written as sales logs and the pending orders are reduced or removed.
+    """
+    current_user_var.set(current_user)
+    if not await get_product(db, product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+    result = await order_allocation.allocate_pending_orders(
+        db, product_id, allocation.delivery_date, strategy=allocation.strategy, commit=allocation.commit
+    )
+    if result.committed:
+        await audit_log_crud.create_audit_log(
+            db,
+            AuditLogCreate(
+                user_id=current_user.id,
+                username=current_user.email,
+                action="ALLOCATE_PENDING_ORDERS",
+                entity="PendingOrder",
+                entity_id=product_id,
+                field_changed="allocation",
+                new_value=f"Delivered {result.units_allocated} units to {len(result.allocations)} pending orders ({result.strategy})"
+            )
+        )
+    return result
+
 class PendingOrdersExportHeaders(BaseModel):
     party_name: str = ""
     destination: str = ""
@@ -57,6 +113,7 @@ class PendingOrdersExportHeaders(BaseModel):
     date: str = ""
 
 @router.post("/export-excel")
+@transactional
 async def export_pending_orders_excel(
     headers: PendingOrdersExportHeaders = Body(...),
     db: AsyncSession = Depends(get_db),
@@ -1,15 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body
+from fastapi import APIRouter, Depends, HTTPException, Query, Body, Request, Header
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import List, Optional, Union
 from datetime import date
 from ...database import get_db
 from ...core.crud import sales as sales_crud
-from ...schemas.sales import SalesLogCreate, SalesLogUpdate, SalesLog
+from ...schemas.sales import SalesLogCreate, SalesLogUpdate, SalesLog, SalesLogPage
+from ...utils.pagination import encode_date_id_cursor, decode_date_id_cursor
+from ...utils.streaming import wants_ndjson, ndjson_response
+from ...utils.responses import ORJSONResponse
 from ...core.crud.audit_log import create_audit_log
 from ...schemas.audit_log import AuditLogCreate
 from ...api.deps import get_current_user
 from ...schemas.user import User
 from ...core.logging_context import current_user_var
+from ...core.unit_of_work import transactional
+from ...config import settings
+from ...core.services.idempotency import idempotent
 from fastapi.responses import StreamingResponse
 from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
@@ -21,15 +27,57 @@ from pydantic import BaseModel
 
 router = APIRouter()
 
+async def _get_sales_logs_page(db: AsyncSession, product_id: Optional[int], limit: Optional[int], cursor: Optional[str], **filters) -> SalesLogPage:
+    after = None
+    if cursor:
+        try:
+            after = decode_date_id_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    logs, has_more = await sales_crud.get_sales_logs_page(db, product_id, limit or 100, after=after, **filters)
+    next_cursor = encode_date_id_cursor(logs[-1].date, logs[-1].id) if has_more else None
+    return SalesLogPage(items=logs, next_cursor=next_cursor, has_more=has_more)
+
+async def _get_sales_log_rows(db: AsyncSession, product_id: Optional[int], **filters) -> ORJSONResponse:
+    """
+    Unpaginated listing, kept as a bare list for existing clients but capped at
+    LOG_LISTING_MAX_ROWS rows. When more logs match, the first LOG_LISTING_MAX_ROWS are
+    returned with an X-Next-Cursor header to continue from with cursor (or stream NDJSON).
+    """
+    max_rows = settings.LOG_LISTING_MAX_ROWS
+    rows = await sales_crud.get_sales_log_rows(db, product_id, max_rows=max_rows + 1, **filters)
+    if len(rows) <= max_rows:
+        return ORJSONResponse(rows)
+    rows = rows[:max_rows]
+    return ORJSONResponse(rows, headers={"X-Next-Cursor": encode_date_id_cursor(rows[-1]["date"], rows[-1]["id"])})
+
+@router.get("/", response_model=Union[List[SalesLog], SalesLogPage])
+async def get_all_sales_logs(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; returns a paginated envelope. Without limit/cursor a bare list of at most LOG_LISTING_MAX_ROWS logs is returned, with an X-Next-Cursor header when more exist"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, or the X-Next-Cursor header of the bare list"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Sales logs of every product; send Accept: application/x-ndjson to stream them row by row"""
+    if wants_ndjson(request):
+        return ndjson_response(sales_crud.stream_sales_logs(db))
+    if limit is not None or cursor is not None:
+        return await _get_sales_logs_page(db, None, limit, cursor)
+    return await _get_sales_log_rows(db, None)
+
 # Legacy routes for frontend compatibility
-@router.get("/{product_id}", response_model=List[SalesLog])
+@router.get("/{product_id}", response_model=Union[List[SalesLog], SalesLogPage])
 async def get_sales_logs_legacy(
+    request: Request,
     product_id: int,
     start_date: Optional[str] = Query(None),
     end_date: Optional[str] = Query(None),
     agency_name: Optional[str] = Query(None),
     store_name: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; returns a paginated envelope. Without limit/cursor a bare list of at most LOG_LISTING_MAX_ROWS logs is returned, with an X-Next-Cursor header when more exist"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, or the X-Next-Cursor header of the bare list"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -38,9 +86,14 @@ async def get_sales_logs_legacy(
     if date and store_name:
         return await sales_crud.get_last_sales_log_by_date_and_store(db, product_id=product_id, date=date, store_name=store_name)
     
-    return await sales_crud.get_sales_logs_by_product(db, product_id=product_id, start_date=start_date, end_date=end_date, agency_name=agency_name, store_name=store_name)
+    if wants_ndjson(request):
+        return ndjson_response(sales_crud.stream_sales_logs(db, product_id, start_date=start_date, end_date=end_date, agency_name=agency_name, store_name=store_name))
+    if limit is not None or cursor is not None:
+        return await _get_sales_logs_page(db, product_id, limit, cursor, start_date=start_date, end_date=end_date, agency_name=agency_name, store_name=store_name)
+    return await _get_sales_log_rows(db, product_id, start_date=start_date, end_date=end_date, agency_name=agency_name, store_name=store_name)
 
 @router.post("/", response_model=SalesLog)
+@transactional
 async def create_sales_log_legacy(
     sales_log: SalesLogCreate, 
     db: AsyncSession = Depends(get_db),
@@ -69,8 +122,11 @@ async def create_sales_log_legacy(
     return db_log
 
 @router.post("/bulk-create", response_model=List[SalesLog])
+@transactional
+@idempotent("sales_logs")
 async def create_sales_logs_bulk_legacy(
     sales_logs: List[SalesLogCreate], 
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", description="Retries with the same key return the first response"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
@@ -97,6 +153,7 @@ async def create_sales_logs_bulk_legacy(
     return result
 
 @router.delete("/bulk-delete")
+@transactional
 async def delete_sales_logs_bulk_legacy(
     product_id: int,
     date: Optional[str] = Query(None),
@@ -127,6 +184,7 @@ async def delete_sales_logs_bulk_legacy(
     return {"message": f"Deleted {deleted_count} sales log entries"}
 
 @router.put("/{log_id}", response_model=SalesLog)
+@transactional
 async def update_sales_log_legacy(
     log_id: int, 
     sales_log: SalesLogUpdate, 
@@ -161,6 +219,7 @@ async def update_sales_log_legacy(
     return db_log
 
 @router.delete("/{log_id}", response_model=SalesLog)
+@transactional
 async def delete_sales_log_legacy(
     log_id: int, 
     db: AsyncSession = Depends(get_db),
@@ -193,6 +252,7 @@ async def delete_sales_log_legacy(
 
 # New structured routes
 @router.post("/{product_id}/sales", response_model=SalesLog)
+@transactional
 async def create_sales_log(
     product_id: int,
     sales_log: SalesLogCreate,
@@ -224,26 +284,27 @@ async def create_sales_log(
     
     return db_sales_log
 
-@router.get("/{product_id}/sales", response_model=List[SalesLog])
+@router.get("/{product_id}/sales", response_model=Union[List[SalesLog], SalesLogPage])
 async def get_sales_logs(
+    request: Request,
     product_id: int,
     start_date: Optional[str] = Query(None, description="Start date for filtering (YYYY-MM-DD)"),
     end_date: Optional[str] = Query(None, description="End date for filtering (YYYY-MM-DD)"),
     store_name: Optional[str] = Query(None, description="Filter by store name"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size; returns a paginated envelope. Without limit/cursor a bare list of at most LOG_LISTING_MAX_ROWS logs is returned, with an X-Next-Cursor header when more exist"),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, or the X-Next-Cursor header of the bare list"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Get all sales logs for a product with optional filtering"""
-    sales_logs = await sales_crud.get_sales_logs_by_product(
-        db, 
-        product_id, 
-        start_date=start_date,
-        end_date=end_date,
-        store_name=store_name
-    )
-    return sales_logs
+    if wants_ndjson(request):
+        return ndjson_response(sales_crud.stream_sales_logs(db, product_id, start_date=start_date, end_date=end_date, store_name=store_name))
+    if limit is not None or cursor is not None:
+        return await _get_sales_logs_page(db, product_id, limit, cursor, start_date=start_date, end_date=end_date, store_name=store_name)
+    return await _get_sales_log_rows(db, product_id, start_date=start_date, end_date=end_date, store_name=store_name)
 
 @router.put("/{product_id}/sales/{sales_log_id}", response_model=SalesLog)
+@transactional
 async def update_sales_log(
     product_id: int,
     sales_log_id: int,
@@ -275,20 +336,20 @@ async def update_sales_log(
     
     return updated_sales_log
 
-@router.delete("/{product_id}/sales/{sales_log_id}")
-async def delete_sales_log(
+@router.delete("/{product_id}/sales/bulk")
+@transactional
+async def delete_sales_logs_bulk(
     product_id: int,
-    sales_log_id: int,
+    date: Optional[str] = Query(None, description="Date for filtering (YYYY-MM-DD)"),
+    store_name: Optional[str] = Query(None, description="Filter by store name"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Delete a sales log"""
+    """Delete multiple sales logs in bulk"""
     # Set user context for audit logging
     current_user_var.set(current_user)
     
-    deleted_log = await sales_crud.delete_sales_log(db, sales_log_id)
-    if deleted_log is None:
-        raise HTTPException(status_code=404, detail="Sales log not found")
+    deleted_count = await sales_crud.delete_sales_logs_bulk(db, product_id, date, store_name)
     
     # Log the audit event
     await create_audit_log(
@@ -296,28 +357,31 @@ async def delete_sales_log(
         AuditLogCreate(
             user_id=current_user.id,
             username=current_user.email,
-            action="DELETE",
+            action="BULK_DELETE",
             entity="SalesLog",
-            entity_id=sales_log_id,
-            field_changed="sales_log",
-            old_value=str(sales_log_id)
+            entity_id=product_id,
+            field_changed="bulk_sales_logs",
+            old_value=f"Deleted {deleted_count} sales logs for date {date}"
         )
     )
     
-    return {"message": "Sales log deleted successfully"}
+    return {"message": f"Deleted {deleted_count} sales logs", "deleted_count": deleted_count}
 
-@router.post("/{product_id}/sales/bulk", response_model=List[SalesLog])
-async def create_sales_logs_bulk(
+@router.delete("/{product_id}/sales/{sales_log_id}")
+@transactional
+async def delete_sales_log(
     product_id: int,
-    sales_logs: List[SalesLogCreate],
+    sales_log_id: int,
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Create multiple sales logs in bulk"""
+    """Delete a sales log"""
     # Set user context for audit logging
     current_user_var.set(current_user)
     
-    result = await sales_crud.create_sales_logs_bulk(db, sales_logs)
+    deleted_log = await sales_crud.delete_sales_log(db, sales_log_id)
+    if deleted_log is None:
+        raise HTTPException(status_code=404, detail="Sales log not found")
     
     # Log the audit event
     await create_audit_log(
@@ -325,29 +389,29 @@ async def create_sales_logs_bulk(
         AuditLogCreate(
             user_id=current_user.id,
             username=current_user.email,
-            action="BULK_CREATE",
+            action="DELETE",
             entity="SalesLog",
-            entity_id=product_id,
-            field_changed="bulk_sales_logs",
-            new_value=f"Created {len(result)} sales logs"
+            entity_id=sales_log_id,
+            field_changed="sales_log",
+            old_value=str(sales_log_id)
         )
     )
     
-    return result
+    return {"message": "Sales log deleted successfully"}
 
-@router.delete("/{product_id}/sales/bulk")
-async def delete_sales_logs_bulk(
+@router.post("/{product_id}/sales/bulk", response_model=List[SalesLog])
+@transactional
+async def create_sales_logs_bulk(
     product_id: int,
-    date: Optional[str] = Query(None, description="Date for filtering (YYYY-MM-DD)"),
-    store_name: Optional[str] = Query(None, description="Filter by store name"),
+    sales_logs: List[SalesLogCreate],
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """Delete multiple sales logs in bulk"""
+    """Create multiple sales logs in bulk"""
     # Set user context for audit logging
     current_user_var.set(current_user)
     
-    deleted_count = await sales_crud.delete_sales_logs_bulk(db, product_id, date, store_name)
+    result = await sales_crud.create_sales_logs_bulk(db, sales_logs, product_id=product_id)
     
     # Log the audit event
     await create_audit_log(
@@ -355,15 +419,15 @@ async def delete_sales_logs_bulk(
         AuditLogCreate(
             user_id=current_user.id,
             username=current_user.email,
-            action="BULK_DELETE",
+            action="BULK_CREATE",
             entity="SalesLog",
             entity_id=product_id,
             field_changed="bulk_sales_logs",
-            old_value=f"Deleted {deleted_count} sales logs for date {date}"
+            new_value=f"Created {len(result)} sales logs"
         )
     )
     
-    return {"message": f"Deleted {deleted_count} sales logs", "deleted_count": deleted_count}
+    return result
 
 class SalesExportHeaders(BaseModel):
     party_name: str = ""
@@ -373,6 +437,7 @@ class SalesExportHeaders(BaseModel):
     date: str = ""
 
 @router.post("/export-excel")
+@transactional
 async def export_sales_excel(
     headers: SalesExportHeaders = Body(...),
     db: AsyncSession = Depends(get_db),
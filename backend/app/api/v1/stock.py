@@ -1,22 +1,121 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Literal, Optional
+from datetime import date
 import logging
-from app.api.deps import get_db, get_current_user
+import json
+import asyncio
+from app.config import settings
+from app.api.deps import get_db, get_current_user, require_admin
+from app.core.services.stock_cache import stock_cache
+from app.core.services.stock_events import stock_event_hub
 from app.core.crud.product import get_product
 from app.core.crud.inward import get_inward_logs_by_product
 from app.core.crud.sales import get_sales_logs_by_product
-from app.schemas.stock import StockMatrix, DetailedStockData, StockMovement
+from app.core.crud.stock import (
+    get_stock_matrix_from_projection,
+    replay_stock_matrix,
+    get_products_for_stock_batch,
+    get_stock_movements,
+    iter_stock_matrices_from_projection,
+)
+from app.core.crud.stock_snapshot import get_stock_matrix_as_of, replay_stock_matrix_as_of
+from app.schemas.stock import StockMatrix, DetailedStockData, StockMovement, StockMovementPage, StockBatchRequest
+from app.utils.pagination import encode_cursor, decode_cursor
+from app.schemas.product import ProductOut
+from app.schemas.inward import InwardLog
+from app.schemas.sales import SalesLog
 
 router = APIRouter()
 
+@router.post(
+    "/batch",
+    summary="Get stock matrices for many products",
+    description="Returns the stock matrix of every selected product as NDJSON, one line per product: "
+                '{"product_id": 1, "stock": {...}}. Unknown product ids yield an "error" line.',
+    response_class=StreamingResponse,
+)
+async def get_stock_matrices_batch(
+    request: StockBatchRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    products = await get_products_for_stock_batch(
+        db,
+        product_ids=request.product_ids,
+        name=request.name,
+        sku=request.sku,
+        skip=request.skip,
+        limit=request.limit,
+    )
+    stocked = [p for p in products if p.colors and p.sizes]
+    found_ids = {p.id for p in products}
+    missing_ids = [pid for pid in dict.fromkeys(request.product_ids or []) if pid not in found_ids]
+
+    async def lines():
+        for product in products:
+            if not (product.colors and product.sizes):
+                yield json.dumps({"product_id": product.id, "stock": {}}) + "\n"
+        async for product, matrix in iter_stock_matrices_from_projection(db, stocked):
+            yield json.dumps({"product_id": product.id, "stock": matrix}) + "\n"
+        for product_id in missing_ids:
+            yield json.dumps({"product_id": product_id, "error": "Product not found"}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+@router.get(
+    "/stream",
+    summary="Stream stock changes",
+    description="Server-sent events with the size-level stock deltas of every committed inward/sales write. "
+                "Each event is {\"product_id\": 1, \"deltas\": [{\"color\", \"colour_code\", \"size\", \"delta\"}], \"published_at\"}. "
+                "Without product_ids all products are streamed.",
+    response_class=StreamingResponse,
+)
+async def stream_stock_changes(
+    request: Request,
+    product_ids: Optional[List[int]] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    # The stream can stay open for hours; don't hold the pooled connection used for auth
+    await db.close()
+    subscription = stock_event_hub.subscribe(product_ids)
+
+    async def events():
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    payload = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.STOCK_STREAM_HEARTBEAT_SECONDS
+                    )
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: stock\ndata: {json.dumps(payload)}\n\n"
+        finally:
+            stock_event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @router.get(
     "/{product_id}", 
     response_model=StockMatrix,
     summary="Get stock matrix for a product",
-    description="Calculates and returns the current stock levels for each color/size variant of a product."
+    description="Returns the current stock levels for each color/size variant of a product. "
+                "By default the matrix is read from the maintained stock ledger; "
+                "`mode=replay` recomputes it from the inward and sales logs for verification. "
+                "With `as_of=YYYY-MM-DD` the closing stock of that day is returned, read from the nearest daily snapshot."
 )
 async def get_stock_matrix(
     product_id: int,
+    mode: Literal["projection", "replay"] = Query("projection", description="projection (default) or replay"),
+    as_of: Optional[date] = Query(None, description="Closing stock at the end of this day (YYYY-MM-DD)"),
     db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
@@ -29,32 +128,21 @@ async def get_stock_matrix(
         if not product.colors or not product.sizes:
             return {}
 
-        inward_logs = await get_inward_logs_by_product(db, product_id=product_id)
-        sales_logs = await get_sales_logs_by_product(db, product_id=product_id)
-
-        stock_matrix = {color['color']: {size: 0 for size in product.sizes} for color in product.colors}
-
-        for log in inward_logs:
-            if log.color in stock_matrix and hasattr(log, 'sizes') and isinstance(log.sizes, dict):
-                for size, qty in log.sizes.items():
-                    if size in stock_matrix[log.color]:
-                        if log.category == 'Supply':
-                            stock_matrix[log.color][size] += qty
-                        elif log.category == 'Return':
-                            stock_matrix[log.color][size] -= qty
-
-        for log in sales_logs:
-            if log.color in stock_matrix and hasattr(log, 'sizes') and isinstance(log.sizes, dict):
-                for size, qty in log.sizes.items():
-                    if size in stock_matrix[log.color]:
-                        stock_matrix[log.color][size] -= qty
-        
-        # Calculate totals for each color
-        for color, sizes in stock_matrix.items():
-            total = sum(s for s in sizes.values() if isinstance(s, (int, float)))
-            stock_matrix[color]['total'] = total
-
+        if as_of is not None:
+            if mode == "replay":
+                return await replay_stock_matrix_as_of(db, product, as_of)
+            return await get_stock_matrix_as_of(db, product, as_of)
+        if mode == "replay":
+            return await replay_stock_matrix(db, product)
+        cache_key = ("matrix", product_id)
+        stock_matrix = stock_cache.get(cache_key)
+        if stock_matrix is None:
+            version = stock_cache.version(product_id)
+            stock_matrix = await get_stock_matrix_from_projection(db, product)
+            stock_cache.set(cache_key, stock_matrix, version=version)
         return stock_matrix
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error calculating stock matrix for product {product_id}: {e}")
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {e}")
@@ -70,6 +158,11 @@ async def get_detailed_stock(
     db: AsyncSession = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
+    cache_key = ("detailed", product_id)
+    detailed = stock_cache.get(cache_key)
+    if detailed is not None:
+        return detailed
+    version = stock_cache.version(product_id)
     product = await get_product(db, product_id=product_id)
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -77,8 +170,80 @@ async def get_detailed_stock(
     inward_logs = await get_inward_logs_by_product(db, product_id=product_id)
     sales_logs = await get_sales_logs_by_product(db, product_id=product_id)
 
-    return {
-        "product": product,
-        "inward_logs": inward_logs,
-        "sales_logs": sales_logs,
-    } 
\ No newline at end of file
+    detailed = {
+        "product": ProductOut.model_validate(product),
+        "inward_logs": [InwardLog.model_validate(log) for log in inward_logs],
+        "sales_logs": [SalesLog.model_validate(log) for log in sales_logs],
+    }
+    stock_cache.set(cache_key, detailed, version=version)
+    return detailed
+
+@router.get(
+    "/{product_id}/movements",
+    response_model=StockMovementPage,
+    summary="Get the stock movement timeline of a product",
+    description="Inward, return and sale movements per size in date order, each with the running balance "
+                "of its color/size. Pass next_cursor back as cursor to read the following page."
+)
+async def get_stock_movement_timeline(
+    product_id: int,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    if not await get_product(db, product_id=product_id):
+        raise HTTPException(status_code=404, detail="Product not found")
+    after = None
+    balances = {}
+    if cursor:
+        try:
+            state = decode_cursor(cursor)
+            cursor_product_id = int(state["product_id"])
+            last_date, source, log_id, size = state["after"]
+            after = (date.fromisoformat(last_date), int(source), int(log_id), str(size))
+            balances = {
+                (color, None if code is None else int(code), size): int(qty)
+                for color, code, size, qty in state["balances"]
+            }
+        except (ValueError, KeyError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+        # The balances of one product's timeline mean nothing on another's
+        if cursor_product_id != product_id:
+            raise HTTPException(status_code=400, detail="Invalid cursor: it belongs to another product")
+
+    rows, has_more = await get_stock_movements(db, product_id, limit, after=after)
+    items = []
+    for row in rows:
+        key = (row.color, row.colour_code, row.size)
+        balances[key] = balances.get(key, 0) + row.qty
+        items.append(StockMovement(
+            product_id=product_id,
+            color=row.color,
+            colour_code=row.colour_code,
+            size=row.size,
+            quantity=row.qty,
+            movement_type=row.movement_type,
+            log_id=row.log_id,
+            date=row.date,
+            balance=balances[key],
+        ))
+
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        # Running balances travel with the cursor, so later pages never rescan earlier history
+        next_cursor = encode_cursor({
+            "product_id": product_id,
+            "after": [last.date.isoformat(), last.source, last.log_id, last.size],
+            "balances": [[color, code, size, qty] for (color, code, size), qty in balances.items()],
+        })
+    return StockMovementPage(items=items, next_cursor=next_cursor, has_more=has_more)
+
+@router.get(
+    "/cache/stats",
+    summary="Stock cache statistics",
+    description="Hit, miss, eviction and invalidation counters of the in-process stock matrix cache."
+)
+async def get_stock_cache_stats(current_user = Depends(require_admin)):
+    return stock_cache.stats()
@@ -25,6 +25,34 @@ class Settings(BaseSettings):
 
     ACTIVITY_LOG_RETENTION_DAYS: int = int(os.getenv("ACTIVITY_LOG_RETENTION_DAYS", 60))
 
+    # Stock concurrency control: "none" relies on atomic in-database increments,
+    # "row" takes SELECT ... FOR UPDATE on the affected rows, "advisory" takes
+    # PostgreSQL transaction advisory locks per (product_id, color)
+    STOCK_LOCK_MODE: str = os.getenv("STOCK_LOCK_MODE", "none")
+    # In-process stock matrix cache
+    STOCK_CACHE_MAXSIZE: int = int(os.getenv("STOCK_CACHE_MAXSIZE", 1024))
+    STOCK_CACHE_TTL_SECONDS: float = float(os.getenv("STOCK_CACHE_TTL_SECONDS", 30))
+    STOCK_STREAM_HEARTBEAT_SECONDS: float = float(os.getenv("STOCK_STREAM_HEARTBEAT_SECONDS", 15))
+
+    # Stored responses of requests sent with an Idempotency-Key header
+    IDEMPOTENCY_KEY_TTL_HOURS: int = int(os.getenv("IDEMPOTENCY_KEY_TTL_HOURS", 24))
+
+    # In-process bulk import jobs (POST /jobs/bulk-import)
+    BULK_IMPORT_WORKERS: int = int(os.getenv("BULK_IMPORT_WORKERS", 2))
+    BULK_IMPORT_BATCH_SIZE: int = int(os.getenv("BULK_IMPORT_BATCH_SIZE", 500))
+    BULK_IMPORT_MAX_JOBS: int = int(os.getenv("BULK_IMPORT_MAX_JOBS", 100))
+
+    # Log listings called without limit/cursor still return a bare list for old clients, but
+    # at most this many rows; the rest follow from the X-Next-Cursor header (or stream NDJSON)
+    LOG_LISTING_MAX_ROWS: int = int(os.getenv("LOG_LISTING_MAX_ROWS", 10000))
+    # Rows fetched per round trip by application/x-ndjson listings
+    NDJSON_YIELD_PER: int = int(os.getenv("NDJSON_YIELD_PER", 500))
+
+    # Nightly stock reconciliation (product_size_stocks vs inward/sales logs)
+    STOCK_RECONCILE_CHUNK_SIZE: int = int(os.getenv("STOCK_RECONCILE_CHUNK_SIZE", 200))
+    STOCK_RECONCILE_WORKERS: int = int(os.getenv("STOCK_RECONCILE_WORKERS", 4))
+    STOCK_RECONCILE_REPAIR: bool = os.environ.get("STOCK_RECONCILE_REPAIR", "False").lower() in ("true", "1", "t")
+
     class Config:
         case_sensitive = True
 
@@ -5,12 +5,12 @@ from typing import List, Optional
 
 from ...models.audit_log import AuditLog
 from ...schemas.audit_log import AuditLogCreate
+from ..unit_of_work import commit_and_reload
 
 async def create_audit_log(db: AsyncSession, log_entry: AuditLogCreate) -> AuditLog:
     db_log = AuditLog(**log_entry.model_dump())
     db.add(db_log)
-    await db.commit()
-    await db.refresh(db_log)
+    await commit_and_reload(db, [db_log])
     return db_log
 
 async def get_audit_logs(
@@ -0,0 +1,57 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from fastapi import HTTPException
+from datetime import datetime, timedelta
+from typing import Any, Optional
+from app.models.idempotency_key import IdempotencyKey
+from app.config import settings
+
+async def get_idempotency_key(db: AsyncSession, user_id: int, scope: str, key: str) -> Optional[IdempotencyKey]:
+    """The unexpired record of a key, if any."""
+    result = await db.execute(
+        select(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at > datetime.utcnow(),
+        )
+    )
+    return result.scalar_one_or_none()
+
+async def reserve_idempotency_key(db: AsyncSession, user_id: int, scope: str, key: str, request_hash: str) -> IdempotencyKey:
+    """
+    Inserts the key for a request that is about to run, in the caller's transaction.
+    A concurrent request holding the same key makes the flush fail; that request's
+    result is not known yet, so the caller gets a 409 and may retry.
+    """
+    await db.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.scope == scope,
+            IdempotencyKey.key == key,
+            IdempotencyKey.expires_at <= datetime.utcnow(),
+        )
+    )
+    now = datetime.utcnow()
+    record = IdempotencyKey(
+        user_id=user_id, scope=scope, key=key, request_hash=request_hash,
+        created_at=now, expires_at=now + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+    )
+    db.add(record)
+    try:
+        await db.flush()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is already in progress")
+    return record
+
+async def save_idempotent_response(db: AsyncSession, record: IdempotencyKey, response_body: Any, status_code: int = 200) -> None:
+    """Stores the response on the reserved key; it is committed together with the request's writes."""
+    record.response_body = response_body
+    record.status_code = status_code
+    await db.flush()
+
+async def delete_expired_idempotency_keys(db: AsyncSession) -> int:
+    result = await db.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= datetime.utcnow()))
+    await db.commit()
+    return result.rowcount
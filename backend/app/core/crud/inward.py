@@ -1,9 +1,13 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import select, delete, insert, tuple_
 from ...models.inward import InwardLog
 from ...schemas.inward import InwardLogCreate, InwardLogUpdate, InwardLog as InwardLogSchema
 from . import product_color_stock as crud_stock
-from typing import Optional, List
+from ..unit_of_work import commit_or_flush
+from ..services.audit_logger import queue_bulk_audit_logs
+from ..services.stock_cache import mark_stock_dirty
+from ...config import settings
+from typing import AsyncIterator, Optional, List
 from datetime import datetime
 
 def sa_obj_to_dict(obj):
@@ -23,18 +27,64 @@ def sa_obj_to_dict(obj):
     except Exception:
         return {"id": getattr(obj, 'id', None)}
 
-async def get_inward_logs_by_product(db: AsyncSession, product_id: int, start_date: Optional[str] = None, end_date: Optional[str] = None, stakeholder: Optional[str] = None):
-    query = select(InwardLog).filter(InwardLog.product_id == product_id)
+def _inward_logs_query(product_id: Optional[int], start_date: Optional[str] = None, end_date: Optional[str] = None, stakeholder: Optional[str] = None):
+    query = select(InwardLog)
+    if product_id is not None:
+        query = query.filter(InwardLog.product_id == product_id)
     if start_date:
         query = query.filter(InwardLog.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
         query = query.filter(InwardLog.date <= datetime.strptime(end_date, '%Y-%m-%d').date())
     if stakeholder:
         query = query.filter(InwardLog.stakeholder_name.ilike(f'%{stakeholder}%'))
+    return query.order_by(InwardLog.date, InwardLog.id)
+
+async def get_inward_logs_by_product(db: AsyncSession, product_id: int, start_date: Optional[str] = None, end_date: Optional[str] = None, stakeholder: Optional[str] = None):
+    query = _inward_logs_query(product_id, start_date, end_date, stakeholder=stakeholder)
     result = await db.execute(query)
     logs = result.scalars().all()
     return [InwardLogSchema.model_validate(sa_obj_to_dict(log)) for log in logs]
 
+# Columns of the InwardLog schema, for reads that skip the ORM and Pydantic
+INWARD_LOG_COLUMNS = (
+    InwardLog.id, InwardLog.product_id, InwardLog.color, InwardLog.colour_code, InwardLog.sizes,
+    InwardLog.date, InwardLog.category, InwardLog.stakeholder_name, InwardLog.operation,
+)
+
+async def get_inward_log_rows(db: AsyncSession, product_id: Optional[int], start_date: Optional[str] = None, end_date: Optional[str] = None, stakeholder: Optional[str] = None, max_rows: Optional[int] = None) -> List[dict]:
+    """
+    get_inward_logs_by_product (every product when product_id is None) as plain dicts built
+    from column tuples, with no ORM instances or schema validation; for responses encoded
+    straight to JSON. At most max_rows rows are read when it is given.
+    """
+    query = _inward_logs_query(product_id, start_date, end_date, stakeholder=stakeholder).with_only_columns(*INWARD_LOG_COLUMNS)
+    if max_rows is not None:
+        query = query.limit(max_rows)
+    result = await db.execute(query)
+    return [row._asdict() for row in result]
+
+async def get_inward_logs_page(db: AsyncSession, product_id: Optional[int], limit: int, after: Optional[tuple] = None, start_date: Optional[str] = None, end_date: Optional[str] = None, stakeholder: Optional[str] = None):
+    """
+    One page of get_inward_logs_by_product (every product when product_id is None), ordered by (date, id).
+    after is the (date, id) of the last log already returned. Returns (logs, has_more).
+    """
+    query = _inward_logs_query(product_id, start_date, end_date, stakeholder=stakeholder)
+    if after is not None:
+        query = query.filter(tuple_(InwardLog.date, InwardLog.id) > tuple_(*after))
+    result = await db.execute(query.limit(limit + 1))
+    logs = result.scalars().all()
+    return [InwardLogSchema.model_validate(sa_obj_to_dict(log)) for log in logs[:limit]], len(logs) > limit
+
+async def stream_inward_logs(db: AsyncSession, product_id: Optional[int] = None, start_date: Optional[str] = None, end_date: Optional[str] = None, stakeholder: Optional[str] = None) -> AsyncIterator[InwardLogSchema]:
+    """
+    Yields the logs of get_inward_logs_by_product (of every product when product_id is None)
+    one at a time, fetching settings.NDJSON_YIELD_PER rows per round trip.
+    """
+    query = _inward_logs_query(product_id, start_date, end_date, stakeholder=stakeholder)
+    result = await db.stream_scalars(query.execution_options(yield_per=settings.NDJSON_YIELD_PER))
+    async for log in result:
+        yield InwardLogSchema.model_validate(sa_obj_to_dict(log))
+
 async def get_last_inward_log_by_date_and_stakeholder(db: AsyncSession, product_id: int, date: str, stakeholder_name: str):
     """Get the last (most recent) inward log entry for a specific date and stakeholder"""
     query = select(InwardLog).filter(
@@ -52,57 +102,64 @@ async def get_last_inward_log_by_date_and_stakeholder(db: AsyncSession, product_
 async def create_inward_log(db: AsyncSession, inward_log: InwardLogCreate):
     db_inward_log = InwardLog(**inward_log.model_dump())
     db.add(db_inward_log)
-    await db.commit()
-    await db.refresh(db_inward_log)
     await crud_stock.update_stock_from_log(db, db_inward_log, "CREATE")
-    # Convert to dict immediately after refresh
-    log_dict = sa_obj_to_dict(db_inward_log)
-    return InwardLogSchema.model_validate(log_dict)
+    await commit_or_flush(db)
+    await db.refresh(db_inward_log)
+    return InwardLogSchema.model_validate(sa_obj_to_dict(db_inward_log))
 
 async def create_inward_logs_bulk(db: AsyncSession, inward_logs: List[InwardLogCreate]):
-    """Create multiple inward log entries in a single transaction"""
-    created_logs = []
-    for inward_log in inward_logs:
-        db_inward_log = InwardLog(**inward_log.model_dump())
-        db.add(db_inward_log)
-        created_logs.append(db_inward_log)
-    
-    await db.commit()
-    
-    # Refresh all created logs and update stock
+    """
+    Create multiple inward log entries in a single transaction.
+    All rows go in with one INSERT ... RETURNING and their stock changes are summed
+    per size and applied with one UPSERT, whatever the batch size.
+    """
+    if not inward_logs:
+        return []
+    result = await db.scalars(
+        insert(InwardLog).returning(InwardLog, sort_by_parameter_order=True),
+        [inward_log.model_dump() for inward_log in inward_logs],
+    )
+    created_logs = result.all()
+
+    deltas = {}
     for db_inward_log in created_logs:
-        await db.refresh(db_inward_log)
-        await crud_stock.update_stock_from_log(db, db_inward_log, "CREATE")
-    
-    return [InwardLogSchema.model_validate(sa_obj_to_dict(log)) for log in created_logs]
+        crud_stock.stock_deltas_from_log(db_inward_log, "CREATE", deltas)
+    await crud_stock.apply_stock_deltas(db, deltas)
+    await crud_stock.update_snapshots_from_logs(db, created_logs, "CREATE")
+    # Cached listings include the log rows, so even all-zero logs invalidate them
+    mark_stock_dirty(db, (log.product_id for log in created_logs))
+    queue_bulk_audit_logs(db, "CREATE", created_logs)
+    response = [InwardLogSchema.model_validate(sa_obj_to_dict(log)) for log in created_logs]
+    await commit_or_flush(db)
+    return response
 
 async def delete_inward_logs_bulk(db: AsyncSession, product_id: int, date: Optional[str] = None, stakeholder_name: Optional[str] = None):
-    """Delete multiple inward log entries based on criteria"""
-    # First, get the logs to be deleted for stock update
-    query = select(InwardLog).filter(InwardLog.product_id == product_id)
-    if date:
-        query = query.filter(InwardLog.date == datetime.strptime(date, '%Y-%m-%d').date())
-    if stakeholder_name:
-        query = query.filter(InwardLog.stakeholder_name.ilike(f'%{stakeholder_name}%'))
-    
-    result = await db.execute(query)
-    logs_to_delete = result.scalars().all()
-    
-    # Update stock for each log before deletion
-    for log in logs_to_delete:
-        await crud_stock.update_stock_from_log(db, log, "DELETE")
-    
-    # Delete the logs
+    """
+    Delete multiple inward log entries based on criteria.
+    One DELETE ... RETURNING removes the rows and hands back what is needed to reverse
+    their stock, which is applied with one UPSERT in the same transaction.
+    """
     delete_query = delete(InwardLog).filter(InwardLog.product_id == product_id)
     if date:
         delete_query = delete_query.filter(InwardLog.date == datetime.strptime(date, '%Y-%m-%d').date())
     if stakeholder_name:
         delete_query = delete_query.filter(InwardLog.stakeholder_name.ilike(f'%{stakeholder_name}%'))
-    
-    result = await db.execute(delete_query)
-    await db.commit()
-    
-    return len(logs_to_delete)
+
+    result = await db.scalars(
+        delete_query.returning(InwardLog).execution_options(synchronize_session=False)
+    )
+    deleted_logs = result.all()
+
+    deltas = {}
+    for log in deleted_logs:
+        crud_stock.stock_deltas_from_log(log, "DELETE", deltas)
+    await crud_stock.apply_stock_deltas(db, deltas)
+    await crud_stock.update_snapshots_from_logs(db, deleted_logs, "DELETE")
+    mark_stock_dirty(db, (log.product_id for log in deleted_logs))
+    queue_bulk_audit_logs(db, "DELETE", deleted_logs)
+    await commit_or_flush(db)
+
+    return len(deleted_logs)
 
 async def update_inward_log(db: AsyncSession, log_id: int, inward_log: InwardLogUpdate):
     result = await db.execute(select(InwardLog).filter(InwardLog.id == log_id))
@@ -112,13 +169,10 @@ async def update_inward_log(db: AsyncSession, log_id: int, inward_log: InwardLog
         update_data = inward_log.model_dump(exclude_unset=True)
         for key, value in update_data.items():
             setattr(db_inward_log, key, value)
-        await db.flush()
         await crud_stock.update_stock_from_log(db, db_inward_log, "CREATE")
-        await db.commit()
+        await commit_or_flush(db)
         await db.refresh(db_inward_log)
-        # Convert to dict immediately after refresh
-        log_dict = sa_obj_to_dict(db_inward_log)
-        return InwardLogSchema.model_validate(log_dict)
+        return InwardLogSchema.model_validate(sa_obj_to_dict(db_inward_log))
     return None
 
 async def delete_inward_log(db: AsyncSession, log_id: int):
@@ -129,7 +183,7 @@ async def delete_inward_log(db: AsyncSession, log_id: int):
         log_dict = sa_obj_to_dict(db_inward_log)
         await crud_stock.update_stock_from_log(db, db_inward_log, "DELETE")
         await db.delete(db_inward_log)
-        await db.commit()
+        await commit_or_flush(db)
         return InwardLogSchema.model_validate(log_dict)
     return None
 
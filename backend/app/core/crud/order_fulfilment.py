@@ -0,0 +1,75 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, tuple_
+from typing import Dict, Iterable, Optional, Tuple
+from app.models.order_fulfilment import OrderFulfilment
+from app.models.orders import Order
+from app.models.sales import SalesLog
+from .product_color_stock import _upsert_for
+
+# (product_id, financial_year, order_number, size) -> [ordered delta, delivered delta]
+FulfilmentDeltas = Dict[Tuple[int, str, int, str], list]
+# (order_number, financial_year, product_id) of an order; order numbers restart every financial year
+OrderKey = Tuple[int, str, int]
+
+def order_key(order: Order) -> OrderKey:
+    return (order.order_number, order.financial_year, order.product_id)
+
+def _accumulate(deltas: FulfilmentDeltas, product_id: int, financial_year: Optional[str], order_number: Optional[int], sizes, column: int, sign: int) -> FulfilmentDeltas:
+    if order_number is None or financial_year is None or not isinstance(sizes, dict):
+        return deltas
+    for size, qty in sizes.items():
+        if qty:
+            entry = deltas.setdefault((product_id, financial_year, order_number, size), [0, 0])
+            entry[column] += sign * qty
+    return deltas
+
+def ordered_deltas_from_order(order: Order, operation: str, deltas: Optional[FulfilmentDeltas] = None) -> FulfilmentDeltas:
+    """Ordered quantities added ('CREATE') or withdrawn ('DELETE') by an order."""
+    sign = -1 if operation == "DELETE" else 1
+    return _accumulate({} if deltas is None else deltas, order.product_id, order.financial_year, order.order_number, order.sizes, 0, sign)
+
+def delivered_deltas_from_log(log: SalesLog, operation: str, deltas: Optional[FulfilmentDeltas] = None) -> FulfilmentDeltas:
+    """
+    Delivered quantities added or withdrawn by a sales log; logs without an order number deliver nothing.
+    The log's financial_year must already be resolved (see sales.order_financial_years).
+    """
+    sign = -1 if operation == "DELETE" else 1
+    return _accumulate({} if deltas is None else deltas, log.product_id, log.financial_year, log.order_number, log.sizes, 1, sign)
+
+async def apply_fulfilment_deltas(db: AsyncSession, deltas: FulfilmentDeltas) -> None:
+    """
+    Applies the deltas with one INSERT ... ON CONFLICT DO UPDATE, incrementing inside the
+    database like apply_stock_deltas. Does not commit; the caller owns the transaction.
+    """
+    rows = [
+        {"product_id": product_id, "financial_year": financial_year, "order_number": order_number, "size": size,
+         "ordered": ordered, "delivered": delivered}
+        for (product_id, financial_year, order_number, size), (ordered, delivered) in sorted(deltas.items()) if ordered or delivered
+    ]
+    if not rows:
+        return
+    insert = _upsert_for(db)
+    statement = insert(OrderFulfilment).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[OrderFulfilment.product_id, OrderFulfilment.financial_year, OrderFulfilment.order_number, OrderFulfilment.size],
+        set_={
+            "ordered": OrderFulfilment.ordered + statement.excluded.ordered,
+            "delivered": OrderFulfilment.delivered + statement.excluded.delivered,
+        },
+    )
+    await db.execute(statement)
+
+async def get_fulfilment(db: AsyncSession, keys: Iterable[OrderKey]) -> Dict[OrderKey, Dict[str, OrderFulfilment]]:
+    """Fulfilment rows per size for each (order_number, financial_year, product_id), read by the unique key."""
+    keys = sorted({(product_id, financial_year, order_number) for order_number, financial_year, product_id in keys})
+    if not keys:
+        return {}
+    result = await db.execute(
+        select(OrderFulfilment)
+        .where(tuple_(OrderFulfilment.product_id, OrderFulfilment.financial_year, OrderFulfilment.order_number).in_(keys))
+        .execution_options(populate_existing=True)
+    )
+    fulfilment: Dict[OrderKey, Dict[str, OrderFulfilment]] = {}
+    for row in result.scalars():
+        fulfilment.setdefault((row.order_number, row.financial_year, row.product_id), {})[row.size] = row
+    return fulfilment
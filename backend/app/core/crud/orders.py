@@ -1,12 +1,17 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func, select
-from typing import List, Optional
+from sqlalchemy import func, insert, select, update
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Tuple
 from datetime import date
-from ...models.orders import Order
-from ...schemas.orders import OrderCreate, OrderUpdate
+from ...models.orders import Order, OrderNumberCounter
+from ...models.order_fulfilment import OrderFulfilment
+from ...schemas.orders import OrderCreate, OrderUpdate, OrderResponse
+from ..unit_of_work import commit_and_reload, commit_or_flush
+from .product_color_stock import _upsert_for
+from ..services.audit_logger import queue_bulk_audit_logs
+from . import order_fulfilment as crud_fulfilment
+from ...config import settings
 from sqlalchemy.exc import IntegrityError
 from fastapi import HTTPException
-from app.models.sales import SalesLog
 from collections import defaultdict
 import logging
 
@@ -18,30 +23,55 @@ def get_financial_year(order_date: date) -> str:
     else:
         return f"{year-1}-{str(year)[-2:]}"
 
-async def get_next_order_number(db: AsyncSession, financial_year: str) -> int:
-    """Get the next order number for the given financial year"""
+async def reserve_order_numbers(db: AsyncSession, financial_year: str, count: int = 1) -> int:
+    """
+    Reserves `count` consecutive order numbers of the financial year and returns the first.
+    The counter is advanced inside the database with UPDATE ... RETURNING, so concurrent
+    callers always get disjoint blocks; the counter row stays locked until the caller's
+    transaction ends, and a rollback releases the block. A year without a counter yet is
+    seeded once from max(order_number) + 1.
+    """
     result = await db.execute(
-        select(func.max(Order.order_number)).filter(Order.financial_year == financial_year)
+        update(OrderNumberCounter)
+        .where(OrderNumberCounter.financial_year == financial_year)
+        .values(next_value=OrderNumberCounter.next_value + count)
+        .returning(OrderNumberCounter.next_value)
+        .execution_options(synchronize_session=False)
     )
-    max_order = result.scalar()
-    return (max_order or 0) + 1
+    next_value = result.scalar_one_or_none()
+    if next_value is None:
+        seed = (
+            select(func.coalesce(func.max(Order.order_number), 0) + 1)
+            .where(Order.financial_year == financial_year)
+            .scalar_subquery()
+        )
+        insert = _upsert_for(db)
+        statement = insert(OrderNumberCounter).values(financial_year=financial_year, next_value=seed + count)
+        # Another transaction may have created the counter since the UPDATE above
+        statement = statement.on_conflict_do_update(
+            index_elements=[OrderNumberCounter.financial_year],
+            set_={"next_value": OrderNumberCounter.next_value + count},
+        ).returning(OrderNumberCounter.next_value)
+        next_value = (await db.execute(statement)).scalar_one()
+    return next_value - count
 
 async def create_order(db: AsyncSession, order: OrderCreate) -> Order:
     """Create a new order with automatic order number generation"""
     financial_year = get_financial_year(order.date)
-    order_number = await get_next_order_number(db, financial_year)
+    order_number = await reserve_order_numbers(db, financial_year)
     db_order = Order(
         order_number=order_number,
         financial_year=financial_year,
         **order.model_dump()
     )
     db.add(db_order)
+    await crud_fulfilment.apply_fulfilment_deltas(db, crud_fulfilment.ordered_deltas_from_order(db_order, "CREATE"))
     try:
-        await db.commit()
-        await db.refresh(db_order)
+        await commit_or_flush(db)
     except IntegrityError:
         await db.rollback()
         raise HTTPException(status_code=400, detail="Order number must be unique for the financial year.")
+    await db.refresh(db_order)
     return db_order
 
 async def get_all_orders(db: AsyncSession, skip: int = 0, limit: int = 100) -> List[Order]:
@@ -51,6 +81,17 @@ async def get_all_orders(db: AsyncSession, skip: int = 0, limit: int = 100) -> L
     )
     return result.scalars().all()
 
+async def stream_all_orders(db: AsyncSession) -> AsyncIterator[OrderResponse]:
+    """
+    Yields every order, newest first like get_all_orders, settings.NDJSON_YIELD_PER rows per
+    round trip; each batch goes through build_order_responses for its delivery status.
+    """
+    query = select(Order).order_by(Order.created_at.desc(), Order.id.desc())
+    result = await db.stream_scalars(query.execution_options(yield_per=settings.NDJSON_YIELD_PER))
+    async for orders in result.partitions():
+        for response in await build_order_responses(db, orders):
+            yield response
+
 async def get_orders(
     db: AsyncSession, 
     product_id: int, 
@@ -86,27 +127,25 @@ async def get_orders(
 async def get_order(db: AsyncSession, order_id: int) -> Optional[Order]:
     """Get a specific order by ID"""
     result = await db.execute(select(Order).filter(Order.id == order_id))
-    order = result.scalar_one_or_none()
-    if not order:
-        return None
-    order_dict = order.__dict__.copy()
-    order_dict['fully_delivered'] = await is_fully_delivered(db, order)
-    return order
+    return result.scalar_one_or_none()
 
 async def update_order(db: AsyncSession, order_id: int, order: OrderUpdate) -> Optional[Order]:
     """Update an existing order, including order_number"""
     result = await db.execute(select(Order).filter(Order.id == order_id))
     db_order = result.scalar_one_or_none()
     if db_order:
+        deltas = crud_fulfilment.ordered_deltas_from_order(db_order, "DELETE")
         update_data = order.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_order, field, value)
+        crud_fulfilment.ordered_deltas_from_order(db_order, "CREATE", deltas)
+        await crud_fulfilment.apply_fulfilment_deltas(db, deltas)
         try:
-            await db.commit()
-            await db.refresh(db_order)
+            await commit_or_flush(db)
         except IntegrityError:
             await db.rollback()
             raise HTTPException(status_code=400, detail="Order number must be unique for the financial year.")
+        await db.refresh(db_order)
     return db_order
 
 async def delete_order(db: AsyncSession, order_id: int) -> bool:
@@ -114,56 +153,52 @@ async def delete_order(db: AsyncSession, order_id: int) -> bool:
     result = await db.execute(select(Order).filter(Order.id == order_id))
     db_order = result.scalar_one_or_none()
     if db_order:
+        await crud_fulfilment.apply_fulfilment_deltas(db, crud_fulfilment.ordered_deltas_from_order(db_order, "DELETE"))
         await db.delete(db_order)
-        await db.commit()
+        await commit_or_flush(db)
         return True
     return False
 
 async def create_orders_bulk(db: AsyncSession, orders: List[OrderCreate]) -> List[Order]:
-    """Create multiple orders with automatic order number generation, ensuring unique order numbers per financial year."""
-    logger = logging.getLogger("orders-bulk")
-    created_orders = []
-    # 1. Group orders by financial year
-    fy_to_orders = defaultdict(list)
-    for order_data in orders:
-        financial_year = get_financial_year(order_data.date)
-        fy_to_orders[financial_year].append(order_data)
-    # 2. For each financial year, get the current max order number
+    """
+    Create multiple orders with automatic order number generation, ensuring unique order numbers per financial year.
+    One block of numbers is reserved per financial year, then all rows go in with one
+    INSERT ... RETURNING in payload order; their ordered quantities reach order_fulfilment with one UPSERT.
+    """
+    if not orders:
+        return []
+    # 1. Count the orders of each financial year
+    financial_years = [get_financial_year(order_data.date) for order_data in orders]
+    fy_counts = defaultdict(int)
+    for financial_year in financial_years:
+        fy_counts[financial_year] += 1
+    # 2. Reserve one block of order numbers per financial year, in a fixed order so concurrent bulks cannot deadlock
     fy_to_next_order_number = {}
-    for fy, orders_in_fy in fy_to_orders.items():
-        result = await db.execute(select(func.max(Order.order_number)).filter(Order.financial_year == fy))
-        max_order = result.scalar() or 0
-        fy_to_next_order_number[fy] = max_order + 1
-        logger.info(f"[BULK] Starting order number for FY {fy}: {fy_to_next_order_number[fy]}")
-    # 3. Assign incrementing order numbers and create orders
-    batch_order_numbers = set()
-    for order_data in orders:
-        financial_year = get_financial_year(order_data.date)
-        # Ensure uniqueness within the batch
-        while True:
-            order_number = fy_to_next_order_number[financial_year]
-            key = (financial_year, order_number)
-            if key not in batch_order_numbers:
-                batch_order_numbers.add(key)
-                break
-            fy_to_next_order_number[financial_year] += 1
-        db_order = Order(
-            order_number=order_number,
-            financial_year=financial_year,
-            **order_data.model_dump()
-        )
-        db.add(db_order)
-        created_orders.append(db_order)
+    for fy, count in sorted(fy_counts.items()):
+        fy_to_next_order_number[fy] = await reserve_order_numbers(db, fy, count)
+    # 3. Assign the reserved numbers in payload order and insert all orders at once
+    rows = []
+    for order_data, financial_year in zip(orders, financial_years):
+        rows.append({
+            "order_number": fy_to_next_order_number[financial_year],
+            "financial_year": financial_year,
+            **order_data.model_dump(),
+        })
         fy_to_next_order_number[financial_year] += 1
-        logger.info(f"[BULK] Assigned order_number={order_number} for FY={financial_year}")
     try:
-        await db.commit()
-        for order in created_orders:
-            await db.refresh(order)
+        result = await db.scalars(insert(Order).returning(Order, sort_by_parameter_order=True), rows)
     except IntegrityError as e:
         await db.rollback()
-        logger.error(f"[BULK] IntegrityError: {e}")
+        logging.getLogger("orders-bulk").error(f"[BULK] IntegrityError: {e}")
         raise HTTPException(status_code=400, detail="Order number must be unique for the financial year.")
+    created_orders = result.all()
+
+    deltas = {}
+    for db_order in created_orders:
+        crud_fulfilment.ordered_deltas_from_order(db_order, "CREATE", deltas)
+    await crud_fulfilment.apply_fulfilment_deltas(db, deltas)
+    queue_bulk_audit_logs(db, "CREATE", created_orders)
+    await commit_and_reload(db, created_orders)
     return created_orders
 
 async def delete_orders_bulk(db: AsyncSession, date: date, agency_name: Optional[str] = None, store_name: Optional[str] = None) -> int:
@@ -179,17 +214,47 @@ async def delete_orders_bulk(db: AsyncSession, date: date, agency_name: Optional
     orders_to_delete = result.scalars().all()
     deleted_count = len(orders_to_delete)
     
+    deltas = {}
     for order in orders_to_delete:
+        crud_fulfilment.ordered_deltas_from_order(order, "DELETE", deltas)
         await db.delete(order)
+    await crud_fulfilment.apply_fulfilment_deltas(db, deltas)
     
-    await db.commit()
+    await commit_or_flush(db)
     return deleted_count
 
+async def get_delivered_totals(db: AsyncSession, orders: Iterable[Order]) -> Dict[crud_fulfilment.OrderKey, Dict[str, int]]:
+    """
+    Delivered quantity per size for each (order_number, financial_year, product_id) of the given
+    orders, read from order_fulfilment in one query. Orders with no deliveries are absent.
+    """
+    fulfilment = await crud_fulfilment.get_fulfilment(db, (crud_fulfilment.order_key(order) for order in orders))
+    totals: Dict[crud_fulfilment.OrderKey, Dict[str, int]] = {}
+    for key, rows in fulfilment.items():
+        delivered = {size: row.delivered for size, row in rows.items() if row.delivered}
+        if delivered:
+            totals[key] = delivered
+    return totals
+
+def _delivery_status(rows: Dict[str, OrderFulfilment]) -> dict:
+    """Delivery status of one order from its order_fulfilment rows (size -> row)."""
+    return {
+        "fully_delivered": not any(row.pending for row in rows.values()),
+        "delivered_sizes": {size: row.delivered for size, row in rows.items() if row.delivered},
+        "pending_sizes": {size: row.pending for size, row in rows.items() if row.ordered},
+    }
+
+async def build_order_responses(db: AsyncSession, orders: List[Order]) -> List[OrderResponse]:
+    """OrderResponses with delivery status, fetching the fulfilment of all orders at once."""
+    fulfilment = await crud_fulfilment.get_fulfilment(db, (crud_fulfilment.order_key(order) for order in orders))
+    return [
+        OrderResponse.model_validate(order).model_copy(
+            update=_delivery_status(fulfilment.get(crud_fulfilment.order_key(order), {}))
+        )
+        for order in orders
+    ]
+
 async def is_fully_delivered(db: AsyncSession, order: Order) -> bool:
-    delivered_logs = await db.execute(select(SalesLog).filter(SalesLog.order_number == order.order_number, SalesLog.product_id == order.product_id))
-    delivered_logs = delivered_logs.scalars().all()
-    delivered_total = {}
-    for log in delivered_logs:
-        for size, qty in (log.sizes or {}).items():
-            delivered_total[size] = delivered_total.get(size, 0) + qty
-    return all((delivered_total.get(size, 0) >= order.sizes.get(size, 0) for size in order.sizes or {})) 
\ No newline at end of file
+    key = crud_fulfilment.order_key(order)
+    fulfilment = await crud_fulfilment.get_fulfilment(db, [key])
+    return _delivery_status(fulfilment.get(key, {}))["fully_delivered"]
@@ -1,16 +1,19 @@
 from app.models.pending_order import PendingOrder
-from app.schemas.pending_order import PendingOrderCreate, PendingOrderUpdate
+from app.schemas.pending_order import PendingOrderCreate, PendingOrderUpdate, PendingOrderResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
-from typing import List, Optional
+from sqlalchemy import select, func, insert
+from typing import AsyncIterator, List, Optional
 from datetime import date, datetime
 from app.core.crud.sales import create_sales_log
 from app.schemas.sales import SalesLogCreate
 from app.models.orders import Order
-from app.models.sales import SalesLog
+from app.core.crud import order_fulfilment as crud_fulfilment
 import logging
 from app.core.crud.audit_log import create_audit_log
 from app.schemas.audit_log import AuditLogCreate
+from app.core.unit_of_work import commit_and_reload, commit_or_flush, unit_of_work
+from app.core.services.audit_logger import queue_bulk_audit_logs
+from app.config import settings
 
 async def create_pending_order(db: AsyncSession, pending_order: PendingOrderCreate, order_number: int, financial_year: str) -> PendingOrder:
     db_pending_order = PendingOrder(
@@ -19,10 +22,38 @@ async def create_pending_order(db: AsyncSession, pending_order: PendingOrderCrea
         **pending_order.model_dump()
     )
     db.add(db_pending_order)
-    await db.commit()
+    await commit_or_flush(db)
     await db.refresh(db_pending_order)
     return db_pending_order
 
+async def create_pending_orders_for(db: AsyncSession, orders: List[Order]) -> List[PendingOrder]:
+    """
+    Mirrors freshly created orders into pending_orders, keeping their order numbers.
+    All mirrors go in with one INSERT ... RETURNING, in the order of `orders`.
+    """
+    if not orders:
+        return []
+    rows = [
+        {
+            "product_id": db_order.product_id,
+            "color": db_order.color,
+            "colour_code": db_order.colour_code,
+            "sizes": db_order.sizes,
+            "date": db_order.date,
+            "agency_name": db_order.agency_name,
+            "store_name": db_order.store_name,
+            "operation": db_order.operation or "Order",
+            "order_number": db_order.order_number,
+            "financial_year": db_order.financial_year,
+        }
+        for db_order in orders
+    ]
+    result = await db.scalars(insert(PendingOrder).returning(PendingOrder, sort_by_parameter_order=True), rows)
+    pending_orders = result.all()
+    queue_bulk_audit_logs(db, "CREATE", pending_orders)
+    await commit_and_reload(db, pending_orders)
+    return pending_orders
+
 async def update_pending_order(db: AsyncSession, pending_order_id: int, pending_order: PendingOrderUpdate) -> Optional[PendingOrder]:
     result = await db.execute(select(PendingOrder).filter(PendingOrder.id == pending_order_id))
     db_pending_order = result.scalar_one_or_none()
@@ -30,7 +61,7 @@ async def update_pending_order(db: AsyncSession, pending_order_id: int, pending_
         update_data = pending_order.model_dump(exclude_unset=True)
         for field, value in update_data.items():
             setattr(db_pending_order, field, value)
-        await db.commit()
+        await commit_or_flush(db)
         await db.refresh(db_pending_order)
     return db_pending_order
 
@@ -39,7 +70,7 @@ async def delete_pending_order(db: AsyncSession, pending_order_id: int) -> bool:
     db_pending_order = result.scalar_one_or_none()
     if db_pending_order:
         await db.delete(db_pending_order)
-        await db.commit()
+        await commit_or_flush(db)
         return True
     return False
 
@@ -49,107 +80,117 @@ async def get_pending_orders(db: AsyncSession, product_id: int, skip: int = 0, l
     )
     return result.scalars().all()
 
+async def stream_pending_orders(db: AsyncSession, product_id: Optional[int] = None) -> AsyncIterator[PendingOrderResponse]:
+    """Yields pending orders (of every product when product_id is None) in id order, settings.NDJSON_YIELD_PER rows per round trip."""
+    query = select(PendingOrder).order_by(PendingOrder.id)
+    if product_id is not None:
+        query = query.filter(PendingOrder.product_id == product_id)
+    result = await db.stream_scalars(query.execution_options(yield_per=settings.NDJSON_YIELD_PER))
+    async for pending_order in result:
+        yield PendingOrderResponse.model_validate(pending_order)
+
 async def get_pending_order_by_id(db: AsyncSession, pending_order_id: int) -> Optional[PendingOrder]:
     result = await db.execute(select(PendingOrder).filter(PendingOrder.id == pending_order_id))
     return result.scalar_one_or_none()
 
 async def deliver_pending_order(db: AsyncSession, pending_order: PendingOrder, delivered_sizes: dict, delivery_date: str):
-    # Calculate remaining sizes
-    original_sizes = pending_order.sizes or {}
-    delivered = {k: min(delivered_sizes.get(k, 0), original_sizes.get(k, 0)) for k in original_sizes}
-    remaining = {k: original_sizes.get(k, 0) - delivered.get(k, 0) for k in original_sizes}
-    # Remove zero or negative sizes
-    delivered = {k: v for k, v in delivered.items() if v > 0}
-    remaining = {k: v for k, v in remaining.items() if v > 0}
-    # Create sales log for delivered part
-    if delivered:
-        sales_log = SalesLogCreate(
-            product_id=pending_order.product_id,
-            color=pending_order.color,
-            colour_code=pending_order.colour_code,
-            sizes=delivered,
-            date=datetime.strptime(delivery_date, "%Y-%m-%d").date(),
-            agency_name=pending_order.agency_name,
-            store_name=pending_order.store_name,
-            operation="Sale",
-            order_number=pending_order.order_number
-        )
-        await create_sales_log(db, sales_log)
-    # After delivery, recalculate pending from order and all sales logs
-    # Fetch the order
-    result = await db.execute(select(Order).filter(Order.order_number == pending_order.order_number, Order.product_id == pending_order.product_id))
-    db_order = result.scalar_one_or_none()
-    if db_order:
-        order_sizes = db_order.sizes or {}
-        # Sum all delivered for this order
-        sales_logs = await db.execute(select(SalesLog).filter(SalesLog.order_number == db_order.order_number, SalesLog.product_id == db_order.product_id))
-        sales_logs = sales_logs.scalars().all()
-        delivered_total = {}
-        for log in sales_logs:
-            for size, qty in (log.sizes or {}).items():
-                delivered_total[size] = delivered_total.get(size, 0) + qty
-        new_pending = {}
-        for size, order_qty in order_sizes.items():
-            delivered_qty = delivered_total.get(size, 0)
-            pending_qty = order_qty - delivered_qty
-            if pending_qty > 0:
-                new_pending[size] = pending_qty
-        logger = logging.getLogger("pending-order-invariant")
-        logger.info(f"[INVARIANT-DEBUG] Order #{db_order.order_number} sizes: {order_sizes}")
-        logger.info(f"[INVARIANT-DEBUG] Delivered totals: {delivered_total}")
-        logger.info(f"[INVARIANT-DEBUG] New pending: {new_pending}")
-        # --- AUDIT LOG for delivery ---
-        await create_audit_log(
-            db,
-            AuditLogCreate(
-                user_id=None,  # You can pass user info if available
-                username="system",
-                action="DELIVER_PENDING_ORDER",
-                entity="PendingOrder",
-                entity_id=pending_order.id,
-                field_changed=None,
-                old_value=str(original_sizes),
-                new_value=str(delivered),
+    """Delivers part or all of a pending order as one sales log, in one transaction."""
+    async with unit_of_work(db):
+        # Calculate remaining sizes
+        original_sizes = pending_order.sizes or {}
+        delivered = {k: min(delivered_sizes.get(k, 0), original_sizes.get(k, 0)) for k in original_sizes}
+        remaining = {k: original_sizes.get(k, 0) - delivered.get(k, 0) for k in original_sizes}
+        # Remove zero or negative sizes
+        delivered = {k: v for k, v in delivered.items() if v > 0}
+        remaining = {k: v for k, v in remaining.items() if v > 0}
+        # Create sales log for delivered part
+        if delivered:
+            sales_log = SalesLogCreate(
+                product_id=pending_order.product_id,
+                color=pending_order.color,
+                colour_code=pending_order.colour_code,
+                sizes=delivered,
+                date=datetime.strptime(delivery_date, "%Y-%m-%d").date(),
+                agency_name=pending_order.agency_name,
+                store_name=pending_order.store_name,
+                operation="Sale",
+                order_number=pending_order.order_number,
+                financial_year=pending_order.financial_year,
             )
-        )
-        # ---
-        if not new_pending:
-            await db.delete(pending_order)
-            await db.commit()
-            return {"status": "delivered", "action": "removed"}
-        else:
-            pending_order.sizes = new_pending
-            await db.commit()
-            await db.refresh(pending_order)
-            return {"status": "partially_delivered", "remaining": new_pending}
-    else:
-        # If order not found, fallback to old logic
-        # --- AUDIT LOG for delivery ---
-        await create_audit_log(
-            db,
-            AuditLogCreate(
-                user_id=None,
-                username="system",
-                action="DELIVER_PENDING_ORDER",
-                entity="PendingOrder",
-                entity_id=pending_order.id,
-                field_changed=None,
-                old_value=str(original_sizes),
-                new_value=str(delivered),
+            await create_sales_log(db, sales_log)
+        # After delivery, recalculate pending from order and all sales logs
+        # Fetch the order
+        result = await db.execute(select(Order).filter(
+            Order.order_number == pending_order.order_number,
+            Order.financial_year == pending_order.financial_year,
+            Order.product_id == pending_order.product_id,
+        ))
+        db_order = result.scalar_one_or_none()
+        if db_order:
+            order_sizes = db_order.sizes or {}
+            # Delivered and still pending for this order, from the order_fulfilment table
+            key = crud_fulfilment.order_key(db_order)
+            fulfilment = (await crud_fulfilment.get_fulfilment(db, [key])).get(key, {})
+            delivered_total = {size: row.delivered for size, row in fulfilment.items() if row.delivered}
+            new_pending = {size: row.pending for size, row in fulfilment.items() if row.pending}
+            logger = logging.getLogger("pending-order-invariant")
+            logger.info(f"[INVARIANT-DEBUG] Order #{db_order.order_number} sizes: {order_sizes}")
+            logger.info(f"[INVARIANT-DEBUG] Delivered totals: {delivered_total}")
+            logger.info(f"[INVARIANT-DEBUG] New pending: {new_pending}")
+            # --- AUDIT LOG for delivery ---
+            await create_audit_log(
+                db,
+                AuditLogCreate(
+                    user_id=None,  # You can pass user info if available
+                    username="system",
+                    action="DELIVER_PENDING_ORDER",
+                    entity="PendingOrder",
+                    entity_id=pending_order.id,
+                    field_changed=None,
+                    old_value=str(original_sizes),
+                    new_value=str(delivered),
+                )
             )
-        )
-        # ---
-        if not remaining:
-            await db.delete(pending_order)
-            await db.commit()
-            return {"status": "delivered", "action": "removed"}
+            # ---
+            if not new_pending:
+                await db.delete(pending_order)
+                await commit_or_flush(db)
+                return {"status": "delivered", "action": "removed"}
+            else:
+                pending_order.sizes = new_pending
+                await commit_or_flush(db)
+                return {"status": "partially_delivered", "remaining": new_pending}
         else:
-            pending_order.sizes = remaining
-            await db.commit()
-            await db.refresh(pending_order)
-            return {"status": "partially_delivered", "remaining": remaining}
+            # If order not found, fallback to old logic
+            # --- AUDIT LOG for delivery ---
+            await create_audit_log(
+                db,
+                AuditLogCreate(
+                    user_id=None,
+                    username="system",
+                    action="DELIVER_PENDING_ORDER",
+                    entity="PendingOrder",
+                    entity_id=pending_order.id,
+                    field_changed=None,
+                    old_value=str(original_sizes),
+                    new_value=str(delivered),
+                )
+            )
+            # ---
+            if not remaining:
+                await db.delete(pending_order)
+                await commit_or_flush(db)
+                return {"status": "delivered", "action": "removed"}
+            else:
+                pending_order.sizes = remaining
+                await commit_or_flush(db)
+                return {"status": "partially_delivered", "remaining": remaining}
 
-async def get_all_pending_orders(db: AsyncSession):
-    result = await db.execute(select(PendingOrder))
+async def get_all_pending_orders(db: AsyncSession, skip: int = 0, limit: Optional[int] = None):
+    """Pending orders of every product in id order; all of them unless limit is given."""
+    query = select(PendingOrder).order_by(PendingOrder.id).offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    result = await db.execute(query)
     orders = result.scalars().all()
     return orders 
\ No newline at end of file
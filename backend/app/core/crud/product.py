@@ -3,6 +3,7 @@ from sqlalchemy import select
 from typing import List, Optional
 from ...models.product import Product
 from ...schemas.product import ProductCreate, ProductUpdate
+from ..services.stock_cache import mark_stock_dirty
 
 async def create_product(db: AsyncSession, product: ProductCreate) -> Product:
     db_product = Product(**product.model_dump())
@@ -29,6 +30,7 @@ async def update_product(db: AsyncSession, product_id: int, product: ProductUpda
     for field, value in update_data.items():
         setattr(db_product, field, value)
     
+    mark_stock_dirty(db, [product_id])
     await db.commit()
     await db.refresh(db_product)
     return db_product
@@ -39,5 +41,6 @@ async def delete_product(db: AsyncSession, product_id: int) -> bool:
         return False
     
     await db.delete(db_product)
+    mark_stock_dirty(db, [product_id])
     await db.commit()
     return True 
\ No newline at end of file
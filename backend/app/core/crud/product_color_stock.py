@@ -1,97 +1,193 @@
-import asyncio
+from collections import defaultdict
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from app.models.product_color_stock import ProductColorStock
-from app.schemas.product_color_stock import ProductColorStockCreate, ProductColorStockUpdate
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models.product_size_stock import ProductSizeStock
+from app.models.stock_snapshot import StockSnapshot
 from app.models.inward import InwardLog, InwardCategory
 from app.models.sales import SalesLog
+from app.config import settings
+from app.core.unit_of_work import commit_or_flush
+from app.core.services.stock_cache import mark_stock_dirty
+from app.core.services.stock_events import record_stock_deltas
 
-class CRUDProductColorStock:
-    async def get_by_product_id(self, db: AsyncSession, *, product_id: int) -> list[ProductColorStock]:
-        statement = select(ProductColorStock).where(ProductColorStock.product_id == product_id)
-        return (await db.execute(statement)).scalars().all()
+def stock_key(product_id: int, color: str, colour_code: int | None, size: str) -> tuple:
+    """Key of a row in product_size_stocks; a missing colour code is stored as 0."""
+    return (product_id, color, colour_code or 0, size)
 
-    async def get_by_product_and_color(self, db: AsyncSession, *, product_id: int, color: str, colour_code: int | None = None) -> ProductColorStock | None:
-        statement = select(ProductColorStock).where(ProductColorStock.product_id == product_id, ProductColorStock.color == color)
-        if colour_code is not None:
-            statement = statement.where(ProductColorStock.colour_code == colour_code)
-        return (await db.execute(statement)).scalar_one_or_none()
+def inward_sign(category) -> int:
+    """Supplies add to stock, returns to the supplier take it away."""
+    return 1 if category == InwardCategory.SUPPLY else -1
 
-    async def create_or_update(self, db: AsyncSession, *, product_id: int, color: str, quantity_change: int, colour_code: int | None = None) -> ProductColorStock:
-        # Lock to prevent race conditions
-        async with asyncio.Lock():
-            # Check if a record already exists
-            existing_stock = await self.get_by_product_and_color(db, product_id=product_id, color=color, colour_code=colour_code)
+def accumulate_stock_deltas(deltas: dict, *, product_id: int, color: str, colour_code: int | None, sizes: dict | None, sign: int) -> dict:
+    """Adds sign * qty for every size in `sizes` to `deltas` and returns it."""
+    if not isinstance(sizes, dict):
+        return deltas
+    for size, qty in sizes.items():
+        if not qty:
+            continue
+        key = stock_key(product_id, color, colour_code, size)
+        deltas[key] = deltas.get(key, 0) + sign * qty
+    return deltas
 
-            if existing_stock:
-                # Update the stock
-                existing_stock.total_stock += quantity_change
-                db.add(existing_stock)
-                await db.commit()
-                await db.refresh(existing_stock)
-                return existing_stock
-            else:
-                # Create a new record
-                new_stock = ProductColorStock(
-                    product_id=product_id,
-                    color=color,
-                    total_stock=quantity_change,
-                    colour_code=colour_code
-                )
-                db.add(new_stock)
-                await db.commit()
-                await db.refresh(new_stock)
-                return new_stock
+def stock_deltas_from_log(log: InwardLog | SalesLog, operation: str, deltas: dict | None = None) -> dict:
+    """
+    Returns the per-size stock changes caused by creating or deleting a log.
+    :param log: The InwardLog or SalesLog instance.
+    :param operation: 'CREATE' or 'DELETE'.
+    :param deltas: Optional dict to accumulate into, so a batch of logs collapses to one delta per key.
+    """
+    if deltas is None:
+        deltas = defaultdict(int)
+    if isinstance(log, InwardLog):
+        sign = inward_sign(getattr(log, 'category', None))
+    elif isinstance(log, SalesLog):
+        sign = -1
+    else:
+        return deltas
+    if operation == 'DELETE':
+        sign = -sign
+    return accumulate_stock_deltas(
+        deltas,
+        product_id=log.product_id,
+        color=log.color,
+        colour_code=log.colour_code,
+        sizes=log.sizes,
+        sign=sign,
+    )
 
-async def get_stock_by_product_and_color(db: AsyncSession, product_id: int, color: str, colour_code: int | None = None):
-    statement = select(ProductColorStock).filter_by(product_id=product_id, color=color)
-    if colour_code is not None:
-        statement = statement.filter(ProductColorStock.colour_code == colour_code)
-    result = await db.execute(statement)
-    return result.scalars().all()
+def _upsert_for(db: AsyncSession):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert
+    if dialect == "sqlite":
+        return sqlite.insert
+    raise NotImplementedError(f"Upsert is not supported on {dialect}")
+
+async def lock_stock_variants(db: AsyncSession, keys, mode: str | None = None) -> None:
+    """
+    Serializes transactions touching the same stock variants, according to STOCK_LOCK_MODE.
+    keys are stock keys; called from apply_stock_deltas, the single writer of product_size_stocks.
+    Locks are always taken in sorted order so two writers cannot deadlock, and are
+    released when the transaction ends.
+    - none: no explicit locks; the UPSERT increment alone already prevents lost updates.
+    - row: SELECT ... FOR UPDATE on the existing product_size_stocks rows.
+    - advisory: pg_advisory_xact_lock(product_id, hashtext(color)); also covers rows
+      that do not exist yet. Ignored outside PostgreSQL.
+    """
+    mode = mode or settings.STOCK_LOCK_MODE
+    if mode == "none" or not keys:
+        return
+    if mode == "row":
+        variant = tuple_(
+            ProductSizeStock.product_id, ProductSizeStock.color, ProductSizeStock.colour_code, ProductSizeStock.size
+        )
+        await db.execute(
+            select(ProductSizeStock.id)
+            .where(variant.in_(sorted(keys)))
+            .order_by(ProductSizeStock.product_id, ProductSizeStock.color, ProductSizeStock.colour_code, ProductSizeStock.size)
+            .with_for_update()
+        )
+    elif mode == "advisory":
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        for product_id, color in sorted({(key[0], key[1]) for key in keys}):
+            await db.execute(select(func.pg_advisory_xact_lock(product_id, func.hashtext(color))))
+    else:
+        raise ValueError(f"Unknown STOCK_LOCK_MODE: {mode}")
+
+async def apply_stock_deltas(db: AsyncSession, deltas: dict) -> None:
+    """
+    Applies aggregated stock deltas with a single INSERT ... ON CONFLICT DO UPDATE.
+    The increment happens inside the database, so concurrent writers never lose updates;
+    STOCK_LOCK_MODE can additionally lock the variants for the rest of the transaction.
+    Does not commit; the caller owns the transaction.
+    """
+    mark_stock_dirty(db, (product_id for product_id, _, _, _ in deltas))
+    rows = [
+        {"product_id": product_id, "color": color, "colour_code": colour_code, "size": size, "qty": qty}
+        for (product_id, color, colour_code, size), qty in sorted(deltas.items()) if qty
+    ]
+    if not rows:
+        return
+    record_stock_deltas(db, deltas)
+    await lock_stock_variants(db, [key for key, qty in deltas.items() if qty])
+    insert = _upsert_for(db)
+    statement = insert(ProductSizeStock).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[
+            ProductSizeStock.product_id,
+            ProductSizeStock.color,
+            ProductSizeStock.colour_code,
+            ProductSizeStock.size,
+        ],
+        set_={"qty": ProductSizeStock.qty + statement.excluded.qty},
+    )
+    await db.execute(statement)
+
+async def update_snapshots_from_logs(db: AsyncSession, logs, operation: str) -> None:
+    """
+    Folds logs dated on or before existing stock snapshots into every snapshot taken on or after
+    their date, with one UPSERT, so as_of reads stay equal to a full replay of the logs.
+    Runs in the caller's transaction; logs dated after the latest snapshot, the usual case,
+    cost a single indexed query.
+    """
+    logs = [log for log in logs if isinstance(getattr(log, 'sizes', None), dict)]
+    if not logs:
+        return
+    result = await db.execute(
+        select(StockSnapshot.snapshot_date).where(StockSnapshot.snapshot_date >= min(log.date for log in logs)).distinct()
+    )
+    snapshot_dates = sorted(result.scalars())
+    if not snapshot_dates:
+        return
+    deltas = defaultdict(int)
+    for log in logs:
+        later_dates = [snapshot_date for snapshot_date in snapshot_dates if snapshot_date >= log.date]
+        for (product_id, color, colour_code, size), qty in stock_deltas_from_log(log, operation).items():
+            for snapshot_date in later_dates:
+                deltas[(product_id, snapshot_date, color, colour_code, size)] += qty
+    rows = [
+        {"product_id": product_id, "snapshot_date": snapshot_date, "color": color, "colour_code": colour_code, "size": size, "qty": qty}
+        for (product_id, snapshot_date, color, colour_code, size), qty in sorted(deltas.items()) if qty
+    ]
+    if not rows:
+        return
+    insert = _upsert_for(db)
+    statement = insert(StockSnapshot).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=[
+            StockSnapshot.product_id,
+            StockSnapshot.snapshot_date,
+            StockSnapshot.color,
+            StockSnapshot.colour_code,
+            StockSnapshot.size,
+        ],
+        set_={"qty": StockSnapshot.qty + statement.excluded.qty},
+    )
+    await db.execute(statement)
 
 async def update_stock_from_log(db: AsyncSession, log: InwardLog | SalesLog, operation: str, colour_code: int | None = None):
     """
-    Updates the total stock for a given product and color based on an inward or sales log with sizes mapping.
-    For each size in log.sizes, update the stock accordingly.
+    Updates the per-size stock for a given product and color based on an inward or sales log with sizes mapping.
+    All sizes of the log are written with one UPSERT statement, and a back-dated log is folded
+    into the stock snapshots taken since. Does not commit, so the log itself can still be read
+    afterwards; the caller commits it together with the stock.
     :param db: The database session.
     :param log: The InwardLog or SalesLog instance.
     :param operation: 'CREATE' or 'DELETE'.
+    :param colour_code: Unused; kept for old callers. The log's own colour code keys the stock row.
     """
+    mark_stock_dirty(db, [log.product_id])
     if not hasattr(log, 'sizes') or not isinstance(log.sizes, dict):
         return
-    for size, qty in log.sizes.items():
-        # Determine the sign of the quantity change
-        if isinstance(log, InwardLog):
-            if hasattr(log, 'category') and getattr(log, 'category', None) == InwardCategory.SUPPLY:
-                quantity_change = qty
-            else:
-                quantity_change = -qty
-        elif isinstance(log, SalesLog):
-            quantity_change = -qty
-        else:
-            continue
-        if operation == 'DELETE':
-            quantity_change = -quantity_change
-        # Stock is tracked per product/color/size/colour_code
-        stock_entries = await get_stock_by_product_and_color(db, log.product_id, log.color, colour_code)
-        if stock_entries:
-            # Update the first entry (or you could distribute across all, or always create new)
-            stock_entry = stock_entries[0]
-            if not hasattr(stock_entry, 'sizes') or not isinstance(stock_entry.sizes, dict):
-                stock_entry.sizes = {}
-            stock_entry.sizes[size] = stock_entry.sizes.get(size, 0) + quantity_change
-            db.add(stock_entry)
-        else:
-            # Create a new record with sizes dict
-            stock_entry = ProductColorStock(
-                product_id=log.product_id,
-                color=log.color,
-                sizes={size: quantity_change},
-                colour_code=colour_code
-            )
-            db.add(stock_entry)
-    await db.commit()
+    await apply_stock_deltas(db, stock_deltas_from_log(log, operation))
+    await update_snapshots_from_logs(db, [log], operation)
+
+async def get_size_stocks_by_product(db: AsyncSession, product_id: int) -> list[ProductSizeStock]:
+    # Rows are written by Core UPSERTs, so always reload instead of trusting the identity map
+    statement = select(ProductSizeStock).where(ProductSizeStock.product_id == product_id).execution_options(populate_existing=True)
+    return (await db.execute(statement)).scalars().all()
 
 # Alias for clarity from old code
 crud_product_color_stock = {
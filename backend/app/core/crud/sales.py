@@ -1,9 +1,18 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from fastapi import HTTPException
+from sqlalchemy import select, delete, insert, tuple_
 from ...models.sales import SalesLog
+from ...models.product import Product
+from ...models.orders import Order
 from ...schemas.sales import SalesLogCreate, SalesLogUpdate, SalesLog as SalesLogSchema
 from . import product_color_stock as crud_stock
-from typing import Optional, List
+from . import order_fulfilment as crud_fulfilment
+from .orders import get_financial_year
+from ..unit_of_work import commit_or_flush
+from ..services.audit_logger import queue_bulk_audit_logs
+from ..services.stock_cache import mark_stock_dirty
+from ...config import settings
+from typing import AsyncIterator, Optional, List, Sequence
 from datetime import datetime
 
 def sa_obj_to_dict(obj):
@@ -19,13 +28,16 @@ def sa_obj_to_dict(obj):
             "store_name": obj.store_name,
             "operation": obj.operation,
             "order_number": getattr(obj, 'order_number', None),
+            "financial_year": getattr(obj, 'financial_year', None),
         }
         return data
     except Exception:
         return {"id": getattr(obj, 'id', None)}
 
-async def get_sales_logs_by_product(db: AsyncSession, product_id: int, start_date: Optional[str] = None, end_date: Optional[str] = None, agency_name: Optional[str] = None, store_name: Optional[str] = None):
-    query = select(SalesLog).filter(SalesLog.product_id == product_id)
+def _sales_logs_query(product_id: Optional[int], start_date: Optional[str] = None, end_date: Optional[str] = None, agency_name: Optional[str] = None, store_name: Optional[str] = None):
+    query = select(SalesLog)
+    if product_id is not None:
+        query = query.filter(SalesLog.product_id == product_id)
     if start_date:
         query = query.filter(SalesLog.date >= datetime.strptime(start_date, '%Y-%m-%d').date())
     if end_date:
@@ -34,10 +46,54 @@ async def get_sales_logs_by_product(db: AsyncSession, product_id: int, start_dat
         query = query.filter(SalesLog.agency_name.ilike(f'%{agency_name}%'))
     if store_name:
         query = query.filter(SalesLog.store_name.ilike(f'%{store_name}%'))
+    return query.order_by(SalesLog.date, SalesLog.id)
+
+async def get_sales_logs_by_product(db: AsyncSession, product_id: int, start_date: Optional[str] = None, end_date: Optional[str] = None, agency_name: Optional[str] = None, store_name: Optional[str] = None):
+    query = _sales_logs_query(product_id, start_date, end_date, agency_name=agency_name, store_name=store_name)
     result = await db.execute(query)
     logs = result.scalars().all()
     return [SalesLogSchema.model_validate(sa_obj_to_dict(log)) for log in logs]
 
+# Columns of the SalesLog schema, for reads that skip the ORM and Pydantic
+SALES_LOG_COLUMNS = (
+    SalesLog.id, SalesLog.product_id, SalesLog.color, SalesLog.colour_code, SalesLog.sizes, SalesLog.date,
+    SalesLog.agency_name, SalesLog.store_name, SalesLog.operation, SalesLog.order_number, SalesLog.financial_year,
+)
+
+async def get_sales_log_rows(db: AsyncSession, product_id: Optional[int], start_date: Optional[str] = None, end_date: Optional[str] = None, agency_name: Optional[str] = None, store_name: Optional[str] = None, max_rows: Optional[int] = None) -> List[dict]:
+    """
+    get_sales_logs_by_product (every product when product_id is None) as plain dicts built
+    from column tuples, with no ORM instances or schema validation; for responses encoded
+    straight to JSON. At most max_rows rows are read when it is given.
+    """
+    query = _sales_logs_query(product_id, start_date, end_date, agency_name=agency_name, store_name=store_name).with_only_columns(*SALES_LOG_COLUMNS)
+    if max_rows is not None:
+        query = query.limit(max_rows)
+    result = await db.execute(query)
+    return [row._asdict() for row in result]
+
+async def get_sales_logs_page(db: AsyncSession, product_id: Optional[int], limit: int, after: Optional[tuple] = None, start_date: Optional[str] = None, end_date: Optional[str] = None, agency_name: Optional[str] = None, store_name: Optional[str] = None):
+    """
+    One page of get_sales_logs_by_product (every product when product_id is None), ordered by (date, id).
+    after is the (date, id) of the last log already returned. Returns (logs, has_more).
+    """
+    query = _sales_logs_query(product_id, start_date, end_date, agency_name=agency_name, store_name=store_name)
+    if after is not None:
+        query = query.filter(tuple_(SalesLog.date, SalesLog.id) > tuple_(*after))
+    result = await db.execute(query.limit(limit + 1))
+    logs = result.scalars().all()
+    return [SalesLogSchema.model_validate(sa_obj_to_dict(log)) for log in logs[:limit]], len(logs) > limit
+
+async def stream_sales_logs(db: AsyncSession, product_id: Optional[int] = None, start_date: Optional[str] = None, end_date: Optional[str] = None, agency_name: Optional[str] = None, store_name: Optional[str] = None) -> AsyncIterator[SalesLogSchema]:
+    """
+    Yields the logs of get_sales_logs_by_product (of every product when product_id is None)
+    one at a time, fetching settings.NDJSON_YIELD_PER rows per round trip.
+    """
+    query = _sales_logs_query(product_id, start_date, end_date, agency_name=agency_name, store_name=store_name)
+    result = await db.stream_scalars(query.execution_options(yield_per=settings.NDJSON_YIELD_PER))
+    async for log in result:
+        yield SalesLogSchema.model_validate(sa_obj_to_dict(log))
+
 async def get_last_sales_log_by_date_and_store(db: AsyncSession, product_id: int, date: str, store_name: str):
     """Get the last (most recent) sales log entry for a specific date and store"""
     query = select(SalesLog).filter(
@@ -52,67 +108,132 @@ async def get_last_sales_log_by_date_and_store(db: AsyncSession, product_id: int
         return [SalesLogSchema.model_validate(sa_obj_to_dict(log))]
     return []
 
+async def order_financial_years(db: AsyncSession, sales_logs: Sequence) -> List[Optional[str]]:
+    """
+    Financial year of the order each sales log delivers, in one query for the whole batch.
+    Order numbers restart every financial year, so a log without one delivers the latest order
+    with its number dated on or before the sale (else the latest one at all), falling back to
+    the sale's own financial year. Logs without an order number get None.
+    """
+    unresolved = {(log.product_id, log.order_number) for log in sales_logs if log.order_number is not None and not log.financial_year}
+    candidates = {}
+    if unresolved:
+        result = await db.execute(
+            select(Order.product_id, Order.order_number, Order.financial_year, Order.date)
+            .where(tuple_(Order.product_id, Order.order_number).in_(sorted(unresolved)))
+            .order_by(Order.date.desc(), Order.id.desc())
+        )
+        for row in result:
+            candidates.setdefault((row.product_id, row.order_number), []).append(row)
+    financial_years = []
+    for log in sales_logs:
+        if log.order_number is None or log.financial_year:
+            financial_years.append(log.financial_year if log.order_number is not None else None)
+            continue
+        orders = candidates.get((log.product_id, log.order_number), [])
+        match = next((order for order in orders if order.date <= log.date), orders[0] if orders else None)
+        financial_years.append(match.financial_year if match else get_financial_year(log.date))
+    return financial_years
+
 async def create_sales_log(db: AsyncSession, sales_log: SalesLogCreate):
     print("[SALES-LOG-DEBUG] Incoming payload:", sales_log.model_dump())
     data = sales_log.model_dump()
     data["sizes"] = dict(data.get("sizes") or {})  # Ensure plain dict, not None
+    [data["financial_year"]] = await order_financial_years(db, [sales_log])
     db_sales_log = SalesLog(**data)
     db.add(db_sales_log)
-    await db.commit()
+    await crud_stock.update_stock_from_log(db, db_sales_log, "CREATE")
+    await crud_fulfilment.apply_fulfilment_deltas(db, crud_fulfilment.delivered_deltas_from_log(db_sales_log, "CREATE"))
+    await commit_or_flush(db)
     await db.refresh(db_sales_log)
     print("[SALES-LOG-DEBUG] Saved DB object:", sa_obj_to_dict(db_sales_log))
     print("[SALES-LOG-DEBUG] Saved sizes:", db_sales_log.sizes)
-    await crud_stock.update_stock_from_log(db, db_sales_log, "CREATE")
-    # Convert to dict immediately after refresh
-    log_dict = sa_obj_to_dict(db_sales_log)
-    return SalesLogSchema.model_validate(log_dict)
-
-async def create_sales_logs_bulk(db: AsyncSession, sales_logs: List[SalesLogCreate]):
-    """Create multiple sales log entries in a single transaction"""
-    created_logs = []
-    for sales_log in sales_logs:
+    return SalesLogSchema.model_validate(sa_obj_to_dict(db_sales_log))
+
+async def validate_sales_logs(db: AsyncSession, sales_logs: List[SalesLogCreate], product_id: Optional[int] = None) -> List[str]:
+    """
+    Checks a whole sales payload up front and returns one message per problem.
+    Products are looked up with a single query.
+    """
+    errors = []
+    product_ids = {sales_log.product_id for sales_log in sales_logs}
+    result = await db.execute(select(Product.id).where(Product.id.in_(product_ids)))
+    missing = product_ids - set(result.scalars().all())
+    for index, sales_log in enumerate(sales_logs):
+        if product_id is not None and sales_log.product_id != product_id:
+            errors.append(f"Entry {index}: product ID mismatch")
+        elif sales_log.product_id in missing:
+            errors.append(f"Entry {index}: product {sales_log.product_id} not found")
+        negative = [size for size, qty in (sales_log.sizes or {}).items() if qty < 0]
+        if negative:
+            errors.append(f"Entry {index}: negative quantity for size {', '.join(negative)}")
+    return errors
+
+async def create_sales_logs_bulk(db: AsyncSession, sales_logs: List[SalesLogCreate], product_id: Optional[int] = None):
+    """
+    Create multiple sales log entries in a single transaction.
+    The payload is validated as a whole first (422 listing every bad entry, nothing written).
+    Rows then go in with one INSERT ... RETURNING, and the stock deltas of the batch are
+    summed per (product, color, colour_code, size) and applied with one UPSERT.
+    """
+    if not sales_logs:
+        return []
+    errors = await validate_sales_logs(db, sales_logs, product_id=product_id)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+    rows = []
+    for sales_log, financial_year in zip(sales_logs, await order_financial_years(db, sales_logs)):
         data = sales_log.model_dump()
         data["sizes"] = dict(data.get("sizes") or {})  # Ensure plain dict, not None
-        db_sales_log = SalesLog(**data)
-        db.add(db_sales_log)
-        created_logs.append(db_sales_log)
-    
-    await db.commit()
-    
-    # Refresh all created logs and update stock
+        data["financial_year"] = financial_year
+        rows.append(data)
+    result = await db.scalars(insert(SalesLog).returning(SalesLog, sort_by_parameter_order=True), rows)
+    created_logs = result.all()
+
+    deltas, delivered = {}, {}
     for db_sales_log in created_logs:
-        await db.refresh(db_sales_log)
-        await crud_stock.update_stock_from_log(db, db_sales_log, "CREATE")
-    
-    return [SalesLogSchema.model_validate(sa_obj_to_dict(log)) for log in created_logs]
+        crud_stock.stock_deltas_from_log(db_sales_log, "CREATE", deltas)
+        crud_fulfilment.delivered_deltas_from_log(db_sales_log, "CREATE", delivered)
+    await crud_stock.apply_stock_deltas(db, deltas)
+    await crud_stock.update_snapshots_from_logs(db, created_logs, "CREATE")
+    # Cached listings include the log rows, so even all-zero logs invalidate them
+    mark_stock_dirty(db, (log.product_id for log in created_logs))
+    await crud_fulfilment.apply_fulfilment_deltas(db, delivered)
+    queue_bulk_audit_logs(db, "CREATE", created_logs)
+    response = [SalesLogSchema.model_validate(sa_obj_to_dict(log)) for log in created_logs]
+    await commit_or_flush(db)
+    return response
 
 async def delete_sales_logs_bulk(db: AsyncSession, product_id: int, date: Optional[str] = None, store_name: Optional[str] = None):
-    """Delete multiple sales log entries based on criteria"""
-    # First, get the logs to be deleted for stock update
-    query = select(SalesLog).filter(SalesLog.product_id == product_id)
-    if date:
-        query = query.filter(SalesLog.date == datetime.strptime(date, '%Y-%m-%d').date())
-    if store_name:
-        query = query.filter(SalesLog.store_name.ilike(f'%{store_name}%'))
-    
-    result = await db.execute(query)
-    logs_to_delete = result.scalars().all()
-    
-    # Update stock for each log before deletion
-    for log in logs_to_delete:
-        await crud_stock.update_stock_from_log(db, log, "DELETE")
-    
-    # Delete the logs
+    """
+    Delete multiple sales log entries based on criteria.
+    One DELETE ... RETURNING removes the rows and hands back what is needed to reverse
+    their stock, which is applied with one UPSERT in the same transaction.
+    """
     delete_query = delete(SalesLog).filter(SalesLog.product_id == product_id)
     if date:
         delete_query = delete_query.filter(SalesLog.date == datetime.strptime(date, '%Y-%m-%d').date())
     if store_name:
         delete_query = delete_query.filter(SalesLog.store_name.ilike(f'%{store_name}%'))
-    
-    result = await db.execute(delete_query)
-    await db.commit()
-    
-    return len(logs_to_delete)
+
+    result = await db.scalars(
+        delete_query.returning(SalesLog).execution_options(synchronize_session=False)
+    )
+    deleted_logs = result.all()
+
+    deltas, delivered = {}, {}
+    for log in deleted_logs:
+        crud_stock.stock_deltas_from_log(log, "DELETE", deltas)
+        crud_fulfilment.delivered_deltas_from_log(log, "DELETE", delivered)
+    await crud_stock.apply_stock_deltas(db, deltas)
+    await crud_stock.update_snapshots_from_logs(db, deleted_logs, "DELETE")
+    mark_stock_dirty(db, (log.product_id for log in deleted_logs))
+    await crud_fulfilment.apply_fulfilment_deltas(db, delivered)
+    queue_bulk_audit_logs(db, "DELETE", deleted_logs)
+    await commit_or_flush(db)
+
+    return len(deleted_logs)
 
 async def update_sales_log(db: AsyncSession, log_id: int, sales_log: SalesLogUpdate):
     print(f"[SALES-LOG-DEBUG] Update payload for log_id={log_id}:", sales_log.model_dump())
@@ -120,18 +241,21 @@ async def update_sales_log(db: AsyncSession, log_id: int, sales_log: SalesLogUpd
     db_sales_log = result.scalar_one_or_none()
     if db_sales_log:
         await crud_stock.update_stock_from_log(db, db_sales_log, "DELETE")
+        delivered = crud_fulfilment.delivered_deltas_from_log(db_sales_log, "DELETE")
         update_data = sales_log.model_dump(exclude_unset=True)
+        if "financial_year" not in update_data and update_data.keys() & {"order_number", "product_id", "date"}:
+            update_data["financial_year"] = None
         for key, value in update_data.items():
             setattr(db_sales_log, key, value)
-        await db.flush()
-        print(f"[SALES-LOG-DEBUG] DB object after update for log_id={log_id}:", sa_obj_to_dict(db_sales_log))
-        print(f"[SALES-LOG-DEBUG] Updated sizes for log_id={log_id}:", db_sales_log.sizes)
+        [db_sales_log.financial_year] = await order_financial_years(db, [db_sales_log])
+        crud_fulfilment.delivered_deltas_from_log(db_sales_log, "CREATE", delivered)
+        await crud_fulfilment.apply_fulfilment_deltas(db, delivered)
         await crud_stock.update_stock_from_log(db, db_sales_log, "CREATE")
-        await db.commit()
+        await commit_or_flush(db)
         await db.refresh(db_sales_log)
-        # Convert to dict immediately after refresh
-        log_dict = sa_obj_to_dict(db_sales_log)
-        return SalesLogSchema.model_validate(log_dict)
+        print(f"[SALES-LOG-DEBUG] DB object after update for log_id={log_id}:", sa_obj_to_dict(db_sales_log))
+        print(f"[SALES-LOG-DEBUG] Updated sizes for log_id={log_id}:", db_sales_log.sizes)
+        return SalesLogSchema.model_validate(sa_obj_to_dict(db_sales_log))
     return None
 
 async def delete_sales_log(db: AsyncSession, log_id: int):
@@ -141,8 +265,9 @@ async def delete_sales_log(db: AsyncSession, log_id: int):
         # Convert to dict before deletion
         log_dict = sa_obj_to_dict(db_sales_log)
         await crud_stock.update_stock_from_log(db, db_sales_log, "DELETE")
+        await crud_fulfilment.apply_fulfilment_deltas(db, crud_fulfilment.delivered_deltas_from_log(db_sales_log, "DELETE"))
         await db.delete(db_sales_log)
-        await db.commit()
+        await commit_or_flush(db)
         return SalesLogSchema.model_validate(log_dict)
     return None
 
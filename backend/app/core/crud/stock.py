@@ -0,0 +1,256 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, func, case, cast, union_all, true, literal, tuple_, Integer
+from typing import Iterable, Optional, AsyncIterator
+from datetime import date
+from app.models.product import Product
+from app.models.product_size_stock import ProductSizeStock
+from app.models.inward import InwardLog, InwardCategory
+from app.models.sales import SalesLog
+from .inward import get_inward_logs_by_product
+from .sales import get_sales_logs_by_product
+
+def empty_stock_matrix(product: Product) -> dict:
+    return {color['color']: {size: 0 for size in product.sizes} for color in product.colors}
+
+def build_stock_matrix(product: Product, rows: Iterable) -> dict:
+    """
+    Builds the color -> size -> qty matrix for a product from (color, size, qty) rows.
+    Colors and sizes that are not part of the product definition are ignored, and a
+    'total' is added for every color.
+    """
+    stock_matrix = empty_stock_matrix(product)
+    for color, size, qty in rows:
+        if color in stock_matrix and size in stock_matrix[color]:
+            stock_matrix[color][size] += qty or 0
+    for color, sizes in stock_matrix.items():
+        stock_matrix[color]['total'] = sum(s for s in sizes.values() if isinstance(s, (int, float)))
+    return stock_matrix
+
+async def get_stock_matrix_from_projection(db: AsyncSession, product: Product) -> dict:
+    """Reads the stock matrix from the maintained product_size_stocks ledger in one indexed query."""
+    statement = (
+        select(ProductSizeStock.color, ProductSizeStock.size, func.sum(ProductSizeStock.qty))
+        .where(ProductSizeStock.product_id == product.id)
+        .group_by(ProductSizeStock.color, ProductSizeStock.size)
+    )
+    result = await db.execute(statement)
+    return build_stock_matrix(product, result.all())
+
+async def get_products_for_stock_batch(
+    db: AsyncSession,
+    product_ids: Optional[list[int]] = None,
+    name: Optional[str] = None,
+    sku: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+) -> list[Product]:
+    """Products selected by explicit ids, or by name/SKU filter with pagination, ordered by id."""
+    statement = select(Product).order_by(Product.id)
+    if product_ids is not None:
+        statement = statement.where(Product.id.in_(product_ids))
+    else:
+        if name:
+            statement = statement.where(Product.name.ilike(f'%{name}%'))
+        if sku:
+            statement = statement.where(Product.sku.ilike(f'%{sku}%'))
+        statement = statement.offset(skip).limit(limit)
+    result = await db.execute(statement)
+    return result.scalars().all()
+
+async def iter_stock_matrices_from_projection(db: AsyncSession, products: list[Product]) -> AsyncIterator[tuple[Product, dict]]:
+    """
+    Yields (product, stock matrix) for every product, ordered by product id.
+    All ledger rows come from one grouped query that is streamed and split per product,
+    so each matrix can be emitted as soon as its rows have been read.
+    """
+    products = sorted(products, key=lambda p: p.id)
+    if not products:
+        return
+    statement = (
+        select(ProductSizeStock.product_id, ProductSizeStock.color, ProductSizeStock.size, func.sum(ProductSizeStock.qty))
+        .where(ProductSizeStock.product_id.in_([p.id for p in products]))
+        .group_by(ProductSizeStock.product_id, ProductSizeStock.color, ProductSizeStock.size)
+        .order_by(ProductSizeStock.product_id)
+    )
+    result = await db.stream(statement)
+    index = 0
+    rows = []
+    async for product_id, color, size, qty in result:
+        while products[index].id != product_id:
+            yield products[index], build_stock_matrix(products[index], rows)
+            rows = []
+            index += 1
+        rows.append((color, size, qty))
+    for product in products[index:]:
+        yield product, build_stock_matrix(product, rows)
+        rows = []
+
+def json_size_entries(db: AsyncSession, sizes_column):
+    """
+    Expands a {size: qty} JSON column into (key, value) rows with the dialect's JSON table function:
+    json_each_text on PostgreSQL, json_each on SQLite.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        expand = func.json_each_text
+    elif dialect == "sqlite":
+        expand = func.json_each
+    else:
+        raise NotImplementedError(f"JSON size expansion is not supported on {dialect}")
+    return expand(sizes_column).table_valued("key", "value").alias("size_entry")
+
+def _log_filters(model, product_ids, start_date, end_date):
+    filters = []
+    if product_ids is not None:
+        filters.append(model.product_id.in_(product_ids))
+    if start_date is not None:
+        filters.append(model.date >= start_date)
+    if end_date is not None:
+        filters.append(model.date <= end_date)
+    return filters
+
+def signed_size_movements(
+    db: AsyncSession,
+    product_ids: Optional[Iterable[int]] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+):
+    """
+    inward_logs UNION ALL sales_logs with one row per log and size, signed by effect on stock:
+    supplies are positive, supplier returns and sales are negative.
+    Columns: product_id, color, colour_code, size, qty, date.
+    """
+    if product_ids is not None:
+        product_ids = list(product_ids)
+    inward_entry = json_size_entries(db, InwardLog.sizes)
+    inward_sign = case((InwardLog.category == InwardCategory.SUPPLY, 1), else_=-1)
+    inward = (
+        select(
+            InwardLog.product_id,
+            InwardLog.color,
+            func.coalesce(InwardLog.colour_code, 0).label("colour_code"),
+            inward_entry.c.key.label("size"),
+            (inward_sign * cast(inward_entry.c.value, Integer)).label("qty"),
+            InwardLog.date,
+        )
+        .select_from(InwardLog)
+        .join(inward_entry, true())
+        .where(*_log_filters(InwardLog, product_ids, start_date, end_date))
+    )
+    sales_entry = json_size_entries(db, SalesLog.sizes)
+    sales = (
+        select(
+            SalesLog.product_id,
+            SalesLog.color,
+            func.coalesce(SalesLog.colour_code, 0).label("colour_code"),
+            sales_entry.c.key.label("size"),
+            (-cast(sales_entry.c.value, Integer)).label("qty"),
+            SalesLog.date,
+        )
+        .select_from(SalesLog)
+        .join(sales_entry, true())
+        .where(*_log_filters(SalesLog, product_ids, start_date, end_date))
+    )
+    return union_all(inward, sales).subquery("movements")
+
+async def get_stock_movements(
+    db: AsyncSession,
+    product_id: int,
+    limit: int,
+    after: Optional[tuple] = None,
+) -> tuple[list, bool]:
+    """
+    One page of the product's movement timeline: a row per log and size, ordered by
+    (date, source, log_id, size) where source is 0 for inward logs and 1 for sales logs.
+    after is the key of the last row of the previous page; pages are read with a keyset
+    condition, so the cost of a page does not grow with its depth.
+    Returns (rows, has_more). Rows carry source, log_id, date, color, colour_code, size,
+    qty (signed by effect on stock) and movement_type ("inward", "return" or "sale").
+    """
+    inward_entry = json_size_entries(db, InwardLog.sizes)
+    is_supply = InwardLog.category == InwardCategory.SUPPLY
+    inward = (
+        select(
+            literal(0).label("source"),
+            InwardLog.id.label("log_id"),
+            InwardLog.date,
+            InwardLog.color,
+            func.coalesce(InwardLog.colour_code, 0).label("colour_code"),
+            inward_entry.c.key.label("size"),
+            (case((is_supply, 1), else_=-1) * cast(inward_entry.c.value, Integer)).label("qty"),
+            case((is_supply, "inward"), else_="return").label("movement_type"),
+        )
+        .select_from(InwardLog)
+        .join(inward_entry, true())
+        .where(InwardLog.product_id == product_id)
+    )
+    sales_entry = json_size_entries(db, SalesLog.sizes)
+    sales = (
+        select(
+            literal(1).label("source"),
+            SalesLog.id.label("log_id"),
+            SalesLog.date,
+            SalesLog.color,
+            func.coalesce(SalesLog.colour_code, 0).label("colour_code"),
+            sales_entry.c.key.label("size"),
+            (-cast(sales_entry.c.value, Integer)).label("qty"),
+            literal("sale").label("movement_type"),
+        )
+        .select_from(SalesLog)
+        .join(sales_entry, true())
+        .where(SalesLog.product_id == product_id)
+    )
+    movements = union_all(inward, sales).subquery("movements")
+    order = (movements.c.date, movements.c.source, movements.c.log_id, movements.c.size)
+    statement = select(movements).order_by(*order).limit(limit + 1)
+    if after is not None:
+        statement = statement.where(tuple_(*order) > tuple_(*after))
+    rows = (await db.execute(statement)).all()
+    return rows[:limit], len(rows) > limit
+
+async def aggregate_stock_from_logs(
+    db: AsyncSession,
+    product_ids: Optional[Iterable[int]] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+) -> list:
+    """
+    Sums the signed log movements per (product_id, color, colour_code, size) inside the database.
+    Only the aggregated rows travel back to Python.
+    """
+    movements = signed_size_movements(db, product_ids, start_date, end_date)
+    statement = (
+        select(
+            movements.c.product_id,
+            movements.c.color,
+            movements.c.colour_code,
+            movements.c.size,
+            func.sum(movements.c.qty).label("qty"),
+        )
+        .group_by(movements.c.product_id, movements.c.color, movements.c.colour_code, movements.c.size)
+    )
+    result = await db.execute(statement)
+    return result.all()
+
+async def replay_stock_matrix(db: AsyncSession, product: Product) -> dict:
+    """Recomputes the stock matrix from the inward and sales logs, aggregated in SQL."""
+    rows = await aggregate_stock_from_logs(db, product_ids=[product.id])
+    return build_stock_matrix(product, ((row.color, row.size, row.qty) for row in rows))
+
+async def replay_stock_matrix_in_python(db: AsyncSession, product: Product) -> dict:
+    """
+    Recomputes the stock matrix by loading every inward and sales log of the product and folding them in Python.
+    Slow on long histories; kept as a reference implementation for replay_stock_matrix.
+    """
+    inward_logs = await get_inward_logs_by_product(db, product_id=product.id)
+    sales_logs = await get_sales_logs_by_product(db, product_id=product.id)
+
+    rows = []
+    for log in inward_logs:
+        if isinstance(log.sizes, dict):
+            sign = 1 if log.category == 'Supply' else -1
+            rows.extend((log.color, size, sign * qty) for size, qty in log.sizes.items())
+    for log in sales_logs:
+        if isinstance(log.sizes, dict):
+            rows.extend((log.color, size, -qty) for size, qty in log.sizes.items())
+    return build_stock_matrix(product, rows)
@@ -0,0 +1,66 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, insert, func
+from datetime import date, timedelta
+from typing import Optional
+from app.models.product import Product
+from app.models.stock_snapshot import StockSnapshot
+from .stock import aggregate_stock_from_logs, build_stock_matrix
+
+async def get_latest_snapshot_date(db: AsyncSession, on_or_before: date, product_id: Optional[int] = None) -> Optional[date]:
+    statement = select(func.max(StockSnapshot.snapshot_date)).where(StockSnapshot.snapshot_date <= on_or_before)
+    if product_id is not None:
+        statement = statement.where(StockSnapshot.product_id == product_id)
+    return (await db.execute(statement)).scalar()
+
+async def take_stock_snapshot(db: AsyncSession, snapshot_date: date) -> int:
+    """
+    Writes the closing stock of every product at the end of snapshot_date.
+    The previous snapshot is rolled forward with the logs dated after it, so only
+    the logs of the days in between are aggregated. Re-running for the same day replaces it.
+    Logs back-dated to on or before an existing snapshot are folded into it by the log CRUD
+    (update_snapshots_from_logs), in the same transaction as the log itself.
+    Returns the number of rows written.
+    """
+    previous_date = await get_latest_snapshot_date(db, snapshot_date - timedelta(days=1))
+    closing = {}
+    if previous_date is not None:
+        result = await db.execute(select(StockSnapshot).where(StockSnapshot.snapshot_date == previous_date))
+        for row in result.scalars():
+            closing[(row.product_id, row.color, row.colour_code, row.size)] = row.qty
+    start_date = previous_date + timedelta(days=1) if previous_date is not None else None
+    for row in await aggregate_stock_from_logs(db, start_date=start_date, end_date=snapshot_date):
+        key = (row.product_id, row.color, row.colour_code, row.size)
+        closing[key] = closing.get(key, 0) + row.qty
+
+    rows = [
+        {"product_id": product_id, "snapshot_date": snapshot_date, "color": color, "colour_code": colour_code, "size": size, "qty": qty}
+        for (product_id, color, colour_code, size), qty in closing.items() if qty
+    ]
+    await db.execute(delete(StockSnapshot).where(StockSnapshot.snapshot_date == snapshot_date))
+    if rows:
+        await db.execute(insert(StockSnapshot), rows)
+    await db.commit()
+    return len(rows)
+
+async def get_stock_matrix_as_of(db: AsyncSession, product: Product, as_of: date) -> dict:
+    """
+    Stock matrix at the end of as_of: the nearest snapshot on or before that day
+    plus the logs dated after the snapshot, up to and including as_of.
+    """
+    snapshot_date = await get_latest_snapshot_date(db, as_of, product_id=product.id)
+    rows = []
+    if snapshot_date is not None:
+        result = await db.execute(
+            select(StockSnapshot.color, StockSnapshot.size, StockSnapshot.qty)
+            .where(StockSnapshot.product_id == product.id, StockSnapshot.snapshot_date == snapshot_date)
+        )
+        rows.extend(result.all())
+    start_date = snapshot_date + timedelta(days=1) if snapshot_date is not None else None
+    deltas = await aggregate_stock_from_logs(db, product_ids=[product.id], start_date=start_date, end_date=as_of)
+    rows.extend((row.color, row.size, row.qty) for row in deltas)
+    return build_stock_matrix(product, rows)
+
+async def replay_stock_matrix_as_of(db: AsyncSession, product: Product, as_of: date) -> dict:
+    """Stock matrix at the end of as_of recomputed from every log up to that day."""
+    rows = await aggregate_stock_from_logs(db, product_ids=[product.id], end_date=as_of)
+    return build_stock_matrix(product, ((row.color, row.size, row.qty) for row in rows))
@@ -14,7 +14,6 @@ TRACKED_MODELS = (
     models.InwardLog, 
     models.SalesLog, 
     models.User, 
-    models.ProductColorStock,
     models.Order,
     models.Customer,
     models.Agency,
@@ -54,6 +53,25 @@ def safe_json(val):
     except Exception:
         return json.dumps(str(val))
 
+def queue_bulk_audit_logs(session, action: str, objects):
+    """
+    Queues audit entries for rows written by bulk INSERT/DELETE statements, which bypass
+    the flush listeners below. They are written by the before_commit listener like any other.
+    """
+    user = current_user_var.get()
+    pending = session.info.setdefault('pending_audit_logs', [])
+    for obj in objects:
+        data = json.dumps(model_to_dict(obj))
+        pending.append(schemas.AuditLogCreate(
+            user_id=user.id if user else None,
+            username=user.email if user else "system",
+            action=action,
+            entity=obj.__class__.__name__,
+            entity_id=obj.id,
+            new_value=data if action == "CREATE" else None,
+            old_value=data if action == "DELETE" else None,
+        ))
+
 def setup_audit_logging():
     @event.listens_for(Session, "after_flush")
     def after_flush(session, flush_context):
@@ -141,7 +159,6 @@ def setup_audit_logging():
     @event.listens_for(models.InwardLog, 'before_delete')
     @event.listens_for(models.SalesLog, 'before_delete')
     @event.listens_for(models.User, 'before_delete')
-    @event.listens_for(models.ProductColorStock, 'before_delete')
     @event.listens_for(models.Order, 'before_delete')
     @event.listens_for(models.Customer, 'before_delete')
     @event.listens_for(models.Agency, 'before_delete')
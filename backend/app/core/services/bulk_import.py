@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.exc import SQLAlchemyError
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.core.crud import inward as inward_crud
+from app.core.crud import sales as sales_crud
+from app.core.crud import orders as orders_crud
+from app.core.crud import pending_order as pending_order_crud
+from app.core.crud.audit_log import create_audit_log
+from app.core.logging_context import current_user_var
+from app.core.unit_of_work import unit_of_work
+from app.schemas.audit_log import AuditLogCreate
+from app.schemas.inward import InwardLogCreate
+from app.schemas.sales import SalesLogCreate
+from app.schemas.orders import OrderCreate
+from app.schemas.jobs import BulkImportJobStatus
+
+logger = logging.getLogger("bulk-import")
+
+# Errors beyond this are only counted, so a bad file cannot grow a job without bound
+MAX_REPORTED_ERRORS = 100
+
+async def _import_inward(db, rows: List[InwardLogCreate]) -> int:
+    return len(await inward_crud.create_inward_logs_bulk(db, rows))
+
+async def _import_sales(db, rows: List[SalesLogCreate]) -> int:
+    return len(await sales_crud.create_sales_logs_bulk(db, rows))
+
+async def _import_orders(db, rows: List[OrderCreate]) -> int:
+    orders = await orders_crud.create_orders_bulk(db, rows)
+    await pending_order_crud.create_pending_orders_for(db, orders)
+    return len(orders)
+
+# kind -> (row schema, audited entity, batch writer)
+IMPORTERS = {
+    "inward": (InwardLogCreate, "InwardLog", _import_inward),
+    "sales": (SalesLogCreate, "SalesLog", _import_sales),
+    "orders": (OrderCreate, "Order", _import_orders),
+}
+
+class BulkImportJob:
+    def __init__(self, kind: str, total_rows: int, user_id: int):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.user_id = user_id
+        self.status = "queued"
+        self.total_rows = total_rows
+        self.rows_done = 0
+        self.rows_failed = 0
+        self.errors: List[str] = []
+        self.created_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+
+    def add_error(self, message: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    def to_status(self) -> BulkImportJobStatus:
+        rows_per_second = None
+        if self.started_at is not None:
+            elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+            rows_per_second = round(self.rows_done / elapsed, 1) if elapsed > 0 else None
+        return BulkImportJobStatus(
+            id=self.id, kind=self.kind, status=self.status, total_rows=self.total_rows,
+            rows_done=self.rows_done, rows_failed=self.rows_failed, errors=list(self.errors),
+            rows_per_second=rows_per_second, created_at=self.created_at,
+            started_at=self.started_at, finished_at=self.finished_at,
+        )
+
+class BulkImportJobManager:
+    """
+    Runs bulk imports as background tasks of this process, at most `workers` at a time.
+    Each batch of rows is written in its own transaction, so a failing batch only loses its own rows.
+    Job state lives in memory: it is lost on restart and only visible to the worker process that accepted the job.
+    """
+
+    def __init__(self, workers: int, batch_size: int, max_jobs: int, sessionmaker=AsyncSessionLocal):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_jobs = max_jobs
+        self.sessionmaker = sessionmaker
+        self._jobs: "OrderedDict[str, BulkImportJob]" = OrderedDict()
+        self._tasks: set = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def submit(self, kind: str, rows: List[Dict[str, Any]], user, batch_size: Optional[int] = None) -> BulkImportJob:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        job = BulkImportJob(kind, len(rows), user.id)
+        self._jobs[job.id] = job
+        self._evict_finished()
+        task = asyncio.create_task(self._run(job, rows, user, batch_size or self.batch_size))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id: str) -> Optional[BulkImportJob]:
+        return self._jobs.get(job_id)
+
+    def _evict_finished(self) -> None:
+        for job_id in list(self._jobs):
+            if len(self._jobs) <= self.max_jobs:
+                break
+            if self._jobs[job_id].status in ("completed", "failed"):
+                del self._jobs[job_id]
+
+    async def _run(self, job: BulkImportJob, rows: List[Dict[str, Any]], user, batch_size: int) -> None:
+        async with self._semaphore:
+            job.status = "running"
+            job.started_at = datetime.utcnow()
+            current_user_var.set(user)
+            try:
+                for start in range(0, len(rows), batch_size):
+                    await self._run_batch(job, rows[start:start + batch_size], start, user)
+                job.status = "completed"
+            except Exception as e:
+                logger.exception(f"[BULK IMPORT] Job {job.id} failed")
+                job.add_error(f"Job aborted: {e}")
+                job.status = "failed"
+            finally:
+                job.finished_at = datetime.utcnow()
+
+    async def _run_batch(self, job: BulkImportJob, batch: List[Dict[str, Any]], offset: int, user) -> None:
+        schema, entity, write = IMPORTERS[job.kind]
+        valid = []
+        for index, row in enumerate(batch, start=offset):
+            try:
+                valid.append(schema.model_validate(row))
+            except ValidationError as e:
+                job.rows_failed += 1
+                job.add_error(f"Row {index}: " + "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+        if not valid:
+            return
+        try:
+            async with self.sessionmaker() as db:
+                async with unit_of_work(db):
+                    written = await write(db, valid)
+                    await create_audit_log(
+                        db,
+                        AuditLogCreate(
+                            user_id=user.id,
+                            username=user.email,
+                            action="BULK_CREATE",
+                            entity=entity,
+                            entity_id=0,
+                            field_changed="bulk_import_job",
+                            new_value=f"Job {job.id}: created {written} rows"
+                        )
+                    )
+            job.rows_done += written
+        except HTTPException as e:
+            detail = "; ".join(e.detail) if isinstance(e.detail, list) else e.detail
+            job.rows_failed += len(valid)
+            job.add_error(f"Rows {offset}-{offset + len(batch) - 1}: {detail}")
+        except SQLAlchemyError as e:
+            job.rows_failed += len(valid)
+            job.add_error(f"Rows {offset}-{offset + len(batch) - 1}: {getattr(e, 'orig', None) or e}")
+
+bulk_import_jobs = BulkImportJobManager(
+    workers=settings.BULK_IMPORT_WORKERS,
+    batch_size=settings.BULK_IMPORT_BATCH_SIZE,
+    max_jobs=settings.BULK_IMPORT_MAX_JOBS,
+)
@@ -0,0 +1,47 @@
+import functools
+import hashlib
+import json
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from app.core.crud import idempotency_key as idempotency_crud
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+def hash_payload(payload) -> str:
+    """Stable SHA-256 of a request body, so a reused key with a different body can be told apart."""
+    canonical = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def idempotent(payload_arg: str):
+    """
+    Replays the stored response when a route is called again with the same Idempotency-Key.
+
+    The route must declare `idempotency_key` (the header), `db` and `current_user`, and be
+    wrapped by @transactional so the key, the writes and the stored response commit together.
+    A replay only reads the stored response; the route body does not run. Reusing a key with
+    a different payload is rejected with 422. Requests without the header run as before.
+    """
+    def decorator(endpoint):
+        scope = f"{endpoint.__module__}.{endpoint.__name__}"
+
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            key = kwargs.get("idempotency_key")
+            if not key:
+                return await endpoint(*args, **kwargs)
+            db = kwargs["db"]
+            user_id = kwargs["current_user"].id
+            request_hash = hash_payload(kwargs[payload_arg])
+
+            stored = await idempotency_crud.get_idempotency_key(db, user_id, scope, key)
+            if stored is not None:
+                if stored.request_hash != request_hash:
+                    raise HTTPException(status_code=422, detail=f"{IDEMPOTENCY_HEADER} was already used with a different request body")
+                return stored.response_body
+
+            record = await idempotency_crud.reserve_idempotency_key(db, user_id, scope, key, request_hash)
+            result = await endpoint(*args, **kwargs)
+            await idempotency_crud.save_idempotent_response(db, record, jsonable_encoder(result))
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,180 @@
+import logging
+from datetime import date
+from typing import Callable, Dict, List, Sequence, Tuple
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...models.agency import Agency
+from ...models.customer import Customer
+from ...models.pending_order import PendingOrder
+from ...models.product import Product
+from ...schemas.pending_order import PendingOrderAllocation, PendingOrderAllocationResult, PendingOrderAllocationSkip
+from ...schemas.sales import SalesLogCreate
+from ..crud import sales as sales_crud
+from ..crud.product_color_stock import get_size_stocks_by_product, lock_stock_variants, stock_key
+from ..unit_of_work import commit_or_flush, unit_of_work
+
+logger = logging.getLogger("order-allocation")
+
+ALLOCATION_STRATEGIES = ("fifo", "days_of_payment")
+
+def _fifo_key(pending_order: PendingOrder) -> tuple:
+    return (pending_order.date, pending_order.order_number, pending_order.id)
+
+async def _priority_for(db: AsyncSession, strategy: str, pending_orders: Sequence[PendingOrder]) -> Callable[[PendingOrder], tuple]:
+    """
+    Sort key of a pending order under `strategy`.
+    fifo: oldest order first. days_of_payment: customers (by store, else agency) with the
+    shortest payment terms first, unknown terms last, FIFO within equal terms.
+    """
+    if strategy == "fifo":
+        return _fifo_key
+    if strategy != "days_of_payment":
+        raise ValueError(f"Unknown allocation strategy: {strategy}")
+    store_names = {p.store_name for p in pending_orders if p.store_name}
+    agency_names = {p.agency_name for p in pending_orders if p.agency_name}
+    store_terms, agency_terms = {}, {}
+    if store_names:
+        result = await db.execute(select(Customer.store_name, Customer.days_of_payment).where(Customer.store_name.in_(store_names)))
+        store_terms = dict(result.all())
+    if agency_names:
+        result = await db.execute(select(Agency.agency_name, Agency.days_of_payment).where(Agency.agency_name.in_(agency_names)))
+        agency_terms = dict(result.all())
+
+    def key(pending_order: PendingOrder) -> tuple:
+        days = store_terms.get(pending_order.store_name, agency_terms.get(pending_order.agency_name))
+        return (days is None, days or 0) + _fifo_key(pending_order)
+    return key
+
+def resolve_colour_codes(product: Product, pending_orders: Sequence[PendingOrder]) -> Tuple[Dict[int, int | None], List[PendingOrderAllocationSkip]]:
+    """
+    Colour code each pending order takes stock from, by pending order id. Stock is keyed by
+    colour code, so an order saved without one uses the code the product defines for its
+    colour; when the product has no single code for that colour the order is skipped with
+    the reason instead of being matched against the wrong stock.
+    """
+    product_codes: Dict[str, set] = {}
+    for colour in product.colors or []:
+        product_codes.setdefault(colour.get("color"), set()).add(colour.get("colour_code"))
+    codes, skipped = {}, []
+    for pending_order in pending_orders:
+        if pending_order.colour_code is not None:
+            codes[pending_order.id] = pending_order.colour_code
+            continue
+        candidates = product_codes.get(pending_order.color, set())
+        if len(candidates) == 1:
+            codes[pending_order.id] = next(iter(candidates))
+            continue
+        reason = (
+            f"No colour code and several codes defined for colour {pending_order.color}" if candidates
+            else f"No colour code and colour {pending_order.color} is not defined on the product"
+        )
+        skipped.append(PendingOrderAllocationSkip(pending_order_id=pending_order.id, order_number=pending_order.order_number, reason=reason))
+    return codes, skipped
+
+def allocate(stock: Dict[tuple, int], pending_orders: Sequence[PendingOrder], priority: Callable[[PendingOrder], tuple], colour_codes: Dict[int, int | None]) -> List[PendingOrderAllocation]:
+    """
+    Hands out `stock` (stock key -> qty, consumed in place) to the pending orders in priority
+    order, each size getting as much as is left of its variant. Orders missing from
+    `colour_codes` (see resolve_colour_codes) get nothing. Pure: nothing is read or written.
+    """
+    allocations = []
+    for pending_order in sorted(pending_orders, key=priority):
+        if pending_order.id not in colour_codes:
+            continue
+        colour_code = colour_codes[pending_order.id]
+        allocated, remaining = {}, {}
+        for size, wanted in (pending_order.sizes or {}).items():
+            if wanted <= 0:
+                continue
+            key = stock_key(pending_order.product_id, pending_order.color, colour_code, size)
+            qty = min(wanted, max(stock.get(key, 0), 0))
+            if qty:
+                allocated[size] = qty
+                stock[key] -= qty
+            if wanted > qty:
+                remaining[size] = wanted - qty
+        if allocated:
+            allocations.append(PendingOrderAllocation(
+                pending_order_id=pending_order.id,
+                order_number=pending_order.order_number,
+                color=pending_order.color,
+                colour_code=colour_code,
+                agency_name=pending_order.agency_name,
+                store_name=pending_order.store_name,
+                allocated=allocated,
+                remaining=remaining,
+            ))
+    return allocations
+
+async def allocate_pending_orders(
+    db: AsyncSession,
+    product_id: int,
+    delivery_date: date,
+    strategy: str = "fifo",
+    commit: bool = False,
+) -> PendingOrderAllocationResult:
+    """
+    Allocates the product's current stock to its whole pending-order backlog in one pass:
+    product, stock, pending orders and payment terms are each read with one query, whatever the
+    backlog size. Orders whose colour code cannot be resolved are listed under `skipped`.
+    Dry run (commit=False) only returns the proposal. Commit mode locks the stock variants,
+    writes every delivery with one create_sales_logs_bulk call and shrinks or removes the
+    pending orders, all in one transaction.
+    """
+    query = select(PendingOrder).where(PendingOrder.product_id == product_id).order_by(PendingOrder.id)
+    if commit:
+        query = query.with_for_update()
+    pending_orders = (await db.execute(query)).scalars().all()
+    product = (await db.execute(select(Product).where(Product.id == product_id))).scalar_one()
+    colour_codes, skipped = resolve_colour_codes(product, pending_orders)
+    if commit:
+        await lock_stock_variants(db, {
+            stock_key(p.product_id, p.color, colour_codes[p.id], size)
+            for p in pending_orders if p.id in colour_codes for size in (p.sizes or {})
+        })
+    stock = {
+        stock_key(row.product_id, row.color, row.colour_code, row.size): row.qty
+        for row in await get_size_stocks_by_product(db, product_id)
+    }
+    priority = await _priority_for(db, strategy, pending_orders)
+    allocations = allocate(stock, pending_orders, priority, colour_codes)
+
+    sales_logs_created = 0
+    if commit and allocations:
+        by_id = {p.id: p for p in pending_orders}
+        async with unit_of_work(db):
+            created = await sales_crud.create_sales_logs_bulk(db, [
+                SalesLogCreate(
+                    product_id=product_id,
+                    color=allocation.color,
+                    colour_code=allocation.colour_code,
+                    sizes=allocation.allocated,
+                    date=delivery_date,
+                    agency_name=allocation.agency_name,
+                    store_name=allocation.store_name,
+                    operation="Sale",
+                    order_number=allocation.order_number,
+                    financial_year=by_id[allocation.pending_order_id].financial_year,
+                )
+                for allocation in allocations
+            ], product_id=product_id)
+            for allocation in allocations:
+                pending_order = by_id[allocation.pending_order_id]
+                if allocation.remaining:
+                    pending_order.sizes = allocation.remaining
+                else:
+                    await db.delete(pending_order)
+            await commit_or_flush(db)
+        sales_logs_created = len(created)
+        logger.info(f"[ALLOCATION] Product {product_id}: delivered {len(allocations)} pending orders ({strategy})")
+
+    return PendingOrderAllocationResult(
+        product_id=product_id,
+        strategy=strategy,
+        committed=commit,
+        allocations=allocations,
+        skipped=skipped,
+        units_allocated=sum(sum(a.allocated.values()) for a in allocations),
+        sales_logs_created=sales_logs_created,
+    )
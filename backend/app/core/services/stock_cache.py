@@ -0,0 +1,107 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from ...config import settings
+
+_MISSING = object()
+DIRTY_PRODUCTS_KEY = "stock_dirty_product_ids"
+
+class StockMatrixCache:
+    """
+    Bounded LRU cache with a TTL for per-product stock reads.
+    Keys are (kind, product_id) tuples so all entries of a product can be dropped together.
+    The cache is per process: other uvicorn workers only see a write once their TTL expires.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict = OrderedDict()
+        self._versions: dict = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def version(self, product_id: int) -> int:
+        """Take before computing a value; pass to set() so a result computed before an invalidation is dropped."""
+        return self._versions.get(product_id, 0)
+
+    def set(self, key: Hashable, value: Any, version: Optional[int] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if version is not None and version != self._versions.get(key[1], 0):
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, product_id: int) -> None:
+        with self._lock:
+            self._versions[product_id] = self._versions.get(product_id, 0) + 1
+            for key in [key for key in self._entries if key[1] == product_id]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+stock_cache = StockMatrixCache(maxsize=settings.STOCK_CACHE_MAXSIZE, ttl=settings.STOCK_CACHE_TTL_SECONDS)
+
+def mark_stock_dirty(db, product_ids: Iterable[Optional[int]]) -> None:
+    """
+    Records products whose stock reads change with the current transaction.
+    Their cache entries are dropped when the transaction commits.
+    """
+    dirty = db.info.setdefault(DIRTY_PRODUCTS_KEY, set())
+    dirty.update(pid for pid in product_ids if pid is not None)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_products(session):
+    for product_id in session.info.pop(DIRTY_PRODUCTS_KEY, ()):
+        stock_cache.invalidate(product_id)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_products(session):
+    session.info.pop(DIRTY_PRODUCTS_KEY, None)
@@ -0,0 +1,79 @@
+import asyncio
+from datetime import datetime
+from typing import Iterable, Optional
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+PENDING_DELTAS_KEY = "stock_pending_deltas"
+
+class StockSubscription:
+    """One listener of the hub. Events for other products are never queued."""
+
+    def __init__(self, product_ids: Optional[Iterable[int]], maxsize: int):
+        self.product_ids = set(product_ids) if product_ids else None
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.loop = asyncio.get_running_loop()
+        self.dropped = 0
+
+    def wants(self, product_id: int) -> bool:
+        return self.product_ids is None or product_id in self.product_ids
+
+    def _put(self, payload: dict) -> None:
+        # A slow client loses its oldest events rather than blocking writers
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(payload)
+
+class StockEventHub:
+    """
+    In-process fan-out of committed size-level stock deltas.
+    Only subscribers connected to the same worker process receive events.
+    """
+
+    def __init__(self, queue_size: int = 256):
+        self.queue_size = queue_size
+        self._subscribers: set = set()
+
+    def subscribe(self, product_ids: Optional[Iterable[int]] = None) -> StockSubscription:
+        subscription = StockSubscription(product_ids, self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: StockSubscription) -> None:
+        self._subscribers.discard(subscription)
+
+    def publish(self, deltas: dict) -> None:
+        """Groups {(product_id, color, colour_code, size): qty} deltas into one event per product."""
+        by_product: dict = {}
+        for (product_id, color, colour_code, size), qty in sorted(deltas.items()):
+            if qty:
+                by_product.setdefault(product_id, []).append(
+                    {"color": color, "colour_code": colour_code, "size": size, "delta": qty}
+                )
+        if not by_product or not self._subscribers:
+            return
+        published_at = datetime.utcnow().isoformat()
+        for product_id, product_deltas in by_product.items():
+            payload = {"product_id": product_id, "deltas": product_deltas, "published_at": published_at}
+            for subscription in list(self._subscribers):
+                if subscription.wants(product_id):
+                    subscription.loop.call_soon_threadsafe(subscription._put, payload)
+
+stock_event_hub = StockEventHub()
+
+def record_stock_deltas(db, deltas: dict) -> None:
+    """Queues deltas on the session; they are published once the transaction commits."""
+    pending = db.info.setdefault(PENDING_DELTAS_KEY, {})
+    for key, qty in deltas.items():
+        pending[key] = pending.get(key, 0) + qty
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed_deltas(session):
+    pending = session.info.pop(PENDING_DELTAS_KEY, None)
+    if pending:
+        stock_event_hub.publish(pending)
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_deltas(session):
+    session.info.pop(PENDING_DELTAS_KEY, None)
@@ -0,0 +1,148 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Optional
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ...database import AsyncSessionLocal
+from ...models.product import Product
+from ...models.product_size_stock import ProductSizeStock
+from ..crud.stock import aggregate_stock_from_logs
+from ..crud.product_color_stock import apply_stock_deltas
+
+logger = logging.getLogger("stock-reconciliation")
+
+async def _product_id_chunks(session_factory, chunk_size: int):
+    """Yields product ids in chunks using keyset pagination, so no more than one chunk is held at a time."""
+    last_id = 0
+    while True:
+        async with session_factory() as db:
+            result = await db.execute(
+                select(Product.id).where(Product.id > last_id).order_by(Product.id).limit(chunk_size)
+            )
+            product_ids = result.scalars().all()
+        if not product_ids:
+            return
+        yield product_ids
+        last_id = product_ids[-1]
+
+async def _read_chunk(db: AsyncSession, product_ids: list[int]) -> tuple[dict, dict]:
+    if db.get_bind().dialect.name == "postgresql":
+        # Read logs and projection from the same snapshot so in-flight writes do not show up as drift
+        await db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    expected = {
+        (row.product_id, row.color, row.colour_code, row.size): row.qty
+        for row in await aggregate_stock_from_logs(db, product_ids=product_ids)
+    }
+    result = await db.execute(
+        select(
+            ProductSizeStock.product_id,
+            ProductSizeStock.color,
+            ProductSizeStock.colour_code,
+            ProductSizeStock.size,
+            ProductSizeStock.qty,
+        ).where(ProductSizeStock.product_id.in_(product_ids))
+    )
+    actual = {(row.product_id, row.color, row.colour_code, row.size): row.qty for row in result}
+    return expected, actual
+
+async def reconcile_product_chunk(session_factory, product_ids: list[int], repair: bool = False) -> list[dict]:
+    """
+    Recomputes stock for a chunk of products from the logs and diffs it against product_size_stocks.
+    With repair=True the difference is applied as a delta, which stays correct even if
+    other writers changed the same rows after the comparison.
+    """
+    async with session_factory() as db:
+        expected, actual = await _read_chunk(db, product_ids)
+        await db.rollback()
+
+    drift = []
+    deltas = {}
+    for key in expected.keys() | actual.keys():
+        expected_qty = expected.get(key, 0)
+        actual_qty = actual.get(key, 0)
+        if expected_qty != actual_qty:
+            product_id, color, colour_code, size = key
+            drift.append({
+                "product_id": product_id,
+                "color": color,
+                "colour_code": colour_code,
+                "size": size,
+                "expected": expected_qty,
+                "actual": actual_qty,
+                "difference": expected_qty - actual_qty,
+            })
+            deltas[key] = expected_qty - actual_qty
+
+    if repair and deltas:
+        async with session_factory() as db:
+            await apply_stock_deltas(db, deltas)
+            await db.commit()
+    return drift
+
+async def reconcile_stock(
+    session_factory=AsyncSessionLocal,
+    chunk_size: int = 200,
+    workers: int = 4,
+    repair: bool = False,
+    max_drift_entries: Optional[int] = 1000,
+) -> dict:
+    """
+    Compares product_size_stocks with the inward/sales log history for every product.
+    Products are processed in chunks of chunk_size by `workers` concurrent workers, each using its
+    own session, so memory stays bounded by the chunk size rather than the number of logs.
+    Returns a drift report; at most max_drift_entries drift rows are kept in it.
+    """
+    started_at = datetime.utcnow()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=workers * 2)
+    report = {
+        "started_at": started_at.isoformat(),
+        "finished_at": None,
+        "repair": repair,
+        "products_checked": 0,
+        "chunks": 0,
+        "drift_count": 0,
+        "drift": [],
+        "errors": [],
+    }
+
+    async def worker():
+        while True:
+            product_ids = await queue.get()
+            try:
+                if product_ids is None:
+                    return
+                try:
+                    drift = await reconcile_product_chunk(session_factory, product_ids, repair=repair)
+                except Exception as e:
+                    logger.error(f"[RECONCILE] Chunk {product_ids[0]}-{product_ids[-1]} failed: {e}")
+                    report["errors"].append({"product_ids": [product_ids[0], product_ids[-1]], "error": str(e)})
+                    continue
+                report["products_checked"] += len(product_ids)
+                report["chunks"] += 1
+                report["drift_count"] += len(drift)
+                if max_drift_entries is None:
+                    report["drift"].extend(drift)
+                else:
+                    report["drift"].extend(drift[:max(0, max_drift_entries - len(report["drift"]))])
+            finally:
+                queue.task_done()
+
+    tasks = [asyncio.create_task(worker()) for _ in range(max(1, workers))]
+    try:
+        async for product_ids in _product_id_chunks(session_factory, chunk_size):
+            await queue.put(product_ids)
+        for _ in tasks:
+            await queue.put(None)
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    report["finished_at"] = datetime.utcnow().isoformat()
+    logger.info(
+        f"[RECONCILE] Checked {report['products_checked']} products in {report['chunks']} chunks, "
+        f"{report['drift_count']} drifted rows{' repaired' if repair else ''}"
+    )
+    return report
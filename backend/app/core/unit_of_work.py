@@ -0,0 +1,78 @@
+import functools
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+UOW_DEPTH_KEY = "unit_of_work_depth"
+
+@asynccontextmanager
+async def unit_of_work(db: AsyncSession):
+    """
+    Groups every write made through `db` into one transaction.
+    CRUD functions called inside only flush (see commit_or_flush); the outermost block
+    commits once on success and rolls back on any exception. Blocks may be nested.
+    """
+    depth = db.info.get(UOW_DEPTH_KEY, 0)
+    db.info[UOW_DEPTH_KEY] = depth + 1
+    try:
+        yield db
+        if depth == 0:
+            await db.commit()
+    except BaseException:
+        if depth == 0:
+            await db.rollback()
+        raise
+    finally:
+        db.info[UOW_DEPTH_KEY] = depth
+
+def in_unit_of_work(db: AsyncSession) -> bool:
+    return db.info.get(UOW_DEPTH_KEY, 0) > 0
+
+async def commit_or_flush(db: AsyncSession) -> None:
+    """Commits, or only flushes when a unit of work owns the transaction."""
+    if in_unit_of_work(db):
+        await db.flush()
+    else:
+        await db.commit()
+
+async def commit_and_reload(db: AsyncSession, objects: list) -> None:
+    """
+    commit_or_flush for CRUD that hands ORM rows back to its caller. When the commit is
+    its own it expires the rows, so they are reloaded with one SELECT per mapped class
+    instead of one refresh each; inside a unit of work this is only a flush.
+    """
+    owns_commit = not in_unit_of_work(db)
+    await commit_or_flush(db)
+    if not owns_commit or not objects:
+        return
+    by_class = {}
+    for obj in objects:
+        by_class.setdefault(type(obj), []).append(obj)
+    for cls, rows in by_class.items():
+        primary_key = inspect(cls).primary_key[0]
+        ids = [inspect(row).identity[0] for row in rows]
+        await db.execute(select(cls).where(primary_key.in_(ids)).execution_options(populate_existing=True))
+
+def transactional(endpoint):
+    """Runs a route handler inside unit_of_work on its `db` session, committing once when it returns."""
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        async with unit_of_work(kwargs["db"]):
+            return await endpoint(*args, **kwargs)
+    return wrapper
+
+class CommitCounter:
+    def __init__(self):
+        self.commits = 0
+
+# Set per request by the commit-count middleware
+commit_counter_var: ContextVar[Optional[CommitCounter]] = ContextVar("commit_counter_var", default=None)
+
+@event.listens_for(Session, "after_commit")
+def _count_commit(session):
+    counter = commit_counter_var.get()
+    if counter is not None:
+        counter.commits += 1
@@ -7,6 +7,8 @@ from .api.v1 import api_router
 from app.database import engine, Base
 from sqlalchemy import text
 from .core.logging_context import current_user_var
+from .core.unit_of_work import CommitCounter, commit_counter_var
+from .utils.responses import ORJSONResponse
 from .api.deps import get_current_user
 from .core.services.audit_logger import setup_audit_logging
 from app.utils.scheduler import start_scheduler
@@ -14,7 +16,7 @@ from fastapi.exceptions import RequestValidationError
 import logging
 from fastapi import HTTPException
 
-app = FastAPI(title="Inventory Management System")
+app = FastAPI(title="Inventory Management System", default_response_class=ORJSONResponse)
 
 # CORS middleware
 app.add_middleware(
@@ -23,6 +25,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Set on capped log listings (see LOG_LISTING_MAX_ROWS)
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.middleware("http")
@@ -63,6 +67,15 @@ async def db_session_middleware(request: Request, call_next):
     response = await call_next(request)
     return response
 
+@app.middleware("http")
+async def commit_count_middleware(request: Request, call_next):
+    # Reports how many transactions the request committed, so extra round trips show up in tests and traces
+    counter = CommitCounter()
+    commit_counter_var.set(counter)
+    response = await call_next(request)
+    response.headers["X-DB-Commit-Count"] = str(counter.commits)
+    return response
+
 # API router
 app.include_router(api_router, prefix="/api/v1")
 
@@ -84,7 +97,7 @@ async def health_check():
             SELECT table_name 
             FROM information_schema.tables 
             WHERE table_schema = 'public' 
-            AND table_name IN ('products', 'inward_logs', 'sales_logs', 'product_color_stocks', 'users', 'customers', 'agencies')
+            AND table_name IN ('products', 'inward_logs', 'sales_logs', 'product_size_stocks', 'users', 'customers', 'agencies')
         """)
         
         async with engine.begin() as connection:
@@ -96,7 +109,7 @@ async def health_check():
             "database": {
                 "connected": db_healthy,
                 "tables": existing_tables,
-                "expected_tables": ["products", "inward_logs", "sales_logs", "product_color_stocks", "users", "customers", "agencies"]
+                "expected_tables": ["products", "inward_logs", "sales_logs", "product_size_stocks", "users", "customers", "agencies"]
             },
             "timestamp": "2025-06-22T09:15:00Z"
         }
@@ -107,7 +120,7 @@ async def health_check():
             "database": {
                 "connected": False,
                 "tables": [],
-                "expected_tables": ["products", "inward_logs", "sales_logs", "product_color_stocks", "users", "customers", "agencies"]
+                "expected_tables": ["products", "inward_logs", "sales_logs", "product_size_stocks", "users", "customers", "agencies"]
             },
             "timestamp": "2025-06-22T09:15:00Z"
         }
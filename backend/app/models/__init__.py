@@ -3,11 +3,14 @@ from .user import User
 from .product import Product
 from .inward import InwardLog
 from .sales import SalesLog
-from .orders import Order
-from .product_color_stock import ProductColorStock
+from .orders import Order, OrderNumberCounter
+from .order_fulfilment import OrderFulfilment
+from .product_size_stock import ProductSizeStock
+from .stock_snapshot import StockSnapshot
 from .audit_log import AuditLog
 from .customer import Customer
 from .agency import Agency
 from .pending_order import PendingOrder
+from .idempotency_key import IdempotencyKey
 
-__all__ = ["Product", "InwardLog", "SalesLog", "Order", "ProductColorStock", "User", "Customer", "Agency", "PendingOrder"]
+__all__ = ["Product", "InwardLog", "SalesLog", "Order", "OrderNumberCounter", "OrderFulfilment", "ProductSizeStock", "StockSnapshot", "User", "Customer", "Agency", "PendingOrder", "IdempotencyKey"]
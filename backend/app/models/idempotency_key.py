@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON, ForeignKey, UniqueConstraint, Index
+from datetime import datetime
+
+from app.models.base import Base
+
+class IdempotencyKey(Base):
+    """Response of a write request, stored under the client's Idempotency-Key until expires_at."""
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'scope', 'key', name='uq_idempotency_key_user_scope'),
+        Index('ix_idempotency_keys_expires_at', 'expires_at'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String, nullable=False)
+    scope = Column(String, nullable=False)  # the endpoint the key was used on
+    user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
+    request_hash = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=False, default=200)
+    response_body = Column(JSON, nullable=True)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, Enum, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, Enum, JSON, Index
 from sqlalchemy.orm import relationship
 from ..database import Base
 import enum
@@ -9,6 +9,9 @@ class InwardCategory(str, enum.Enum):
 
 class InwardLog(Base):
     __tablename__ = "inward_logs"
+    __table_args__ = (
+        Index("ix_inward_logs_product_id_date", "product_id", "date"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+
+from app.models.base import Base
+
+class OrderFulfilment(Base):
+    """
+    Ordered and delivered quantity per size of each order, keyed like the sales logs that
+    deliver it: (product_id, financial_year, order_number), as order numbers restart every
+    financial year. Maintained incrementally by the order and sales CRUD.
+    """
+    __tablename__ = 'order_fulfilment'
+    __table_args__ = (
+        UniqueConstraint('product_id', 'financial_year', 'order_number', 'size', name='uq_order_fulfilment_order_size'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="CASCADE"), nullable=False)
+    financial_year = Column(String, nullable=False)
+    order_number = Column(Integer, nullable=False)
+    size = Column(String, nullable=False)
+    ordered = Column(Integer, nullable=False, server_default='0')
+    delivered = Column(Integer, nullable=False, server_default='0')
+
+    @property
+    def pending(self) -> int:
+        return max(self.ordered - self.delivered, 0)
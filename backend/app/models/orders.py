@@ -1,11 +1,14 @@
 from .base import Base
-from sqlalchemy import Column, Integer, String, Date, JSON, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Date, JSON, ForeignKey, DateTime, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
 class Order(Base):
     __tablename__ = "orders"
-    __table_args__ = (UniqueConstraint('order_number', 'financial_year', name='uq_order_number_finyear'),)
+    __table_args__ = (
+        UniqueConstraint('order_number', 'financial_year', name='uq_order_number_finyear'),
+        Index('ix_orders_product_id_date', 'product_id', 'date'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
     date = Column(Date, nullable=False)
@@ -20,4 +23,10 @@ class Order(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    product = relationship("Product", back_populates="orders") 
\ No newline at end of file
+    product = relationship("Product", back_populates="orders")
+
+class OrderNumberCounter(Base):
+    """Next unused order number of each financial year; advanced atomically by reserve_order_numbers."""
+    __tablename__ = "order_number_counters"
+    financial_year = Column(String, primary_key=True)
+    next_value = Column(Integer, nullable=False)
@@ -1,10 +1,13 @@
 from .base import Base
-from sqlalchemy import Column, Integer, String, Date, JSON, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Date, JSON, ForeignKey, DateTime, UniqueConstraint, Index
 from datetime import datetime
 
 class PendingOrder(Base):
     __tablename__ = "pending_orders"
-    __table_args__ = (UniqueConstraint('order_number', 'financial_year', name='uq_pending_order_number_finyear'),)
+    __table_args__ = (
+        UniqueConstraint('order_number', 'financial_year', name='uq_pending_order_number_finyear'),
+        Index('ix_pending_orders_product_id_date', 'product_id', 'date'),
+    )
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, nullable=False)
     date = Column(Date, nullable=False)
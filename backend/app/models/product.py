@@ -23,4 +23,4 @@ class Product(Base):
     inward_logs = relationship("InwardLog", back_populates="product", cascade="all, delete-orphan")
     sales_logs = relationship("SalesLog", back_populates="product", cascade="all, delete-orphan")
     orders = relationship("Order", back_populates="product", cascade="all, delete-orphan")
-    product_color_stocks = relationship("ProductColorStock", back_populates="product", cascade="all, delete-orphan")
+    product_size_stocks = relationship("ProductSizeStock", back_populates="product", cascade="all, delete-orphan")
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, UniqueConstraint
+from sqlalchemy.orm import relationship
+
+from app.models.base import Base
+
+class ProductSizeStock(Base):
+    __tablename__ = 'product_size_stocks'
+    __table_args__ = (
+        UniqueConstraint('product_id', 'color', 'colour_code', 'size', name='uq_product_size_stock_variant'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="CASCADE"), nullable=False)
+    color = Column(String, nullable=False)
+    # 0 stands in for "no colour code" so the unique key never contains NULL
+    colour_code = Column(Integer, nullable=False, server_default='0')
+    size = Column(String, nullable=False)
+    qty = Column(Integer, nullable=False, server_default='0')
+
+    product = relationship("Product", back_populates="product_size_stocks")
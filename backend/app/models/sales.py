@@ -1,9 +1,13 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, JSON
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, JSON, Index
 from sqlalchemy.orm import relationship
 from ..database import Base
 
 class SalesLog(Base):
     __tablename__ = "sales_logs"
+    __table_args__ = (
+        Index("ix_sales_logs_product_id_date", "product_id", "date"),
+        Index("ix_sales_logs_order_number_product_id", "order_number", "product_id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
@@ -15,5 +19,6 @@ class SalesLog(Base):
     store_name = Column(String, nullable=True)
     operation = Column(String, nullable=False)  # 'Inward' or 'Sale'
     order_number = Column(Integer, nullable=True)
+    financial_year = Column(String, nullable=True)  # of the order delivered; order numbers restart every year
 
     product = relationship("Product", back_populates="sales_logs")
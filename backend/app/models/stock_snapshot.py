@@ -0,0 +1,19 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, UniqueConstraint, Index
+
+from app.models.base import Base
+
+class StockSnapshot(Base):
+    """Closing stock per product variant and size at the end of snapshot_date."""
+    __tablename__ = 'stock_snapshots'
+    __table_args__ = (
+        UniqueConstraint('product_id', 'snapshot_date', 'color', 'colour_code', 'size', name='uq_stock_snapshot_variant_day'),
+        Index('ix_stock_snapshots_snapshot_date', 'snapshot_date'),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey('products.id', ondelete="CASCADE"), nullable=False)
+    snapshot_date = Column(Date, nullable=False)
+    color = Column(String, nullable=False)
+    colour_code = Column(Integer, nullable=False, server_default='0')
+    size = Column(String, nullable=False)
+    qty = Column(Integer, nullable=False)
@@ -4,7 +4,6 @@ from .inward import *
 from .sales import *
 from .orders import *
 from .stock import *
-from .product_color_stock import *
 from .user import *
 from .audit_log import AuditLogCreate, AuditLogOut
 from .customer import *
@@ -23,9 +22,6 @@ __all__ = [
     # Stock schemas
     "StockInfo", "StockData", "StockMatrix",
     
-    # Product Color Stock schemas
-    "ProductColorStockBase", "ProductColorStockCreate", "ProductColorStockOut",
-    
     # User schemas
     "UserBase", "UserCreate", "UserUpdate", "UserOut", "UserLogin", "Token", "TokenData",
     "User",
@@ -1,4 +1,5 @@
 from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
 from datetime import date
 import enum
 
@@ -29,3 +30,9 @@ class InwardLogInDB(InwardLogBase):
 
 class InwardLog(InwardLogInDB):
     pass
+
+class InwardLogPage(BaseModel):
+    """A keyset-paginated page of inward logs"""
+    items: List[InwardLog]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
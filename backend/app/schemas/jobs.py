@@ -0,0 +1,21 @@
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
+from datetime import datetime
+
+class BulkImportJobCreate(BaseModel):
+    kind: Literal["inward", "sales", "orders"]
+    rows: List[Dict[str, Any]]  # InwardLogCreate, SalesLogCreate or OrderCreate fields
+    batch_size: Optional[int] = Field(None, ge=1, le=5000)
+
+class BulkImportJobStatus(BaseModel):
+    id: str
+    kind: str
+    status: Literal["queued", "running", "completed", "failed"]
+    total_rows: int
+    rows_done: int = 0
+    rows_failed: int = 0
+    errors: List[str] = []
+    rows_per_second: Optional[float] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
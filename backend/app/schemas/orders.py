@@ -27,10 +27,13 @@ class OrderInDB(OrderBase):
 
 class OrderResponse(OrderInDB):
     fully_delivered: bool = False
+    delivered_sizes: Dict[str, int] = {}  # from order_fulfilment, fed by the sales logs carrying this order number
+    pending_sizes: Dict[str, int] = {}
 
 class OrderBulkCreate(BaseModel):
     orders: List[OrderCreate]
 
 class OrderBulkResponse(BaseModel):
     rows_processed: int
-    errors: Optional[List[str]] = None 
\ No newline at end of file
+    errors: Optional[List[str]] = None
+    order_numbers: List[int] = []  # assigned order numbers, in payload order 
\ No newline at end of file
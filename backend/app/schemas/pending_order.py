@@ -1,5 +1,5 @@
 from pydantic import BaseModel, ConfigDict
-from typing import Optional, Dict, List
+from typing import Literal, Optional, Dict, List
 from datetime import date
 
 class PendingOrderBase(BaseModel):
@@ -32,4 +32,33 @@ class PendingOrderBulkCreate(BaseModel):
 
 class PendingOrderBulkResponse(BaseModel):
     rows_processed: int
-    errors: Optional[List[str]] = None 
\ No newline at end of file
+    errors: Optional[List[str]] = None 
+
+class PendingOrderAllocationRequest(BaseModel):
+    strategy: Literal["fifo", "days_of_payment"] = "fifo"
+    delivery_date: date
+    commit: bool = False  # False only proposes the deliveries
+
+class PendingOrderAllocation(BaseModel):
+    pending_order_id: int
+    order_number: int
+    color: Optional[str] = None
+    colour_code: Optional[int] = None
+    agency_name: Optional[str] = None
+    store_name: Optional[str] = None
+    allocated: Dict[str, int]
+    remaining: Dict[str, int]
+
+class PendingOrderAllocationSkip(BaseModel):
+    pending_order_id: int
+    order_number: int
+    reason: str
+
+class PendingOrderAllocationResult(BaseModel):
+    product_id: int
+    strategy: str
+    committed: bool
+    allocations: List[PendingOrderAllocation]
+    skipped: List[PendingOrderAllocationSkip] = []
+    units_allocated: int
+    sales_logs_created: int
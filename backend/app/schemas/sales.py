@@ -1,4 +1,5 @@
 from pydantic import BaseModel, ConfigDict
+from typing import List, Optional
 from datetime import date
 
 class SalesLogBase(BaseModel):
@@ -11,6 +12,7 @@ class SalesLogBase(BaseModel):
     store_name: str | None = None
     operation: str  # 'Inward' or 'Sale'
     order_number: int | None = None
+    financial_year: str | None = None  # of the order; resolved from order_number when left out
 
 class SalesLogCreate(SalesLogBase):
     pass
@@ -25,3 +27,9 @@ class SalesLogInDB(SalesLogBase):
 
 class SalesLog(SalesLogInDB):
     pass
+
+class SalesLogPage(BaseModel):
+    """A keyset-paginated page of sales logs"""
+    items: List[SalesLog]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
@@ -1,38 +1,42 @@
-from pydantic import BaseModel, RootModel
-from typing import Dict, Any
-
-class ProductColorStockBase(BaseModel):
-    color: str
-    total_stock: int
-
-class ProductColorStockCreate(ProductColorStockBase):
-    product_id: int
-
-class ProductColorStockUpdate(BaseModel):
-    total_stock: int
-
-class ProductColorStockInDBBase(ProductColorStockBase):
-    id: int
-    product_id: int
-
-    class Config:
-        orm_mode = True
-
-class ProductColorStock(ProductColorStockInDBBase):
-    pass
+from pydantic import BaseModel, RootModel, Field
+from typing import Dict, Any, List, Optional
+from datetime import date
+from .product import ProductOut
+from .inward import InwardLog
+from .sales import SalesLog
 
 class StockMatrix(RootModel[Dict[str, Dict[str, Any]]]):
     """Stock matrix showing stock levels for each color/size combination"""
     pass
 
-class DetailedStockData(RootModel[Dict[str, Dict[str, Any]]]):
+class DetailedStockData(BaseModel):
     """Detailed stock information for a product"""
-    pass
+    product: ProductOut
+    inward_logs: List[InwardLog]
+    sales_logs: List[SalesLog]
 
 class StockMovement(BaseModel):
     """Stock movement information"""
     product_id: int
     color: str
     size: str
-    quantity: int
-    movement_type: str  # "inward" or "sales" 
\ No newline at end of file
+    quantity: int  # signed: negative for returns and sales
+    movement_type: str  # "inward", "return" or "sale"
+    date: date
+    log_id: Optional[int] = None
+    colour_code: Optional[int] = None
+    balance: Optional[int] = None  # running stock of this color/size after the movement
+
+class StockMovementPage(BaseModel):
+    """A page of the stock movement timeline"""
+    items: List[StockMovement]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+class StockBatchRequest(BaseModel):
+    """Selects the products for a batch stock request: explicit ids, or a name/SKU filter"""
+    product_ids: Optional[List[int]] = None
+    name: Optional[str] = None
+    sku: Optional[str] = None
+    skip: int = Field(0, ge=0)
+    limit: int = Field(100, ge=1, le=1000)
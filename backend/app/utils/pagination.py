@@ -0,0 +1,35 @@
+import base64
+import json
+from datetime import date
+from typing import Any, Dict, Tuple
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    """Packs a keyset position into an opaque, URL-safe cursor string."""
+    raw = json.dumps(state, separators=(",", ":"), default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """
+    Unpacks a cursor made by encode_cursor.
+    Raises ValueError on anything that was not produced by encode_cursor.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        state = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(state, dict):
+        raise ValueError("Invalid cursor")
+    return state
+
+def encode_date_id_cursor(row_date: date, row_id: int) -> str:
+    """Cursor for listings ordered by (date, id)."""
+    return encode_cursor({"date": row_date.isoformat(), "id": row_id})
+
+def decode_date_id_cursor(cursor: str) -> Tuple[date, int]:
+    """Raises ValueError for a malformed cursor."""
+    state = decode_cursor(cursor)
+    try:
+        return date.fromisoformat(state["date"]), int(state["id"])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
@@ -0,0 +1,9 @@
+from typing import Any
+import orjson
+from fastapi.responses import JSONResponse
+
+class ORJSONResponse(JSONResponse):
+    """JSONResponse encoded with orjson, which serializes dates, datetimes, enums and dict rows natively."""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
@@ -1,8 +1,11 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date
 from app.config import settings
 from app.database import AsyncSessionLocal
 from app.core.crud.audit_log import delete_old_audit_logs
+from app.core.crud.stock_snapshot import take_stock_snapshot
+from app.core.crud.idempotency_key import delete_expired_idempotency_keys
+from app.core.services.stock_reconciliation import reconcile_stock
 import asyncio
 
 scheduler = AsyncIOScheduler()
@@ -19,4 +22,34 @@ async def auto_delete_old_audit_logs():
             print(f"[Scheduler] Deleted {deleted_count} old audit logs older than {retention_days} days.")
 
 # Schedule the job to run daily at 2:00 AM
-scheduler.add_job(lambda: asyncio.create_task(auto_delete_old_audit_logs()), 'cron', hour=2, minute=0) 
\ No newline at end of file
+scheduler.add_job(lambda: asyncio.create_task(auto_delete_old_audit_logs()), 'cron', hour=2, minute=0)
+
+async def auto_take_stock_snapshot():
+    async with AsyncSessionLocal() as db:
+        snapshot_date = date.today() - timedelta(days=1)
+        written = await take_stock_snapshot(db, snapshot_date)
+        print(f"[Scheduler] Stored {written} closing stock rows for {snapshot_date}.")
+
+# Snapshot yesterday's closing stock daily at 0:30 AM
+scheduler.add_job(lambda: asyncio.create_task(auto_take_stock_snapshot()), 'cron', hour=0, minute=30)
+
+async def auto_reconcile_stock():
+    report = await reconcile_stock(
+        chunk_size=settings.STOCK_RECONCILE_CHUNK_SIZE,
+        workers=settings.STOCK_RECONCILE_WORKERS,
+        repair=settings.STOCK_RECONCILE_REPAIR,
+    )
+    if report["drift_count"]:
+        print(f"[Scheduler] Stock drift in {report['drift_count']} rows (repair={report['repair']}): {report['drift'][:20]}")
+
+# Reconcile the stock projection daily at 3:00 AM
+scheduler.add_job(lambda: asyncio.create_task(auto_reconcile_stock()), 'cron', hour=3, minute=0)
+
+async def auto_delete_expired_idempotency_keys():
+    async with AsyncSessionLocal() as db:
+        deleted_count = await delete_expired_idempotency_keys(db)
+        if deleted_count:
+            print(f"[Scheduler] Deleted {deleted_count} expired idempotency keys.")
+
+# Purge expired idempotency keys every hour
+scheduler.add_job(lambda: asyncio.create_task(auto_delete_expired_idempotency_keys()), 'cron', minute=15)
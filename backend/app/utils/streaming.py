@@ -0,0 +1,17 @@
+from typing import AsyncIterable
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def wants_ndjson(request: Request) -> bool:
+    """True when the client asked for newline-delimited JSON in its Accept header."""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+def ndjson_response(items: AsyncIterable[BaseModel]) -> StreamingResponse:
+    """Streams one JSON document per line as the items are produced, never holding the whole body."""
+    async def lines():
+        async for item in items:
+            yield item.model_dump_json() + "\n"
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Shows the query plans of the API's log filters before and after the indexes of
+migration d4f1a7c3b2e9, on a synthetic dataset.
+
+Everything is created in a scratch schema (PostgreSQL) or a temporary file
+(SQLite) and dropped afterwards; the application tables are never touched.
+
+    python benchmarks/log_index_plans.py --rows 200000
+    python benchmarks/log_index_plans.py --url sqlite+aiosqlite:///./bench.db
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.config import settings
+
+SCHEMA = "bench_log_indexes"
+
+TABLES = [
+    """CREATE TABLE inward_logs (
+        id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL, date DATE NOT NULL,
+        stakeholder_name VARCHAR, sizes JSON NOT NULL)""",
+    """CREATE TABLE sales_logs (
+        id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL, date DATE NOT NULL,
+        agency_name VARCHAR, store_name VARCHAR, order_number INTEGER, sizes JSON NOT NULL)""",
+]
+
+POPULATE = {
+    "postgresql": [
+        """INSERT INTO inward_logs
+           SELECT g, 1 + g % :products, DATE '2023-01-01' + (g % 900), 'Supplier ' || (g % 700), '{"S": 1}'
+           FROM generate_series(1, :rows) g""",
+        """INSERT INTO sales_logs
+           SELECT g, 1 + g % :products, DATE '2023-01-01' + (g % 900), 'Agency ' || (g % 300),
+                  'Store ' || (g % 2000), g % 5000, '{"S": 1}'
+           FROM generate_series(1, :rows) g""",
+    ],
+    "sqlite": [
+        """WITH RECURSIVE g(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM g WHERE n < :rows)
+           INSERT INTO inward_logs
+           SELECT n, 1 + n % :products, date('2023-01-01', '+' || (n % 900) || ' days'), 'Supplier ' || (n % 700), '{"S": 1}'
+           FROM g""",
+        """WITH RECURSIVE g(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM g WHERE n < :rows)
+           INSERT INTO sales_logs
+           SELECT n, 1 + n % :products, date('2023-01-01', '+' || (n % 900) || ' days'), 'Agency ' || (n % 300),
+                  'Store ' || (n % 2000), n % 5000, '{"S": 1}'
+           FROM g""",
+    ],
+}
+
+# Same definitions as the migration
+INDEXES = {
+    "common": [
+        "CREATE INDEX ix_inward_logs_product_id_date ON inward_logs (product_id, date)",
+        "CREATE INDEX ix_sales_logs_product_id_date ON sales_logs (product_id, date)",
+        "CREATE INDEX ix_sales_logs_order_number_product_id ON sales_logs (order_number, product_id)",
+    ],
+    "postgresql": [
+        "CREATE INDEX ix_inward_logs_stakeholder_name_trgm ON inward_logs USING gin (stakeholder_name gin_trgm_ops)",
+        "CREATE INDEX ix_sales_logs_store_name_trgm ON sales_logs USING gin (store_name gin_trgm_ops)",
+        "CREATE INDEX ix_sales_logs_agency_name_trgm ON sales_logs USING gin (agency_name gin_trgm_ops)",
+    ],
+}
+
+# The filters issued by get_*_logs_by_product and the order delivery lookups
+QUERIES = [
+    ("inward by product and date range",
+     "SELECT * FROM inward_logs WHERE product_id = 42 AND date >= '2024-01-01' AND date <= '2024-03-31' ORDER BY date, id"),
+    ("sales by product and date range",
+     "SELECT * FROM sales_logs WHERE product_id = 42 AND date >= '2024-01-01' AND date <= '2024-03-31' ORDER BY date, id"),
+    ("inward stakeholder ilike",
+     "SELECT * FROM inward_logs WHERE lower(stakeholder_name) LIKE '%supplier 123%'"),
+    ("sales store ilike",
+     "SELECT * FROM sales_logs WHERE lower(store_name) LIKE '%store 1234%'"),
+    ("sales delivered for order",
+     "SELECT * FROM sales_logs WHERE order_number = 1234 AND product_id = 235"),
+]
+
+def _postgres_query(sql: str) -> str:
+    # Use ILIKE as the ORM does, so the trigram index can serve it
+    return sql.replace("lower(stakeholder_name) LIKE", "stakeholder_name ILIKE").replace("lower(store_name) LIKE", "store_name ILIKE")
+
+async def explain(conn, dialect: str) -> dict:
+    plans = {}
+    for name, sql in QUERIES:
+        if dialect == "postgresql":
+            result = await conn.execute(text("EXPLAIN (ANALYZE, BUFFERS) " + _postgres_query(sql)))
+            plans[name] = [row[0] for row in result]
+        else:
+            started = time.perf_counter()
+            await conn.execute(text(sql))
+            elapsed = (time.perf_counter() - started) * 1000
+            result = await conn.execute(text("EXPLAIN QUERY PLAN " + sql))
+            plans[name] = [row[-1] for row in result] + [f"elapsed: {elapsed:.2f} ms"]
+    return plans
+
+async def run(url: str, rows: int, products: int) -> None:
+    engine = create_async_engine(url)
+    dialect = engine.dialect.name
+    if dialect not in POPULATE:
+        raise SystemExit(f"Unsupported database: {dialect}")
+    async with engine.connect() as conn:
+        if dialect == "postgresql":
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE"))
+            await conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+            await conn.execute(text(f"SET search_path TO {SCHEMA}, public"))
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        else:
+            for table in ("inward_logs", "sales_logs"):
+                await conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        for ddl in TABLES:
+            await conn.execute(text(ddl))
+        for sql in POPULATE[dialect]:
+            await conn.execute(text(sql), {"rows": rows, "products": products})
+        await conn.execute(text("ANALYZE"))
+        await conn.commit()
+
+        before = await explain(conn, dialect)
+        for ddl in INDEXES["common"] + INDEXES.get(dialect, []):
+            await conn.execute(text(ddl))
+        await conn.execute(text("ANALYZE"))
+        await conn.commit()
+        after = await explain(conn, dialect)
+
+        for name, _ in QUERIES:
+            print(f"=== {name}")
+            print("--- before")
+            print("\n".join(before[name]))
+            print("--- after")
+            print("\n".join(after[name]))
+            print()
+
+        if dialect == "postgresql":
+            await conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+            await conn.commit()
+    await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare log filter query plans without and with the filter indexes.")
+    parser.add_argument('--url', default=settings.DATABASE_URL, help='Async database URL (PostgreSQL or SQLite)')
+    parser.add_argument('--rows', type=int, default=200000, help='Rows per log table')
+    parser.add_argument('--products', type=int, default=500, help='Distinct product ids')
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.rows, args.products))
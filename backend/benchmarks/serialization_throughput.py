@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Compares the serialization paths of a 10k-row inward log listing, end to end
+through the ASGI app (query, conversion, validation and JSON encoding):
+
+  stdlib json       ORM -> schema -> response_model -> jsonable_encoder + json.dumps
+  pydantic          ORM -> schema -> response_model -> pydantic-core JSON bytes
+  orjson            ORM -> schema -> response_model -> ORJSONResponse
+  column tuples     column tuples -> dicts -> ORJSONResponse (no ORM, no Pydantic)
+
+The data lives in a temporary SQLite file that is removed afterwards.
+
+    python benchmarks/serialization_throughput.py --rows 10000 --repeat 10
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from typing import List
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import httpx
+from fastapi import Depends, FastAPI
+from fastapi.responses import JSONResponse
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models.inward import InwardLog as InwardLogModel
+from app.models.product import Product
+from app.core.crud import inward as inward_crud
+from app.schemas.inward import InwardLog
+from app.utils.responses import ORJSONResponse
+
+PRODUCT_ID = 1
+
+def build_app(sessionmaker) -> FastAPI:
+    app = FastAPI()
+
+    async def get_db():
+        async with sessionmaker() as session:
+            yield session
+
+    @app.get("/stdlib", response_model=List[InwardLog], response_class=JSONResponse)
+    async def stdlib_json(db: AsyncSession = Depends(get_db)):
+        return await inward_crud.get_inward_logs_by_product(db, PRODUCT_ID)
+
+    @app.get("/pydantic", response_model=List[InwardLog])
+    async def pydantic_json(db: AsyncSession = Depends(get_db)):
+        return await inward_crud.get_inward_logs_by_product(db, PRODUCT_ID)
+
+    @app.get("/orjson", response_model=List[InwardLog], response_class=ORJSONResponse)
+    async def orjson_json(db: AsyncSession = Depends(get_db)):
+        return await inward_crud.get_inward_logs_by_product(db, PRODUCT_ID)
+
+    @app.get("/rows", response_model=List[InwardLog])
+    async def column_tuples(db: AsyncSession = Depends(get_db)):
+        return ORJSONResponse(await inward_crud.get_inward_log_rows(db, PRODUCT_ID))
+
+    return app
+
+async def populate(sessionmaker, rows: int) -> None:
+    async with sessionmaker() as db:
+        db.add(Product(id=PRODUCT_ID, name="Bench", sku="BENCH-1", unit_price=1.0, sizes=["S", "M", "L", "XL"],
+                       colors=[{"color": "Red", "colour_code": 1}], allowed_stores=[], allowed_agencies=[]))
+        await db.flush()
+        start = date(2023, 1, 1)
+        await db.execute(insert(InwardLogModel), [
+            {
+                "product_id": PRODUCT_ID, "color": "Red", "colour_code": 1,
+                "sizes": {"S": i % 7, "M": i % 5, "L": i % 3, "XL": 1},
+                "date": start + timedelta(days=i % 900), "stakeholder_name": f"Supplier {i % 50}",
+                "operation": "Inward",
+            }
+            for i in range(rows)
+        ])
+        await db.commit()
+
+async def run(rows: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        sessionmaker = async_sessionmaker(engine, expire_on_commit=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await populate(sessionmaker, rows)
+
+        app = build_app(sessionmaker)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+            bodies = {}
+            print(f"{'path':<16}{'ms/response':>14}{'rows/s':>14}{'bytes':>12}")
+            for path in ("/stdlib", "/pydantic", "/orjson", "/rows"):
+                response = await client.get(path)  # warm up
+                bodies[path] = response.json()
+                started = time.perf_counter()
+                for _ in range(repeat):
+                    response = await client.get(path)
+                elapsed = (time.perf_counter() - started) / repeat
+                print(f"{path:<16}{elapsed * 1000:>14.1f}{rows / elapsed:>14,.0f}{len(response.content):>12,}")
+
+            reference = sorted(bodies["/pydantic"], key=lambda log: log["id"])
+            for path, body in bodies.items():
+                assert sorted(body, key=lambda log: log["id"]) == reference, f"{path} returned different data"
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare JSON serialization paths for a large log listing.")
+    parser.add_argument('--rows', type=int, default=10000, help='Inward logs in the listing')
+    parser.add_argument('--repeat', type=int, default=10, help='Requests timed per path')
+    args = parser.parse_args()
+    asyncio.run(run(args.rows, args.repeat))
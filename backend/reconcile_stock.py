@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Recompute stock from inward_logs/sales_logs and compare it with the product_size_stocks projection.
+Prints a JSON drift report; pass --repair to correct the projection.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import argparse
+
+# Add project root to the path to allow imports from 'app'
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '.')))
+
+from app.core.services.stock_reconciliation import reconcile_stock
+from app.config import settings
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile the stock projection against the log history.")
+    parser.add_argument('--chunk-size', type=int, default=settings.STOCK_RECONCILE_CHUNK_SIZE, help='Products per chunk')
+    parser.add_argument('--workers', type=int, default=settings.STOCK_RECONCILE_WORKERS, help='Chunks processed concurrently')
+    parser.add_argument('--repair', action='store_true', help='Apply the differences to product_size_stocks')
+    parser.add_argument('--max-drift-entries', type=int, default=1000, help='Drift rows to include in the report')
+    args = parser.parse_args()
+    report = asyncio.run(reconcile_stock(
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        repair=args.repair,
+        max_drift_entries=args.max_drift_entries,
+    ))
+    print(json.dumps(report, indent=2, default=str))
@@ -20,29 +20,28 @@ import app.models.user
 import app.models.product
 import app.models.inward
 import app.models.sales
-import app.models.product_color_stock
 import app.models.audit_log
 from app.models.user import User
 from app.models.product import Product
 from app.models.inward import InwardLog
 from app.models.sales import SalesLog
-from app.models.product_color_stock import ProductColorStock
 from app.models.audit_log import AuditLog
 
 TEST_DB_PATH = './test.db'
 DATABASE_URL = f"sqlite+aiosqlite:///{TEST_DB_PATH}"
 engine = create_async_engine(DATABASE_URL, echo=True)
 TestingSessionLocal = sessionmaker(
-    autocommit=False, autoflush=False, class_=AsyncSession, bind=engine
+    autocommit=False, autoflush=False, class_=AsyncSession, bind=engine, expire_on_commit=False
 )
 
 @pytest.fixture(scope="session", autouse=True)
 def setup_database():
     # Do not remove the test DB file at the start to avoid PermissionError on Windows
-    # Create all tables
+    # Recreate all tables, so columns added to the models reach the existing test DB file
     import asyncio
     async def create_all():
         async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
             await conn.run_sync(Base.metadata.create_all)
     asyncio.get_event_loop().run_until_complete(create_all())
     yield
@@ -50,8 +49,9 @@ def setup_database():
 
 @pytest_asyncio.fixture(autouse=True)
 async def clean_db_tables():
-    # Clean all tables between tests, skip if table does not exist
+    # Clean all tables between tests; recreate any a previous module dropped
     async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
         for table in reversed(Base.metadata.sorted_tables):
             try:
                 await conn.execute(table.delete())
@@ -1,3 +1,4 @@
+import orjson
 import pytest
 import pytest_asyncio
 import httpx
@@ -9,6 +10,15 @@ from datetime import date
 from app.main import app
 from app.core.crud import product as crud_product
 from app.models.product import Product
+from app.config import settings
+from app.core.crud import inward as inward_crud
+from app.core.crud import sales as sales_crud
+from app.core.crud import product_color_stock as crud_stock
+from app.core.crud import stock as stock_crud
+from app.schemas.inward import InwardLogCreate
+from app.schemas.sales import SalesLogCreate
+from app.utils.responses import ORJSONResponse
+from tests.utils import stock_ledger
 
 @pytest_asyncio.fixture(scope="function", autouse=True)
 async def setup_product(async_client: AsyncClient, auth_token):
@@ -416,4 +426,97 @@ async def test_update_inward_log_colour_code(async_client: AsyncClient, setup_pr
     get_resp = await async_client.get(f"/api/v1/inward/{log_id}", headers=headers, timeout=10)
     assert get_resp.status_code == 200
     log_data = get_resp.json()
-    assert log_data["colour_code"] == 201 
\ No newline at end of file
+    assert log_data["colour_code"] == 201
+
+@pytest.mark.asyncio
+async def test_bulk_inward_applies_summed_deltas(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    entries = [
+        InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 2, "M": 1},
+            date=date.today(), category="Return" if i % 4 == 0 else "Supply", operation="Inward"
+        )
+        for i in range(40)
+    ]
+    created = await inward_crud.create_inward_logs_bulk(db_session, entries)
+    assert len(created) == 40
+    assert len({log.id for log in created}) == 40
+    assert created[0].category == "Return" and created[1].category == "Supply"
+
+    rows = await crud_stock.get_size_stocks_by_product(db_session, product_id)
+    assert stock_ledger(rows) == {("Red", 101, "S"): 40, ("Red", 101, "M"): 20}
+
+@pytest.mark.asyncio
+async def test_bulk_delete_reverses_stock_in_one_transaction(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    await inward_crud.create_inward_logs_bulk(db_session, [
+        InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 5, "M": 1},
+            date=date(2025, 5, day), category="Supply", stakeholder_name="Mill", operation="Inward"
+        )
+        for day in (1, 1, 2)
+    ])
+    await sales_crud.create_sales_logs_bulk(db_session, [
+        SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 2},
+            date=date(2025, 5, 1), agency_name="Agency", store_name=store, operation="Sale"
+        )
+        for store in ("North", "North", "South")
+    ])
+
+    assert await sales_crud.delete_sales_logs_bulk(db_session, product_id, "2025-05-01", "north") == 2
+    assert await inward_crud.delete_inward_logs_bulk(db_session, product_id, "2025-05-01") == 2
+
+    rows = await crud_stock.get_size_stocks_by_product(db_session, product_id)
+    assert stock_ledger(rows) == {("Red", 101, "S"): 3, ("Red", 101, "M"): 1}
+    product = await crud_product.get_product(db_session, product_id)
+    assert await stock_crud.replay_stock_matrix(db_session, product) == await stock_crud.get_stock_matrix_from_projection(db_session, product)
+
+@pytest.mark.asyncio
+async def test_streamed_logs_match_the_listing(db_session: AsyncSession, setup_product, monkeypatch):
+    product_id = setup_product["id"]
+    monkeypatch.setattr(settings, "NDJSON_YIELD_PER", 4)
+    await inward_crud.create_inward_logs_bulk(db_session, [
+        InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"M": i + 1},
+            date=date(2025, 7, 1 + (i * 3) % 10), stakeholder_name="Supplier", operation="Inward"
+        )
+        for i in range(11)
+    ])
+
+    streamed = [log async for log in inward_crud.stream_inward_logs(db_session, product_id, start_date="2025-07-03")]
+    assert streamed == await inward_crud.get_inward_logs_by_product(db_session, product_id, start_date="2025-07-03")
+    assert len([log async for log in inward_crud.stream_inward_logs(db_session)]) == 11
+
+@pytest.mark.asyncio
+async def test_log_rows_serialize_like_the_schemas(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    await inward_crud.create_inward_log(db_session, InwardLogCreate(
+        product_id=product_id, color="Red", colour_code=101, sizes={"S": 4}, date=date(2025, 8, 1), operation="Inward"
+    ))
+    await sales_crud.create_sales_log(db_session, SalesLogCreate(
+        product_id=product_id, color="Red", colour_code=101, sizes={"S": 1}, date=date(2025, 8, 2), store_name="Store", operation="Sale"
+    ))
+
+    inward_rows = await inward_crud.get_inward_log_rows(db_session, product_id)
+    sales_rows = await sales_crud.get_sales_log_rows(db_session, product_id)
+    assert orjson.loads(ORJSONResponse(inward_rows).body) == [
+        log.model_dump(mode="json") for log in await inward_crud.get_inward_logs_by_product(db_session, product_id)
+    ]
+    assert orjson.loads(ORJSONResponse(sales_rows).body) == [
+        log.model_dump(mode="json") for log in await sales_crud.get_sales_logs_by_product(db_session, product_id)
+    ]
+
+@pytest.mark.asyncio
+async def test_bulk_delete_route_is_not_shadowed_by_single_delete(async_client: AsyncClient, auth_token, db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    await inward_crud.create_inward_logs_bulk(db_session, [
+        InwardLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 5}, date=date(2025, 5, day), operation="Inward")
+        for day in (1, 1, 2)
+    ])
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    # Declared before /{product_id}/inward/{inward_log_id}, so "bulk" is never parsed as a log id
+    response = await async_client.delete(f"/api/v1/inward/{product_id}/inward/bulk", params={"date": "2025-05-01"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["deleted_count"] == 2
+    assert stock_ledger(await crud_stock.get_size_stocks_by_product(db_session, product_id)) == {("Red", 101, "S"): 5}
@@ -0,0 +1,109 @@
+import asyncio
+import pytest
+import pytest_asyncio
+from datetime import date
+from types import SimpleNamespace
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.core.crud import inward as inward_crud
+from app.core.crud import sales as sales_crud
+from app.core.crud import product_color_stock as crud_stock
+from app.core.services.bulk_import import BulkImportJobManager
+from app.core.services.idempotency import idempotent
+from app.core.unit_of_work import CommitCounter, commit_counter_var, unit_of_work
+from app.schemas.inward import InwardLogCreate
+from app.schemas.sales import SalesLogCreate
+from tests.utils import stock_ledger
+
+@pytest_asyncio.fixture(scope="function")
+async def setup_product(async_client: AsyncClient, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = await async_client.post(
+        "/api/v1/products/",
+        json={"name": "Test Product for Jobs", "sku": "JB001", "unit_price": 10.0, "sizes": ["S", "M"], "colors": [
+            {"color": "Red", "colour_code": 101},
+            {"color": "Blue", "colour_code": 102}
+        ]},
+        headers=headers,
+        timeout=10
+    )
+    assert response.status_code == 201
+    return response.json()
+
+@pytest.mark.asyncio
+async def test_unit_of_work_commits_log_stock_and_audit_once(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    sale = SalesLogCreate(
+        product_id=product_id, color="Red", colour_code=101, sizes={"S": 2},
+        date=date.today(), agency_name="Agency", store_name="Store", operation="Sale"
+    )
+    counter = CommitCounter()
+    token = commit_counter_var.set(counter)
+    try:
+        async with unit_of_work(db_session):
+            created = await sales_crud.create_sales_log(db_session, sale)
+            await sales_crud.update_sales_log(db_session, created.id, sale.model_copy(update={"sizes": {"S": 3}}))
+        assert counter.commits == 1
+
+        with pytest.raises(RuntimeError):
+            async with unit_of_work(db_session):
+                await sales_crud.create_sales_log(db_session, sale)
+                raise RuntimeError("boom")
+        assert counter.commits == 1
+    finally:
+        commit_counter_var.reset(token)
+
+    rows = await crud_stock.get_size_stocks_by_product(db_session, product_id)
+    assert stock_ledger(rows) == {("Red", 101, "S"): -3}
+
+@pytest.mark.asyncio
+async def test_idempotency_key_replays_the_first_response(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    user = SimpleNamespace(id=1)
+
+    @idempotent("inward_logs")
+    async def bulk_create(inward_logs, idempotency_key=None, db=None, current_user=None):
+        return await inward_crud.create_inward_logs_bulk(db, inward_logs)
+
+    payload = [InwardLogCreate(
+        product_id=product_id, color="Red", colour_code=101, sizes={"S": 5}, date=date(2025, 9, 1), operation="Inward"
+    )]
+    for _ in range(3):
+        async with unit_of_work(db_session):
+            response = await bulk_create(inward_logs=payload, idempotency_key="retry-1", db=db_session, current_user=user)
+        assert jsonable_encoder(response)[0]["sizes"] == {"S": 5}
+
+    rows = await crud_stock.get_size_stocks_by_product(db_session, product_id)
+    assert stock_ledger(rows) == {("Red", 101, "S"): 5}
+
+    with pytest.raises(HTTPException) as exc:
+        async with unit_of_work(db_session):
+            await bulk_create(inward_logs=payload[:0], idempotency_key="retry-1", db=db_session, current_user=user)
+    assert exc.value.status_code == 422
+
+@pytest.mark.asyncio
+async def test_bulk_import_job_writes_in_batches_and_reports_bad_rows(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    manager = BulkImportJobManager(
+        workers=1, batch_size=4, max_jobs=10,
+        sessionmaker=async_sessionmaker(bind=db_session.bind, expire_on_commit=False),
+    )
+    rows = [
+        {"product_id": product_id, "color": "Red", "colour_code": 101, "sizes": {"M": 1}, "date": "2025-10-01", "operation": "Inward"}
+        for _ in range(10)
+    ]
+    rows[5] = {"product_id": product_id, "color": "Red"}
+
+    job = manager.submit("inward", rows, SimpleNamespace(id=1, email="importer@example.com"))
+    for _ in range(200):
+        if job.status in ("completed", "failed"):
+            break
+        await asyncio.sleep(0.01)
+
+    status = job.to_status()
+    assert (status.status, status.rows_done, status.rows_failed) == ("completed", 9, 1)
+    assert status.errors[0].startswith("Row 5:")
+    rows = await crud_stock.get_size_stocks_by_product(db_session, product_id)
+    assert stock_ledger(rows) == {("Red", 101, "M"): 9}
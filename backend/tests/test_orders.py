@@ -1,11 +1,47 @@
+import json
 import pytest
+import pytest_asyncio
 from fastapi.testclient import TestClient
+from httpx import AsyncClient
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.main import app
+from app.config import settings
+from app.models.orders import Order
+from app.models.customer import Customer
+from app.models.agency import Agency
+from app.core.crud import inward as inward_crud
+from app.core.crud import sales as sales_crud
+from app.core.crud import orders as orders_crud
+from app.core.crud import order_fulfilment as fulfilment_crud
+from app.core.crud import pending_order as pending_order_crud
+from app.core.crud import product_color_stock as crud_stock
+from app.core.services import order_allocation
+from app.core.unit_of_work import unit_of_work
+from app.schemas.inward import InwardLogCreate
+from app.schemas.sales import SalesLogCreate, SalesLogUpdate
+from app.schemas.orders import OrderCreate, OrderUpdate
+from tests.utils import stock_ledger
 from datetime import date
 import uuid
 
 client = TestClient(app)
 
+@pytest_asyncio.fixture(scope="function")
+async def setup_product(async_client: AsyncClient, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = await async_client.post(
+        "/api/v1/products/",
+        json={"name": "Test Product for Orders", "sku": "OR001", "unit_price": 10.0, "sizes": ["S", "M"], "colors": [
+            {"color": "Red", "colour_code": 101},
+            {"color": "Blue", "colour_code": 102}
+        ]},
+        headers=headers,
+        timeout=10
+    )
+    assert response.status_code == 201
+    return response.json()
+
 @pytest.fixture(scope="module")
 def test_product():
     # Create a product for testing orders with unique SKU
@@ -139,4 +175,241 @@ def test_update_order_invalid_date(test_product, test_user_token):
     # Try to update with invalid date
     update_payload = {"date": "not-a-date"}
     response = client.put(f"/api/v1/orders/{order_id}", json=update_payload, headers=auth_headers(test_user_token))
-    assert response.status_code == 422 
\ No newline at end of file
+    assert response.status_code == 422
+
+@pytest.mark.asyncio
+async def test_order_numbers_come_from_the_counter(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    db_session.add(Order(product_id=product_id, date=date(2025, 5, 1), order_number=41, financial_year="2025-26", operation="Order"))
+    await db_session.commit()
+
+    first = await orders_crud.create_order(db_session, OrderCreate(product_id=product_id, color="Red", sizes={"S": 1}, date=date(2025, 6, 1)))
+    assert first.order_number == 42
+    bulk = await orders_crud.create_orders_bulk(db_session, [
+        OrderCreate(product_id=product_id, color="Red", sizes={"S": 1}, date=order_date)
+        for order_date in (date(2025, 6, 2), date(2025, 1, 15), date(2025, 6, 3))
+    ])
+    assert [(order.financial_year, order.order_number) for order in bulk] == [("2025-26", 43), ("2024-25", 1), ("2025-26", 44)]
+    assert await orders_crud.reserve_order_numbers(db_session, "2025-26", 10) == 45
+    assert await orders_crud.reserve_order_numbers(db_session, "2025-26") == 55
+
+@pytest.mark.asyncio
+async def test_order_delivery_status_is_computed_for_the_whole_page(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    orders = await orders_crud.create_orders_bulk(db_session, [
+        OrderCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 2, "M": 1}, date=date(2025, 5, 1))
+        for _ in range(3)
+    ])
+    first, second = orders[0].order_number, orders[1].order_number
+    await sales_crud.create_sales_logs_bulk(db_session, [
+        SalesLogCreate(product_id=product_id, color="Red", colour_code=101, sizes=sizes, date=date(2025, 5, 2),
+                       operation="Sale", order_number=number)
+        for number, sizes in ((first, {"S": 2}), (first, {"M": 1}), (second, {"S": 1}))
+    ])
+    # A listing page, as the routes load it
+    orders = (await db_session.scalars(select(Order).where(Order.product_id == product_id).order_by(Order.id))).all()
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", listener)
+    try:
+        responses = await orders_crud.build_order_responses(db_session, orders)
+    finally:
+        event.remove(db_session.bind.sync_engine, "before_cursor_execute", listener)
+
+    assert len(statements) == 1
+    assert [(r.fully_delivered, r.delivered_sizes, r.pending_sizes) for r in responses] == [
+        (True, {"S": 2, "M": 1}, {"S": 0, "M": 0}),
+        (False, {"S": 1}, {"S": 1, "M": 1}),
+        (False, {}, {"S": 2, "M": 1}),
+    ]
+
+@pytest.mark.asyncio
+async def test_streamed_orders_carry_the_same_delivery_status(async_client, auth_token, db_session: AsyncSession, setup_product, monkeypatch):
+    product_id = setup_product["id"]
+    monkeypatch.setattr(settings, "NDJSON_YIELD_PER", 2)
+    orders = await orders_crud.create_orders_bulk(db_session, [
+        OrderCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 2, "M": 1}, date=date(2025, 5, day))
+        for day in (1, 2, 3)
+    ])
+    await sales_crud.create_sales_logs_bulk(db_session, [
+        SalesLogCreate(product_id=product_id, color="Red", colour_code=101, sizes=sizes, date=date(2025, 5, 4),
+                       operation="Sale", order_number=orders[index].order_number)
+        for index, sizes in ((0, {"S": 2, "M": 1}), (1, {"S": 1}))
+    ])
+
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    listed = (await async_client.get("/api/v1/orders/", headers=headers)).json()
+    response = await async_client.get("/api/v1/orders/", headers={**headers, "Accept": "application/x-ndjson"})
+    streamed = [json.loads(line) for line in response.text.splitlines()]
+    assert streamed == listed
+    assert sorted((o["order_number"], o["fully_delivered"], o["delivered_sizes"]) for o in streamed) == [
+        (1, True, {"S": 2, "M": 1}), (2, False, {"S": 1}), (3, False, {}),
+    ]
+
+@pytest.mark.asyncio
+async def test_order_fulfilment_follows_order_and_sales_writes(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    order = await orders_crud.create_order(db_session, OrderCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 3, "M": 2}, date=date(2025, 5, 1)))
+    order_id, order_number = order.id, order.order_number
+    key = (order_number, "2025-26", product_id)
+
+    async def fulfilment():
+        rows = (await fulfilment_crud.get_fulfilment(db_session, [key])).get(key, {})
+        return {size: (row.ordered, row.delivered, row.pending) for size, row in rows.items()}
+
+    sale = SalesLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 1, "M": 2}, date=date(2025, 5, 2),
+                          operation="Sale", order_number=order_number)
+    created = await sales_crud.create_sales_log(db_session, sale)
+    await sales_crud.create_sales_logs_bulk(db_session, [sale.model_copy(update={"sizes": {"S": 1}})])
+    assert await fulfilment() == {"S": (3, 2, 1), "M": (2, 2, 0)}
+
+    await sales_crud.update_sales_log(db_session, created.id, SalesLogUpdate(**sale.model_dump(exclude={"sizes"}), sizes={"S": 2}))
+    assert await fulfilment() == {"S": (3, 3, 0), "M": (2, 0, 2)}
+
+    await orders_crud.update_order(db_session, order_id, OrderUpdate(product_id=product_id, color="Red", sizes={"S": 4}, date=date(2025, 5, 1)))
+    await sales_crud.delete_sales_log(db_session, created.id)
+    assert await fulfilment() == {"S": (4, 1, 3), "M": (0, 0, 0)}
+    assert await orders_crud.get_delivered_totals(db_session, [await orders_crud.get_order(db_session, order_id)]) == {key: {"S": 1}}
+
+    await orders_crud.delete_order(db_session, order_id)
+    await sales_crud.delete_sales_logs_bulk(db_session, product_id)
+    assert await fulfilment() == {"S": (0, 0, 0), "M": (0, 0, 0)}
+
+@pytest.mark.asyncio
+async def test_order_fulfilment_keeps_financial_years_apart(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    # Order #1 exists in both years: numbering restarts in April
+    march, april = await orders_crud.create_orders_bulk(db_session, [
+        OrderCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 2}, date=date(2025, 3, 10)),
+        OrderCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 5}, date=date(2025, 4, 5)),
+    ])
+    assert (march.order_number, april.order_number) == (1, 1)
+    march_key, april_key = fulfilment_crud.order_key(march), fulfilment_crud.order_key(april)
+
+    sale = SalesLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 2}, date=date(2025, 3, 20),
+                          operation="Sale", order_number=1)
+    created = await sales_crud.create_sales_logs_bulk(db_session, [
+        sale,
+        sale.model_copy(update={"sizes": {"S": 1}, "date": date(2025, 4, 20)}),
+        sale.model_copy(update={"sizes": {"S": 1}, "financial_year": "2024-25"}),
+    ])
+    assert [log.financial_year for log in created] == ["2024-25", "2025-26", "2024-25"]
+    fulfilment = await fulfilment_crud.get_fulfilment(db_session, [march_key, april_key])
+    assert {key: (rows["S"].ordered, rows["S"].delivered) for key, rows in fulfilment.items()} == {
+        march_key: (2, 3), april_key: (5, 1),
+    }
+
+    # Moving a sale into the next year moves its delivery to that year's order
+    await sales_crud.update_sales_log(db_session, created[0].id, SalesLogUpdate(**sale.model_dump(exclude={"date"}), date=date(2025, 5, 1)))
+    orders = (await db_session.scalars(select(Order).where(Order.product_id == product_id).order_by(Order.date))).all()
+    responses = await orders_crud.build_order_responses(db_session, orders)
+    assert [(r.financial_year, r.fully_delivered, r.delivered_sizes, r.pending_sizes) for r in responses] == [
+        ("2024-25", False, {"S": 1}, {"S": 1}),
+        ("2025-26", False, {"S": 3}, {"S": 2}),
+    ]
+
+@pytest.mark.asyncio
+async def test_bulk_orders_and_pending_mirrors_are_returned_without_refreshes(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    payload = [
+        OrderCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": index + 1}, date=order_date)
+        for index, order_date in enumerate([date(2025, 6, 1)] * 4 + [date(2025, 2, 1)])
+    ]
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db_session.bind.sync_engine, "before_cursor_execute", listener)
+    try:
+        async with unit_of_work(db_session):
+            orders = await orders_crud.create_orders_bulk(db_session, payload)
+            pending = await pending_order_crud.create_pending_orders_for(db_session, orders)
+            order_rows = [(order.financial_year, order.order_number, order.sizes) for order in orders]
+            pending_rows = [(p.order_number, p.financial_year, p.sizes, p.operation) for p in pending]
+    finally:
+        event.remove(db_session.bind.sync_engine, "before_cursor_execute", listener)
+
+    # Rows come back from INSERT ... RETURNING; nothing is re-read or refreshed per order
+    assert not [statement for statement in statements if statement.lstrip().startswith("SELECT")]
+    assert order_rows == [
+        ("2025-26", 1, {"S": 1}), ("2025-26", 2, {"S": 2}), ("2025-26", 3, {"S": 3}), ("2025-26", 4, {"S": 4}), ("2024-25", 1, {"S": 5}),
+    ]
+    assert pending_rows == [(number, year, sizes, "Order") for year, number, sizes in order_rows]
+    key = (order_rows[3][1], order_rows[3][0], product_id)
+    assert (await fulfilment_crud.get_fulfilment(db_session, [key]))[key]["S"].ordered == 4
+
+@pytest.mark.asyncio
+async def test_all_pending_orders_are_paged_unless_streamed(async_client, auth_token, db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    orders = await orders_crud.create_orders_bulk(db_session, [
+        OrderCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 1}, date=date(2025, 5, day))
+        for day in range(1, 6)
+    ])
+    pending_ids = [p.id for p in await pending_order_crud.create_pending_orders_for(db_session, orders)]
+
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = await async_client.get("/api/v1/pending-orders", params={"skip": 1, "limit": 2}, headers=headers)
+    assert [p["id"] for p in response.json()] == pending_ids[1:3]
+    response = await async_client.get("/api/v1/pending-orders", params={"limit": 1001}, headers=headers)
+    assert response.status_code == 422
+    response = await async_client.get("/api/v1/pending-orders", headers={**headers, "Accept": "application/x-ndjson"})
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == pending_ids
+
+@pytest.mark.asyncio
+async def test_allocation_hands_out_stock_by_priority(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    for store_name, days in (("Slow Store", 90), ("Fast Store", 7)):
+        db_session.add(Customer(store_name=store_name, referrer="x", owner_mobile="1", accounts_mobile="1", days_of_payment=days,
+                                gst_number="g", address="a", pincode="1"))
+    db_session.add(Agency(agency_name="Quick Agency", owner_mobile="1", accounts_mobile="1", days_of_payment=3,
+                          gst_number="g", address="a", pincode="1", region_covered="r"))
+    await inward_crud.create_inward_logs_bulk(db_session, [
+        InwardLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 3, "M": 2}, date=date(2025, 5, 1), operation="Inward", stakeholder_name="Supplier")
+    ])
+    orders = await orders_crud.create_orders_bulk(db_session, [
+        OrderCreate(product_id=product_id, color=color, colour_code=colour_code, sizes=sizes, date=date(2025, 5, day), store_name=store_name, agency_name=agency_name)
+        for color, colour_code, sizes, day, store_name, agency_name in (
+            ("Red", 101, {"S": 2, "M": 1}, 1, "Slow Store", None),
+            # The store's terms win over the agency's
+            ("Red", 101, {"S": 2}, 2, "Fast Store", "Quick Agency"),
+            # Not a customer: falls back to the agency's terms
+            ("Red", 101, {"S": 1}, 3, "Walk-in", "Quick Agency"),
+            # No colour code: takes the one the product defines for Red
+            ("Red", None, {"M": 1}, 4, "Fast Store", None),
+            # No colour code and a colour the product does not have: never matched
+            ("Green", None, {"S": 1}, 5, "Fast Store", None),
+        )
+    ])
+    slow, fast, walk_in, no_code, unknown = (order.order_number for order in orders)
+    await pending_order_crud.create_pending_orders_for(db_session, orders)
+
+    async def pending_sizes():
+        return {p.order_number: p.sizes for p in await pending_order_crud.get_pending_orders(db_session, product_id)}
+
+    before = await pending_sizes()
+    dry_run = await order_allocation.allocate_pending_orders(db_session, product_id, date(2025, 5, 10))
+    assert [(a.order_number, a.colour_code, a.allocated, a.remaining) for a in dry_run.allocations] == [
+        (slow, 101, {"S": 2, "M": 1}, {}), (fast, 101, {"S": 1}, {"S": 1}), (no_code, 101, {"M": 1}, {}),
+    ]
+    assert [(s.order_number, s.reason) for s in dry_run.skipped] == [(unknown, "No colour code and colour Green is not defined on the product")]
+    assert (dry_run.committed, dry_run.units_allocated, dry_run.sales_logs_created) == (False, 5, 0)
+    # A dry run only proposes: stock, pending orders and sales logs are untouched
+    assert stock_ledger(await crud_stock.get_size_stocks_by_product(db_session, product_id)) == {("Red", 101, "S"): 3, ("Red", 101, "M"): 2}
+    assert await pending_sizes() == before
+    assert await sales_crud.get_sales_logs_by_product(db_session, product_id) == []
+
+    result = await order_allocation.allocate_pending_orders(db_session, product_id, date(2025, 5, 10), strategy="days_of_payment", commit=True)
+    assert [(a.order_number, a.allocated, a.remaining) for a in result.allocations] == [
+        (walk_in, {"S": 1}, {}), (fast, {"S": 2}, {}), (no_code, {"M": 1}, {}), (slow, {"M": 1}, {"S": 2}),
+    ]
+    assert (result.committed, result.units_allocated, result.sales_logs_created) == (True, 5, 4)
+    assert stock_ledger(await crud_stock.get_size_stocks_by_product(db_session, product_id)) == {("Red", 101, "S"): 0, ("Red", 101, "M"): 0}
+    assert await pending_sizes() == {slow: {"S": 2}, unknown: {"S": 1}}
+    logs = await sales_crud.get_sales_logs_by_product(db_session, product_id)
+    assert sorted((log.order_number, log.colour_code, log.financial_year) for log in logs) == sorted(
+        (number, 101, "2025-26") for number in (walk_in, fast, no_code, slow)
+    )
+    orders = (await db_session.scalars(select(Order).where(Order.product_id == product_id))).all()
+    assert await orders_crud.get_delivered_totals(db_session, orders) == {
+        (slow, "2025-26", product_id): {"M": 1}, (fast, "2025-26", product_id): {"S": 2},
+        (walk_in, "2025-26", product_id): {"S": 1}, (no_code, "2025-26", product_id): {"M": 1},
+    }
@@ -1,3 +1,5 @@
+import asyncio
+import os
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
@@ -8,13 +10,28 @@ from datetime import date
 from app.main import app
 from app.core.crud import product as crud_product
 from app.models.product import Product
+from fastapi import HTTPException
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.config import settings
+from app.database import Base
+from app.models.inward import InwardLog
+from app.core.crud import inward as inward_crud
+from app.core.crud import sales as sales_crud
+from app.core.crud import product_color_stock as crud_stock
+from app.schemas.inward import InwardLogCreate
+from app.schemas.sales import SalesLogCreate
+from tests.utils import stock_ledger
 
 @pytest_asyncio.fixture(scope="function")
 async def setup_product(async_client: AsyncClient, auth_token):
     headers = {"Authorization": f"Bearer {auth_token}"}
     response = await async_client.post(
-        "/api/products",
-        json={"name": "Test Product for Sales", "sku": "SL001", "unit_price": 10.0, "sizes": ["S", "M"], "colors": ["Red", "Blue"]},
+        "/api/v1/products/",
+        json={"name": "Test Product for Sales", "sku": "SL001", "unit_price": 10.0, "sizes": ["S", "M"], "colors": [
+            {"color": "Red", "colour_code": 101},
+            {"color": "Blue", "colour_code": 102}
+        ]},
         headers=headers,
         timeout=10
     )
@@ -326,4 +343,149 @@ async def test_upload_sales_invalid_product_id(async_client: AsyncClient, auth_t
         "operation": "Sale"
     }
     response = await async_client.post("/api/v1/sales/", json=payload, headers=headers, timeout=10)
-    assert response.status_code == 404 
\ No newline at end of file
+    assert response.status_code == 404
+
+@pytest.mark.asyncio
+async def test_bulk_sales_validate_whole_payload_before_writing(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    sale = dict(
+        product_id=product_id, color="Red", colour_code=101, sizes={"S": 1, "M": 2},
+        date=date.today(), agency_name="Agency", store_name="Store", operation="Sale"
+    )
+    bad_batch = [SalesLogCreate(**sale), SalesLogCreate(**{**sale, "product_id": product_id + 999})]
+    with pytest.raises(HTTPException) as excinfo:
+        await sales_crud.create_sales_logs_bulk(db_session, bad_batch)
+    assert excinfo.value.status_code == 422
+    assert await crud_stock.get_size_stocks_by_product(db_session, product_id) == []
+
+    created = await sales_crud.create_sales_logs_bulk(db_session, [SalesLogCreate(**sale)] * 25)
+    assert len(created) == 25
+    rows = await crud_stock.get_size_stocks_by_product(db_session, product_id)
+    assert stock_ledger(rows) == {("Red", 101, "S"): -25, ("Red", 101, "M"): -50}
+
+async def _sell_concurrently(engine, product_id: int, count: int) -> int:
+    """Fires `count` one-unit sales at Red/101/S, each in its own session, and returns the stock left."""
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async def sell():
+        async with session_factory() as session:
+            await sales_crud.create_sales_log(session, SalesLogCreate(
+                product_id=product_id, color="Red", colour_code=101, sizes={"S": 1},
+                date=date.today(), agency_name="Agency", store_name="Store", operation="Sale"
+            ))
+
+    await asyncio.gather(*(sell() for _ in range(count)))
+    async with session_factory() as session:
+        return stock_ledger(await crud_stock.get_size_stocks_by_product(session, product_id))[("Red", 101, "S")]
+
+@pytest.mark.asyncio
+async def test_concurrent_sales_lose_no_updates(db_session: AsyncSession, setup_product):
+    # Correctness of the UPSERT increment only: SQLite serializes writers itself, so the
+    # STOCK_LOCK_MODE variants are not exercised here (see the PostgreSQL test below)
+    product_id = setup_product["id"]
+    await inward_crud.create_inward_log(db_session, InwardLogCreate(
+        product_id=product_id, color="Red", colour_code=101, sizes={"S": 1000},
+        date=date.today(), category="Supply", operation="Inward"
+    ))
+    # A pool of its own, bound to this test's event loop
+    engine = create_async_engine(db_session.bind.url)
+    try:
+        assert await _sell_concurrently(engine, product_id, 300) == 700
+    finally:
+        await engine.dispose()
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("lock_mode", ["none", "row", "advisory"])
+async def test_concurrent_sales_lose_no_updates_per_lock_mode(monkeypatch, lock_mode):
+    url = os.getenv("TEST_POSTGRES_URL")
+    if not url:
+        pytest.skip("TEST_POSTGRES_URL is not set; lock modes only differ on PostgreSQL")
+    monkeypatch.setattr(settings, "STOCK_LOCK_MODE", lock_mode)
+    engine = create_async_engine(url, pool_size=20, max_overflow=0)
+    try:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        async with async_sessionmaker(bind=engine, expire_on_commit=False)() as session:
+            product = Product(name="Lock Tee", sku=f"LOCK-{lock_mode}-{os.getpid()}", unit_price=10.0, sizes=["S"],
+                              colors=[{"color": "Red", "colour_code": 101}])
+            session.add(product)
+            await session.commit()
+            product_id = product.id
+            await inward_crud.create_inward_log(session, InwardLogCreate(
+                product_id=product_id, color="Red", colour_code=101, sizes={"S": 1000},
+                date=date.today(), category="Supply", operation="Inward"
+            ))
+        try:
+            assert await _sell_concurrently(engine, product_id, 300) == 700
+        finally:
+            async with async_sessionmaker(bind=engine)() as session:
+                await session.execute(delete(SalesLog).where(SalesLog.product_id == product_id))
+                await session.execute(delete(InwardLog).where(InwardLog.product_id == product_id))
+                await session.execute(delete(Product).where(Product.id == product_id))
+                await session.commit()
+    finally:
+        await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_log_pages_follow_date_id_order(db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    await sales_crud.create_sales_logs_bulk(db_session, [
+        SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 1},
+            date=date(2025, 6, 1 + (i * 5) % 7), agency_name="Agency", store_name="Store", operation="Sale"
+        )
+        for i in range(12)
+    ])
+    full = await sales_crud.get_sales_logs_by_product(db_session, product_id)
+    assert [(log.date, log.id) for log in full] == sorted((log.date, log.id) for log in full)
+
+    pages, after = [], None
+    while True:
+        logs, has_more = await sales_crud.get_sales_logs_page(db_session, product_id, 5, after=after)
+        pages.extend(logs)
+        if not has_more:
+            break
+        after = (logs[-1].date, logs[-1].id)
+    assert pages == full
+
+@pytest.mark.asyncio
+async def test_unpaginated_log_listing_is_capped(async_client, auth_token, db_session: AsyncSession, setup_product, monkeypatch):
+    product_id = setup_product["id"]
+    monkeypatch.setattr(settings, "LOG_LISTING_MAX_ROWS", 3)
+    await sales_crud.create_sales_logs_bulk(db_session, [
+        SalesLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 1}, date=date(2025, 6, day), operation="Sale")
+        for day in (1, 2, 3)
+    ])
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = await async_client.get(f"/api/v1/sales/{product_id}", headers=headers)
+    assert response.status_code == 200 and len(response.json()) == 3
+    assert "X-Next-Cursor" not in response.headers
+
+    await sales_crud.create_sales_logs_bulk(db_session, [
+        SalesLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 1}, date=date(2025, 6, day), operation="Sale")
+        for day in (4, 5)
+    ])
+    full = await sales_crud.get_sales_logs_by_product(db_session, product_id)
+    # Over the cap old clients still get a bare list: the first rows, and a cursor for the rest
+    for url in (f"/api/v1/sales/{product_id}", "/api/v1/sales/"):
+        response = await async_client.get(url, headers=headers)
+        assert response.status_code == 200
+        assert [log["id"] for log in response.json()] == [log.id for log in full[:3]]
+        rest = await async_client.get(url, params={"cursor": response.headers["X-Next-Cursor"]}, headers=headers)
+        assert rest.status_code == 200
+        assert [log["id"] for log in rest.json()["items"]] == [log.id for log in full[3:]]
+        assert not rest.json()["has_more"]
+
+@pytest.mark.asyncio
+async def test_bulk_delete_route_is_not_shadowed_by_single_delete(async_client: AsyncClient, auth_token, db_session: AsyncSession, setup_product):
+    product_id = setup_product["id"]
+    await sales_crud.create_sales_logs_bulk(db_session, [
+        SalesLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 1}, date=date(2025, 5, day), store_name="Store", operation="Sale")
+        for day in (1, 1, 2)
+    ])
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    # Declared before /{product_id}/sales/{sales_log_id}, so "bulk" is never parsed as a log id
+    response = await async_client.delete(f"/api/v1/sales/{product_id}/sales/bulk", params={"date": "2025-05-01"}, headers=headers)
+    assert response.status_code == 200
+    assert response.json()["deleted_count"] == 2
+    assert stock_ledger(await crud_stock.get_size_stocks_by_product(db_session, product_id)) == {("Red", 101, "S"): -1}
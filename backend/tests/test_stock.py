@@ -1,6 +1,24 @@
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
+import asyncio
+from datetime import date
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from app.models.product import Product
+from app.models.product_size_stock import ProductSizeStock
+from app.core.crud import inward as inward_crud
+from app.core.crud import sales as sales_crud
+from app.core.crud import product_color_stock as crud_stock
+from app.core.crud import stock as stock_crud
+from app.core.crud import stock_snapshot as snapshot_crud
+from app.core.crud.product import get_product
+from app.core.services.stock_reconciliation import reconcile_stock
+from app.core.services.stock_cache import StockMatrixCache, stock_cache
+from app.core.services.stock_events import stock_event_hub
+from app.schemas.inward import InwardLogCreate, InwardLogUpdate
+from app.schemas.sales import SalesLogCreate
+from tests.utils import stock_ledger
 
 @pytest_asyncio.fixture(scope="function", autouse=True)
 async def setup_product_and_logs(async_client: AsyncClient):
@@ -28,6 +46,21 @@ async def setup_product_and_logs(async_client: AsyncClient):
 
     return product_id
 
+@pytest_asyncio.fixture(scope="function")
+async def setup_product(async_client: AsyncClient, auth_token):
+    headers = {"Authorization": f"Bearer {auth_token}"}
+    response = await async_client.post(
+        "/api/v1/products/",
+        json={"name": "Test Product for Stock", "sku": "ST001", "unit_price": 10.0, "sizes": ["S", "M"], "colors": [
+            {"color": "Red", "colour_code": 101},
+            {"color": "Blue", "colour_code": 102}
+        ]},
+        headers=headers,
+        timeout=10
+    )
+    assert response.status_code == 201
+    return response.json()
+
 @pytest.mark.asyncio
 async def test_get_stock_matrix(async_client: AsyncClient, setup_product_and_logs):
     """Test stock matrix calculation with normal inward and sales logs."""
@@ -110,4 +143,325 @@ async def test_get_stock_matrix_with_returns(async_client: AsyncClient):
     assert matrix["Red"]["M"] == 9  # 10 - 2 + 1
     assert matrix["Blue"]["L"] == 4  # 5 - 1
 
-    return product_id 
\ No newline at end of file
+    return product_id
+
+class TestStockLedger:
+    """Size ledger, projection, snapshot, reconciliation and cache tests, on the product of setup_product."""
+
+    @pytest_asyncio.fixture(scope="function", autouse=True)
+    async def setup_product_and_logs(self):
+        """Replaces the module's logs fixture: these tests write their own logs."""
+        return None
+
+    @pytest.mark.asyncio
+    async def test_inward_and_sales_update_size_ledger(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 10, "M": 5},
+            date=date.today(), category="Supply", operation="Inward"
+        ))
+        await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 2},
+            date=date.today(), category="Return", operation="Inward"
+        ))
+        sale = await sales_crud.create_sales_log(db_session, SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 3, "M": 1},
+            date=date.today(), operation="Sale"
+        ))
+        ledger = stock_ledger(await crud_stock.get_size_stocks_by_product(db_session, product_id))
+        assert ledger == {("Red", 101, "S"): 5, ("Red", 101, "M"): 4}
+
+        await sales_crud.delete_sales_log(db_session, sale.id)
+        ledger = stock_ledger(await crud_stock.get_size_stocks_by_product(db_session, product_id))
+        assert ledger == {("Red", 101, "S"): 8, ("Red", 101, "M"): 5}
+
+    @pytest.mark.asyncio
+    async def test_stock_deltas_collapse_per_size(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        deltas = crud_stock.accumulate_stock_deltas(
+            {}, product_id=product_id, color="Red", colour_code=None, sizes={"S": 4, "M": 0}, sign=1
+        )
+        crud_stock.accumulate_stock_deltas(
+            deltas, product_id=product_id, color="Red", colour_code=None, sizes={"S": 1}, sign=-1
+        )
+        assert deltas == {(product_id, "Red", 0, "S"): 3}
+
+        await crud_stock.apply_stock_deltas(db_session, deltas)
+        await crud_stock.apply_stock_deltas(db_session, deltas)
+        await db_session.commit()
+        ledger = stock_ledger(await crud_stock.get_size_stocks_by_product(db_session, product_id))
+        assert ledger == {("Red", 0, "S"): 6}
+
+    @pytest.mark.asyncio
+    async def test_projection_matrix_matches_replay(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 7, "M": 3},
+            date=date.today(), category="Supply", operation="Inward"
+        ))
+        await sales_crud.create_sales_log(db_session, SalesLogCreate(
+            product_id=product_id, color="Red", sizes={"M": 4}, date=date.today(), operation="Sale"
+        ))
+        product = await get_product(db_session, product_id)
+        projection = await stock_crud.get_stock_matrix_from_projection(db_session, product)
+        assert projection == {"Red": {"S": 7, "M": -1, "total": 6}, "Blue": {"S": 0, "M": 0, "total": 0}}
+        assert projection == await stock_crud.replay_stock_matrix(db_session, product)
+        assert projection == await stock_crud.replay_stock_matrix_in_python(db_session, product)
+
+    @pytest.mark.asyncio
+    async def test_aggregate_stock_from_logs_in_sql(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        for category, sizes in (("Supply", {"S": 10, "M": 6}), ("Return", {"M": 2})):
+            await inward_crud.create_inward_log(db_session, InwardLogCreate(
+                product_id=product_id, color="Red", colour_code=101, sizes=sizes,
+                date=date(2025, 4, 1), category=category, operation="Inward"
+            ))
+        await sales_crud.create_sales_log(db_session, SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 4},
+            date=date(2025, 4, 2), operation="Sale"
+        ))
+        rows = await stock_crud.aggregate_stock_from_logs(db_session, product_ids=[product_id])
+        assert {(row.color, row.colour_code, row.size): row.qty for row in rows} == {
+            ("Red", 101, "S"): 6,
+            ("Red", 101, "M"): 4,
+        }
+        rows = await stock_crud.aggregate_stock_from_logs(db_session, product_ids=[product_id], end_date=date(2025, 4, 1))
+        assert {row.size: row.qty for row in rows} == {"S": 10, "M": 4}
+
+    @pytest.mark.asyncio
+    async def test_batch_matrices_stream_per_product(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        other = Product(
+            name="Ledger Polo", sku="LEDGER-002", unit_price=12.0, sizes=["M"],
+            colors=[{"color": "Blue", "colour_code": 102}]
+        )
+        db_session.add(other)
+        await db_session.commit()
+        await db_session.refresh(other)
+        other_id = other.id
+        await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=other_id, color="Blue", colour_code=102, sizes={"M": 9},
+            date=date.today(), category="Supply", operation="Inward"
+        ))
+        products = await stock_crud.get_products_for_stock_batch(db_session, product_ids=[other_id, product_id])
+        matrices = {
+            product.id: matrix
+            async for product, matrix in stock_crud.iter_stock_matrices_from_projection(db_session, products)
+        }
+        assert matrices == {
+            product_id: {"Red": {"S": 0, "M": 0, "total": 0}, "Blue": {"S": 0, "M": 0, "total": 0}},
+            other_id: {"Blue": {"M": 9, "total": 9}},
+        }
+
+    @pytest.mark.asyncio
+    async def test_stock_as_of_uses_snapshot_and_later_logs(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        for day, sizes in ((1, {"S": 10}), (3, {"S": 5, "M": 2})):
+            await inward_crud.create_inward_log(db_session, InwardLogCreate(
+                product_id=product_id, color="Red", colour_code=101, sizes=sizes,
+                date=date(2025, 3, day), category="Supply", operation="Inward"
+            ))
+        await sales_crud.create_sales_log(db_session, SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 4},
+            date=date(2025, 3, 2), operation="Sale"
+        ))
+        assert await snapshot_crud.take_stock_snapshot(db_session, date(2025, 3, 1)) == 1
+        assert await snapshot_crud.take_stock_snapshot(db_session, date(2025, 3, 2)) == 1
+
+        product = await get_product(db_session, product_id)
+        for day, expected in ((1, {"S": 10, "M": 0}), (2, {"S": 6, "M": 0}), (31, {"S": 11, "M": 2})):
+            as_of = date(2025, 3, day)
+            matrix = await snapshot_crud.get_stock_matrix_as_of(db_session, product, as_of)
+            assert {size: matrix["Red"][size] for size in ("S", "M")} == expected
+            assert matrix == await snapshot_crud.replay_stock_matrix_as_of(db_session, product, as_of)
+
+    @pytest.mark.asyncio
+    async def test_back_dated_logs_rebuild_later_snapshots(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 10},
+            date=date(2025, 3, 1), category="Supply", operation="Inward"
+        ))
+        for day in (1, 2, 3):
+            await snapshot_crud.take_stock_snapshot(db_session, date(2025, 3, day))
+
+        async def as_of(day):
+            product = await get_product(db_session, product_id)
+            matrix = await snapshot_crud.get_stock_matrix_as_of(db_session, product, date(2025, 3, day))
+            assert matrix == await snapshot_crud.replay_stock_matrix_as_of(db_session, product, date(2025, 3, day))
+            return {size: matrix["Red"][size] for size in ("S", "M")}
+
+        assert await as_of(3) == {"S": 10, "M": 0}
+        # Back-dated single and bulk writes reach every snapshot from their date on
+        inward = await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"M": 4},
+            date=date(2025, 3, 2), category="Supply", operation="Inward"
+        ))
+        await sales_crud.create_sales_logs_bulk(db_session, [SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 3}, date=date(2025, 3, 1), operation="Sale"
+        )])
+        assert [await as_of(day) for day in (1, 2, 3)] == [{"S": 7, "M": 0}, {"S": 7, "M": 4}, {"S": 7, "M": 4}]
+
+        await inward_crud.update_inward_log(db_session, inward.id, InwardLogUpdate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"M": 1},
+            date=date(2025, 3, 3), category="Supply", operation="Inward"
+        ))
+        assert [await as_of(day) for day in (2, 3)] == [{"S": 7, "M": 0}, {"S": 7, "M": 1}]
+        await sales_crud.delete_sales_logs_bulk(db_session, product_id)
+        await inward_crud.delete_inward_log(db_session, inward.id)
+        assert [await as_of(day) for day in (1, 3)] == [{"S": 10, "M": 0}, {"S": 10, "M": 0}]
+
+    @pytest.mark.asyncio
+    async def test_reconciliation_reports_and_repairs_drift(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 5, "M": 3},
+            date=date.today(), category="Supply", operation="Inward"
+        ))
+        await db_session.execute(
+            update(ProductSizeStock)
+            .where(ProductSizeStock.product_id == product_id, ProductSizeStock.size == "S")
+            .values(qty=1)
+        )
+        await db_session.commit()
+        session_factory = async_sessionmaker(bind=db_session.bind, expire_on_commit=False)
+
+        report = await reconcile_stock(session_factory, chunk_size=1, workers=2, repair=True)
+        assert report["products_checked"] == 1
+        assert report["drift"] == [{
+            "product_id": product_id, "color": "Red", "colour_code": 101, "size": "S",
+            "expected": 5, "actual": 1, "difference": 4,
+        }]
+
+        report = await reconcile_stock(session_factory, chunk_size=1, workers=2)
+        assert report["drift_count"] == 0
+
+    def test_stock_cache_lru_and_stale_version(self):
+        cache = StockMatrixCache(maxsize=2, ttl=60)
+        cache.set(("matrix", 1), "a")
+        cache.set(("matrix", 2), "b")
+        assert cache.get(("matrix", 1)) == "a"
+        cache.set(("matrix", 3), "c")
+        assert cache.get(("matrix", 2)) is None
+        version = cache.version(1)
+        cache.invalidate(1)
+        cache.set(("matrix", 1), "stale", version=version)
+        assert cache.get(("matrix", 1)) is None
+        assert cache.stats()["evictions"] == 1
+
+    @pytest.mark.asyncio
+    async def test_stock_writes_invalidate_cached_matrix(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        stock_cache.set(("matrix", product_id), {"Red": {"S": 99}})
+        await sales_crud.create_sales_log(db_session, SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 1},
+            date=date.today(), agency_name="Agency", store_name="Store", operation="Sale"
+        ))
+        assert stock_cache.get(("matrix", product_id)) is None
+
+    @pytest.mark.asyncio
+    async def test_bulk_writes_without_quantities_invalidate_cached_listings(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        stock_cache.set(("detailed", product_id), {"inward_logs": []})
+        await inward_crud.create_inward_logs_bulk(db_session, [InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 0}, date=date(2025, 5, 1), operation="Inward"
+        )])
+        assert stock_cache.get(("detailed", product_id)) is None
+
+        await sales_crud.create_sales_logs_bulk(db_session, [SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 0}, date=date(2025, 5, 1), operation="Sale"
+        )])
+        stock_cache.set(("detailed", product_id), {"sales_logs": []})
+        assert await sales_crud.delete_sales_logs_bulk(db_session, product_id) == 1
+        assert stock_cache.get(("detailed", product_id)) is None
+        stock_cache.set(("detailed", product_id), {"inward_logs": []})
+        assert await inward_crud.delete_inward_logs_bulk(db_session, product_id) == 1
+        assert stock_cache.get(("detailed", product_id)) is None
+
+    @pytest.mark.asyncio
+    async def test_committed_deltas_are_published_per_product(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        subscription = stock_event_hub.subscribe([product_id])
+        other = stock_event_hub.subscribe([product_id + 1])
+        try:
+            await inward_crud.create_inward_log(db_session, InwardLogCreate(
+                product_id=product_id, color="Red", colour_code=101, sizes={"S": 4, "M": 0},
+                date=date.today(), category="Supply", operation="Inward"
+            ))
+            await asyncio.sleep(0)
+            event = subscription.queue.get_nowait()
+            assert event["product_id"] == product_id
+            assert event["deltas"] == [{"color": "Red", "colour_code": 101, "size": "S", "delta": 4}]
+            assert other.queue.empty()
+        finally:
+            stock_event_hub.unsubscribe(subscription)
+            stock_event_hub.unsubscribe(other)
+
+    @pytest.mark.asyncio
+    async def test_stock_movements_keyset_pages_match_full_timeline(self, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 10, "M": 2},
+            date=date(2025, 4, 1), category="Supply", operation="Inward"
+        ))
+        await sales_crud.create_sales_log(db_session, SalesLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"S": 3},
+            date=date(2025, 4, 2), agency_name="Agency", store_name="Store", operation="Sale"
+        ))
+        await inward_crud.create_inward_log(db_session, InwardLogCreate(
+            product_id=product_id, color="Red", colour_code=101, sizes={"M": 1},
+            date=date(2025, 4, 2), category="Return", operation="Inward"
+        ))
+
+        full, has_more = await stock_crud.get_stock_movements(db_session, product_id, limit=10)
+        assert not has_more
+        assert [(row.movement_type, row.size, row.qty) for row in full] == [
+            ("inward", "M", 2), ("inward", "S", 10), ("return", "M", -1), ("sale", "S", -3),
+        ]
+
+        pages, after = [], None
+        while True:
+            rows, has_more = await stock_crud.get_stock_movements(db_session, product_id, limit=1, after=after)
+            pages.extend(rows)
+            if not has_more:
+                break
+            after = (rows[-1].date, rows[-1].source, rows[-1].log_id, rows[-1].size)
+        assert pages == full
+
+    @pytest.mark.asyncio
+    async def test_stock_movement_pages_carry_running_balances(self, async_client: AsyncClient, auth_token, db_session: AsyncSession, setup_product):
+        product_id = setup_product["id"]
+        await inward_crud.create_inward_logs_bulk(db_session, [
+            InwardLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 10, "M": 2}, date=date(2025, 4, 1), operation="Inward"),
+            InwardLogCreate(product_id=product_id, color="Blue", colour_code=102, sizes={"S": 4}, date=date(2025, 4, 1), operation="Inward"),
+        ])
+        await sales_crud.create_sales_logs_bulk(db_session, [
+            SalesLogCreate(product_id=product_id, color="Red", colour_code=101, sizes={"S": 3}, date=date(2025, 4, day), operation="Sale")
+            for day in (2, 3)
+        ] + [SalesLogCreate(product_id=product_id, color="Blue", colour_code=102, sizes={"S": 1}, date=date(2025, 4, 4), operation="Sale")])
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        url = f"/api/v1/stock/{product_id}/movements"
+
+        full = (await async_client.get(url, headers=headers)).json()["items"]
+        assert [(m["color"], m["size"], m["balance"]) for m in full] == [
+            ("Red", "M", 2), ("Red", "S", 10), ("Blue", "S", 4), ("Red", "S", 7), ("Red", "S", 4), ("Blue", "S", 3),
+        ]
+        pages, cursor = [], None
+        while True:
+            response = await async_client.get(url, params={"limit": 2, **({"cursor": cursor} if cursor else {})}, headers=headers)
+            assert response.status_code == 200
+            pages.extend(response.json()["items"])
+            cursor = response.json()["next_cursor"]
+            if not cursor:
+                break
+        assert pages == full
+
+        # A cursor only continues the timeline it came from
+        first = (await async_client.get(url, params={"limit": 2}, headers=headers)).json()
+        other = await async_client.post("/api/v1/products/", json={
+            "name": "Other Product", "sku": "ST002", "unit_price": 10.0, "sizes": ["S"], "colors": [{"color": "Red", "colour_code": 101}]
+        }, headers=headers)
+        response = await async_client.get(f"/api/v1/stock/{other.json()['id']}/movements", params={"cursor": first["next_cursor"]}, headers=headers)
+        assert response.status_code == 400
+        response = await async_client.get(f"/api/v1/stock/{product_id + 999}/movements", params={"cursor": first["next_cursor"]}, headers=headers)
+        assert response.status_code == 404
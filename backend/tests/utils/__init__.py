@@ -0,0 +1,3 @@
+def stock_ledger(rows):
+    """ProductSizeStock rows as {(color, colour_code, size): qty}."""
+    return {(row.color, row.colour_code, row.size): row.qty for row in rows}